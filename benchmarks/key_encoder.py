@@ -0,0 +1,64 @@
+"""Time KeyEncoder per keystroke in every terminal mode
+
+Usage: python benchmarks/key_encoder.py [keystrokes]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PyQt6.QtCore import Qt
+
+import herminal
+
+Key = Qt.Key
+Modifier = Qt.KeyboardModifier
+
+# Mostly typing, with the editing and navigation keys of a vim session
+KEYS = [
+    (Key.Key_H, Modifier.NoModifier, 'h'),
+    (Key.Key_E, Modifier.ShiftModifier, 'E'),
+    (Key.Key_Space, Modifier.NoModifier, ' '),
+    (Key.Key_Return, Modifier.NoModifier, '\r'),
+    (Key.Key_Backspace, Modifier.NoModifier, '\x7f'),
+    (Key.Key_Escape, Modifier.NoModifier, '\x1b'),
+    (Key.Key_Up, Modifier.NoModifier, ''),
+    (Key.Key_Right, Modifier.ControlModifier | Modifier.ShiftModifier, ''),
+    (Key.Key_W, Modifier.ControlModifier, '\x17'),
+    (Key.Key_F, Modifier.AltModifier, 'f'),
+    (Key.Key_F5, Modifier.NoModifier, ''),
+    (Key.Key_PageDown, Modifier.ShiftModifier | Modifier.KeypadModifier, ''),
+]
+
+MODES = [
+    ('legacy', False, 0),
+    ('application cursor', True, 0),
+    ('kitty disambiguate', False, 1),
+    ('kitty all keys', False, 9),
+]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    keys = (KEYS * (count // len(KEYS) + 1))[:count]
+    encode = herminal.KeyEncoder.encode
+
+    print(f"{'mode':<22}{'table build':>14}{'per key':>12}{'entries':>10}")
+    for name, app_cursor, kitty in MODES:
+        herminal.KeyEncoder.tables.clear()
+        start = time.perf_counter()
+        encode(*keys[0], app_cursor, kitty)
+        built = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key, modifiers, text in keys:
+            encode(key, modifiers, text, app_cursor, kitty)
+        elapsed = time.perf_counter() - start
+
+        entries = sum(len(table) for table in herminal.KeyEncoder.tables.values())
+        print(f"{name:<22}{built * 1000:>11.2f} ms{elapsed / count * 1e9:>9.0f} ns{entries:>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+"""Compare Qt document mutations per frame: full rebuild vs dirty lines
+
+Usage: python benchmarks/render_mutations.py
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+# A silent child keeps the reader thread from emitting its own frames
+os.environ['SHELL'] = '/bin/cat'
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pyte
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtGui import QTextCursor
+
+import herminal
+
+
+def keystroke_echo():
+    """One character echoed per read, like typing at a prompt"""
+    yield b'user@host:~$ '
+    for char in 'git log --oneline --graph --decorate --all':
+        yield char.encode()
+
+
+def log_flood():
+    """A scrolling log delivered in 1 KiB reads"""
+    data = b''.join(
+        b'2024-01-01 12:00:%02d INFO worker-%d processed request %d\r\n'
+        % (i % 60, i % 8, i) for i in range(2000)
+    )
+    for i in range(0, len(data), 1024):
+        yield data[i:i + 1024]
+
+
+def full_rebuild(term, screen):
+    """The old renderer: clear the document and insert every line"""
+    term.output.clear()
+    text_cursor = term.output.textCursor()
+    text_cursor.movePosition(QTextCursor.MoveOperation.Start)
+    for i, line in enumerate(screen.display):
+        if i > 0:
+            text_cursor.insertText('\n')
+        text_cursor.insertText(line)
+
+
+def dirty_update(term, screen):
+    """The current renderer: replace only the rows pyte marked dirty"""
+    lines = {row: screen.line_runs(row) for row in screen.dirty}
+    screen.dirty.clear()
+    term.update_output(lines, {'x': screen.cursor.x, 'y': screen.cursor.y,
+                               'lines': screen.lines, 'attrs': {}})
+
+
+def run(term, workload, render):
+    screen = herminal.CompactScreen(100, 30)
+    stream = pyte.ByteStream(screen)
+    term.output.clear()
+
+    stats = {'mutations': 0, 'chars': 0}
+
+    def count(position, removed, added):
+        stats['mutations'] += 1
+        stats['chars'] += removed + added
+
+    document = term.output.document()
+    document.contentsChange.connect(count)
+    frames = 0
+    start = time.perf_counter()
+    for chunk in workload():
+        stream.feed(chunk)
+        render(term, screen)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    document.contentsChange.disconnect(count)
+    return frames, stats, elapsed
+
+
+def main():
+    app = QApplication(sys.argv)
+    window = herminal.HerminalWindow()
+    term = window.sessions()[0]
+
+    print(f"{'workload':<16}{'renderer':<14}{'frames':>8}"
+          f"{'mutations/frame':>18}{'chars/frame':>14}{'ms/frame':>10}")
+    for workload in (keystroke_echo, log_flood):
+        for name, render in (('full rebuild', full_rebuild),
+                             ('dirty lines', dirty_update)):
+            frames, stats, elapsed = run(term, workload, render)
+            print(f"{workload.__name__:<16}{name:<14}{frames:>8}"
+                  f"{stats['mutations'] / frames:>18.1f}"
+                  f"{stats['chars'] / frames:>14.1f}"
+                  f"{elapsed * 1000 / frames:>10.3f}")
+
+    term.ptyproc.terminate(force=True)
+    app.quit()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Compare CompactScreen with stock pyte.Screen
+
+Parse throughput counts what the reader does per read: feed the
+stream, then turn the rows it dirtied into runs. Memory is what the
+screen holds once a workload has gone through it, per cell.
+
+Usage: python benchmarks/screen_model.py [--size MB] [--columns N] [--lines N]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pyte
+
+import herminal
+# The synthetic workloads of the full suite
+from terminal_suite import SYNTHETIC
+
+# What PtyLoop reads at most per call
+CHUNK = 65536
+
+
+def pyte_line_runs(line, columns):
+    """Group a pyte buffer line into runs, as CompactScreen.line_runs does"""
+    runs = []
+    text = []
+    current = None
+    for x in range(columns):
+        char = line[x]
+        attrs = char[1:]
+        if attrs != current:
+            if text:
+                runs.append(("".join(text), current))
+                text = []
+            current = attrs
+        text.append(char.data)
+    if text:
+        runs.append(("".join(text), current))
+    return tuple(runs)
+
+
+def pyte_screen(columns, lines):
+    screen = pyte.Screen(columns, lines)
+    return screen, lambda row: pyte_line_runs(screen.buffer[row], screen.columns)
+
+
+def compact_screen(columns, lines):
+    screen = herminal.CompactScreen(columns, lines)
+    return screen, screen.line_runs
+
+
+SCREENS = (('pyte.Screen', pyte_screen), ('CompactScreen', compact_screen))
+
+
+def parse(make_screen, data, columns, lines):
+    """Return MB/s of feeding data and collecting the dirty rows"""
+    screen, line_runs = make_screen(columns, lines)
+    stream = pyte.ByteStream(screen)
+    start = time.perf_counter()
+    for pos in range(0, len(data), CHUNK):
+        stream.feed(data[pos:pos + CHUNK])
+        for row in screen.dirty:
+            line_runs(row)
+        screen.dirty.clear()
+    return len(data) / (time.perf_counter() - start) / 1e6
+
+
+def footprint(make_screen, data, columns, lines):
+    """Return the bytes the screen holds after data went through it"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    screen, _ = make_screen(columns, lines)
+    pyte.ByteStream(screen).feed(data)
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', type=float, default=4, help="MB per workload")
+    parser.add_argument('--columns', type=int, default=120)
+    parser.add_argument('--lines', type=int, default=40)
+    args = parser.parse_args()
+    cells = args.columns * args.lines
+
+    print(f"{'workload':<20}{'screen':<16}{'parse':>12}{'held':>12}{'per cell':>10}")
+    for workload in SYNTHETIC:
+        data = workload(int(args.size * 1e6))
+        for name, make_screen in SCREENS:
+            speed = parse(make_screen, data, args.columns, args.lines)
+            # The last screenfuls are enough to fill every row
+            size = footprint(make_screen, data[-cells * 8:], args.columns, args.lines)
+            print(f"{workload.__name__:<20}{name:<16}{speed:>7.2f} MB/s"
+                  f"{size / 1024:>9.0f} KB{size / cells:>8.0f} B")
+
+
+if __name__ == '__main__':
+    main()
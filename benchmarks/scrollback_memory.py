@@ -0,0 +1,105 @@
+"""Measure the memory cost of 10k scrollback lines
+
+With disk scrollback only the newest tenth of the lines stays in
+memory, and memory should stop growing once lines reach the disk:
+the last line shows the growth per 10k lines well past that point.
+
+Usage: python benchmarks/scrollback_memory.py
+"""
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pyte
+
+import herminal
+
+LINES = 10000
+COLUMNS = 120
+
+
+def plain_log(i):
+    return b'2024-01-01 12:00:%02d INFO worker-%d processed request %d\r\n' % (
+        i % 60, i % 8, i)
+
+
+def colored_log(i):
+    return (b'\x1b[32m2024-01-01 12:00:%02d\x1b[0m \x1b[1;34mINFO\x1b[0m '
+            b'worker-%d processed \x1b[38;5;208mrequest %d\x1b[0m\r\n' % (
+                i % 60, i % 8, i))
+
+
+def measure(make_screen, workload):
+    """Return bytes allocated by the history after scrolling LINES lines"""
+    tracemalloc.start()
+    screen, history = make_screen()
+    stream = pyte.ByteStream(screen)
+    # Fill the screen first so everything after it lands in history
+    stream.feed(b'\r\n' * screen.lines)
+    before = tracemalloc.take_snapshot()
+    for i in range(LINES):
+        stream.feed(workload(i))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    assert history() >= LINES
+    if isinstance(screen, herminal.ScrollbackScreen):
+        screen.scrollback.close()
+    stats = after.compare_to(before, 'filename')
+    return sum(stat.size_diff for stat in stats)
+
+
+def herminal_scrollback():
+    scrollback = herminal.Scrollback(max_lines=10 * LINES)
+    screen = herminal.ScrollbackScreen(scrollback, COLUMNS, 30)
+    return screen, lambda: len(scrollback)
+
+
+def herminal_disk_scrollback():
+    scrollback = herminal.Scrollback(max_lines=LINES // 10)
+    scrollback.set_disk(True)
+    screen = herminal.ScrollbackScreen(scrollback, COLUMNS, 30)
+    return screen, lambda: len(scrollback)
+
+
+def pyte_history():
+    screen = pyte.HistoryScreen(COLUMNS, 30, history=10 * LINES)
+    return screen, lambda: len(screen.history.top)
+
+
+def disk_growth(rounds=5):
+    """Return bytes the disk-backed scrollback grows by per LINES lines"""
+    scrollback = herminal.Scrollback(max_lines=LINES // 10)
+    scrollback.set_disk(True)
+    runs = [((plain_log(i).decode()[:-2], herminal.Scrollback.DEFAULT_ATTRS),)
+            for i in range(LINES)]
+    tracemalloc.start()
+    for line in runs:
+        scrollback.append(line)
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(rounds):
+        for line in runs:
+            scrollback.append(line)
+    growth = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    scrollback.close()
+    return growth / rounds
+
+
+def main():
+    print(f"{'workload':<14}{'store':<28}{'per 10k lines':>16}{'per line':>12}")
+    for workload in (plain_log, colored_log):
+        for name, make_screen in (('herminal.Scrollback', herminal_scrollback),
+                                  ('herminal.Scrollback + disk', herminal_disk_scrollback),
+                                  ('pyte.HistoryScreen', pyte_history)):
+            size = measure(make_screen, workload)
+            print(f"{workload.__name__:<14}{name:<28}"
+                  f"{size / 1024 / 1024:>13.2f} MB{size / LINES:>10.0f} B")
+    
+    size = disk_growth()
+    print(f"\nDisk scrollback past its in-memory lines grows by {size / 1024:.1f} KB per 10k lines")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Time scrollback search with the block index against a full scan
+
+Usage: python benchmarks/search_index.py [lines]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    attrs = herminal.Scrollback.DEFAULT_ATTRS
+    scrollback = herminal.Scrollback(max_lines=count, max_bytes=1 << 40)
+
+    start = time.perf_counter()
+    for i in range(count):
+        scrollback.append(((
+            f'2024-01-01 12:{i // 60 % 60:02d}:{i % 60:02d} INFO worker-{i % 8} '
+            f'processed request {i} in {i % 997} ms', attrs),))
+    elapsed = time.perf_counter() - start
+    print(f"appended {count} lines in {elapsed:.1f} s "
+          f"({elapsed / count * 1e6:.1f} us/line incl. indexing), "
+          f"{len(scrollback.index.blocks)} index blocks")
+
+    queries = [
+        ('request 777777 in', False),
+        ('worker-3 processed request 12347 ', False),
+        ('not in the log', False),
+        (r'request 4242\d+ in 9\d\d ms', True),
+    ]
+    print(f"{'query':<36}{'blocks':>8}{'first hit':>12}{'all hits':>12}{'full scan':>12}")
+    for pattern, regex in queries:
+        matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+        literals = herminal.ScrollbackIndex.literals(pattern, regex)
+
+        # What one "previous match" step costs, searching up from the bottom
+        start = time.perf_counter()
+        ranges = scrollback.index.candidates(literals)
+        next((line for first, end in reversed(ranges)
+              for line in range(end - 1, first - 1, -1)
+              if matcher.search(scrollback.get_text(line))), None)
+        first_hit = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ranges = scrollback.index.candidates(literals)
+        hits = [line for first, end in ranges for line in range(first, end)
+                if matcher.search(scrollback.get_text(line))]
+        indexed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        full = [line for line in range(scrollback.first, scrollback.total)
+                if matcher.search(scrollback.get_text(line))]
+        scanned = time.perf_counter() - start
+
+        assert hits == full, (pattern, hits, full)
+        print(f"{pattern:<36}{len(ranges):>8}{first_hit * 1000:>9.1f} ms"
+              f"{indexed * 1000:>9.1f} ms"
+              f"{scanned * 1000:>9.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
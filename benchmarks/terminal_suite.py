@@ -0,0 +1,396 @@
+"""Throughput and latency of a headless Herminal window
+
+Every workload is written to a real PTY by a small script standing in
+for the shell, so output takes the same path as in daily use: PtyLoop,
+parser, frame handoff and renderer. Reported per workload are MB/s
+(until the PTY reaches EOF, which it only does once everything before
+it was parsed) and painted frames/s. Keystroke-to-paint latency is
+measured by typing into `cat` in cooked mode, once on an idle window
+and once next to a pane flooding output. Background cost is the GUI
+process's CPU time while a pane redraws like `watch`, in view, on an
+inactive tab and in a minimized window.
+
+Usage: python benchmarks/terminal_suite.py [--mode local|worker|host]
+           [--size MB] [--keys N] [--recorded FILE ...]
+           [--json OUT.json] [--compare BASELINE.json]
+
+Recorded workloads are raw terminal output, e.g. from `script -q -O FILE`,
+or asciicast v2 files recorded with Ctrl+Shift+R.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+# Keep the user's settings, cache and session host out of the numbers,
+# worker processes importing this module reuse the directory
+SANDBOX = os.environ.setdefault('HERMINAL_BENCH_DIR', tempfile.mkdtemp(prefix='herminal-bench-'))
+for variable in ('HOME', 'XDG_CACHE_HOME', 'XDG_RUNTIME_DIR'):
+    os.environ[variable] = SANDBOX
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import Qt, QEvent, QEventLoop, QTimer
+from PyQt6.QtGui import QKeyEvent
+
+import herminal
+
+MODES = {
+    'local': {},
+    'worker': {'parse_worker': True},
+    'host': {'session_host': True},
+}
+
+
+def ascii_flood(size):
+    """Plain log lines, like `cat` of a large log file"""
+    lines = []
+    total = 0
+    i = 0
+    while total < size:
+        line = (b'2024-01-01 12:%02d:%02d INFO worker-%d processed request %d in %d ms\r\n'
+                % (i // 60 % 60, i % 60, i % 8, i, i * 7 % 500))
+        lines.append(line)
+        total += len(line)
+        i += 1
+    return b''.join(lines)
+
+
+def sgr_flood(size):
+    """Every word in its own 16, 256 or truecolor style"""
+    rng = random.Random(1)
+    words = [b'build', b'target', b'linking', b'warning', b'src/main.rs', b'ok', b'FAILED', b'42ms']
+    lines = []
+    total = 0
+    while total < size:
+        parts = []
+        for word in rng.choices(words, k=10):
+            style = rng.randrange(3)
+            if style == 0:
+                sgr = b'1;%d' % rng.randrange(30, 38)
+            elif style == 1:
+                sgr = b'38;5;%d;48;5;%d' % (rng.randrange(256), rng.randrange(256))
+            else:
+                sgr = b'38;2;%d;%d;%d' % (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            parts.append(b'\x1b[' + sgr + b'm' + word + b'\x1b[0m')
+        line = b' '.join(parts) + b'\r\n'
+        lines.append(line)
+        total += len(line)
+    return b''.join(lines)
+
+
+def cursor_addressing(size):
+    """Full-screen redraws the way vim or htop do them"""
+    rng = random.Random(2)
+    rows, columns = 30, 100
+    chunks = [b'\x1b[?1049h\x1b[H\x1b[2J']
+    total = 0
+    while total < size:
+        kind = rng.randrange(4)
+        if kind == 0:
+            # Repaint a few lines in place
+            chunk = b''.join(b'\x1b[%d;1H\x1b[K%5d %s' % (
+                row, row, bytes(rng.choices(b'abcdefgh {}();=', k=rng.randrange(20, columns - 8))))
+                for row in rng.sample(range(1, rows), 5))
+        elif kind == 1:
+            # Scroll a region like a window pane
+            top = rng.randrange(1, rows // 2)
+            chunk = (b'\x1b[%d;%dr\x1b[%d;1H\x1bM\x1bM\x1b[%dH\n\n\x1b[r'
+                     % (top, rows - 1, top, rows - 1))
+        elif kind == 2:
+            # Status line in reverse video
+            chunk = b'\x1b[%d;1H\x1b[7m -- INSERT -- %d,%d \x1b[0m\x1b[K' % (
+                rows, rng.randrange(999), rng.randrange(80))
+        else:
+            # Cursor jumps between the edits
+            chunk = b'\x1b[%d;%dH' % (rng.randrange(1, rows), rng.randrange(1, columns))
+        chunks.append(chunk)
+        total += len(chunk)
+    chunks.append(b'\x1b[?1049l')
+    return b''.join(chunks)
+
+
+def utf8_wide(size):
+    """Mixed scripts with wide, combining and emoji characters"""
+    rng = random.Random(3)
+    words = ['日本語のテキスト', '中文字符', '한국어', 'émigré', 'café', 'Ελληνικά',
+             '├──', '│  └─', '🚀', '✅', 'naïve', 'Здравствуйте']
+    lines = []
+    total = 0
+    while total < size:
+        line = (' '.join(rng.choices(words, k=8)) + '\r\n').encode('utf-8')
+        lines.append(line)
+        total += len(line)
+    return b''.join(lines)
+
+
+SYNTHETIC = (ascii_flood, sgr_flood, cursor_addressing, utf8_wide)
+
+
+def load_recording(path):
+    """Output captured from a terminal, raw or as an asciicast v2 file"""
+    if path.endswith('.cast'):
+        _, events = herminal.SessionRecorder.read(path)
+        return b''.join(data for _, kind, data in events if kind == 'o')
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def write_script(name, body):
+    """A stand-in shell the session runs"""
+    path = os.path.join(SANDBOX, name)
+    with open(path, 'w') as f:
+        f.write('#!/bin/sh\n' + body + '\n')
+    os.chmod(path, 0o755)
+    return path
+
+
+def open_window(shell):
+    """A window whose first session runs shell"""
+    os.environ['SHELL'] = shell
+    window = herminal.HerminalWindow()
+    window.resize(1000, 700)
+    window.show()
+    return window
+
+
+def close_window(app, window):
+    """Close a window and end its shells, also those in the session host"""
+    # Closing the window would only detach the host's shells, left
+    # flooding in the background through the rest of the suite
+    for session in window.sessions():
+        window.close_session(session, kill=True)
+    window.close()
+    pump(app, 0.2)
+
+
+def pump(app, seconds):
+    """Process events for a while"""
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+
+
+def count_frames(session):
+    """Count the frames a session paints"""
+    frames = []
+    paint_lines = session.paint_lines
+
+    def counted(lines, cursor_attr, force=False):
+        frames.append(time.perf_counter())
+        return paint_lines(lines, cursor_attr, force)
+    session.paint_lines = counted
+    return frames
+
+
+def throughput(app, name, data):
+    """Time one workload from the first byte until the PTY's EOF"""
+    path = os.path.join(SANDBOX, name + '.out')
+    with open(path, 'wb') as f:
+        f.write(data)
+    # Wait for the go signal so start-up is not timed
+    shell = write_script(name + '.sh', f'read go\nstty -echo\ncat {path}')
+    window = open_window(shell)
+    session = window.sessions()[0]
+    pump(app, 1.0)
+
+    frames = count_frames(session)
+    done = []
+    session.comm.closed_signal.connect(lambda: done.append(time.perf_counter()))
+    start = time.perf_counter()
+    session.write_pty('\r')
+    while not done:
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+    elapsed = done[0] - start
+    painted = sum(1 for t in frames if start <= t <= done[0])
+    close_window(app, window)
+    return {
+        'bytes': len(data),
+        'seconds': round(elapsed, 4),
+        'mb_per_s': round(len(data) / elapsed / 1e6, 4),
+        'frames': painted,
+        'frames_per_s': round(painted / elapsed, 2),
+    }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency(app, keys, flood=None):
+    """Keystroke-to-paint latency typing into cat, optionally next to a flood"""
+    window = open_window(write_script('echo.sh', 'exec cat'))
+    session = window.sessions()[0]
+    if flood is not None:
+        path = os.path.join(SANDBOX, 'flood.out')
+        with open(path, 'wb') as f:
+            f.write(flood)
+        os.environ['SHELL'] = write_script('flood.sh', f'while :; do cat {path}; done')
+        window.split(session, Qt.Orientation.Horizontal)
+    pump(app, 1.0)
+
+    frames = count_frames(session)
+    samples = []
+    for i in range(keys):
+        if i % 50 == 49:
+            # Let cat print the line so the screen keeps moving
+            session.keyPressEvent(QKeyEvent(QEvent.Type.KeyPress, Qt.Key.Key_Return,
+                                            Qt.KeyboardModifier.NoModifier, '\r'))
+            pump(app, 0.05)
+        char = chr(ord('a') + i % 26)
+        seen = len(frames)
+        start = time.perf_counter()
+        session.keyPressEvent(QKeyEvent(QEvent.Type.KeyPress, Qt.Key.Key_A + i % 26,
+                                        Qt.KeyboardModifier.NoModifier, char))
+        deadline = start + 1.0
+        while len(frames) == seen and time.perf_counter() < deadline:
+            app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents)
+        if len(frames) > seen:
+            samples.append((frames[seen] - start) * 1000)
+        # Typing pace, so each echo is painted on its own
+        pump(app, 0.02)
+    close_window(app, window)
+    return {
+        'keys': keys,
+        'painted': len(samples),
+        'p50_ms': round(percentile(samples, 0.50), 3),
+        'p90_ms': round(percentile(samples, 0.90), 3),
+        'p99_ms': round(percentile(samples, 0.99), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def background(app, seconds):
+    """CPU time of a pane redrawing like `watch`, in view and out of sight"""
+    path = os.path.join(SANDBOX, 'watch.out')
+    with open(path, 'wb') as f:
+        f.write(ascii_flood(2000))
+    window = open_window(write_script(
+        'watch.sh', f"while :; do printf '\\033[H'; cat {path}; date; sleep 0.05; done"))
+    session = window.sessions()[0]
+    pump(app, 1.0)
+    frames = count_frames(session)
+
+    def measure():
+        seen = len(frames)
+        start, cpu = time.perf_counter(), time.process_time()
+        pump(app, seconds)
+        elapsed = time.perf_counter() - start
+        return {
+            'cpu_percent': round((time.process_time() - cpu) / elapsed * 100, 2),
+            'frames_per_s': round((len(frames) - seen) / elapsed, 2),
+        }
+
+    results = {'visible': measure()}
+    # The new tab's shell is idle, the watch pane is out of sight
+    os.environ['SHELL'] = write_script('idle.sh', 'exec cat')
+    window.new_tab()
+    results['inactive_tab'] = measure()
+    window.tabs.setCurrentIndex(0)
+    pump(app, 0.5)
+    window.showMinimized()
+    results['minimized'] = measure()
+    seen = len(frames)
+    window.showNormal()
+    pump(app, 0.5)
+    # Restoring paints the screen as it is now
+    results['minimized']['caught_up'] = len(frames) > seen
+    close_window(app, window)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """Print each number next to the baseline's"""
+    print(f"\ncompared with {baseline.get('commit')} ({baseline.get('mode')} mode)")
+    for section in ('throughput', 'latency', 'background'):
+        for name, values in results[section].items():
+            old = baseline.get(section, {}).get(name)
+            if not old:
+                continue
+            for key in ('mb_per_s', 'frames_per_s', 'p50_ms', 'p99_ms', 'cpu_percent'):
+                if key in values and old.get(key):
+                    change = (values[key] / old[key] - 1) * 100
+                    print(f"{name:<22}{key:<14}{old[key]:>10.3f} -> {values[key]:>10.3f}"
+                          f"{change:>+9.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--mode', choices=MODES, default='local')
+    parser.add_argument('--size', type=float, default=1.0, help="MB per synthetic workload")
+    parser.add_argument('--keys', type=int, default=200, help="keystrokes per latency run")
+    parser.add_argument('--idle', type=float, default=5.0, help="seconds per background run")
+    parser.add_argument('--recorded', nargs='*', default=[], help="raw output or .cast recordings")
+    parser.add_argument('--json', help="write the results to this file")
+    parser.add_argument('--compare', help="results file of an earlier run")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    # Waiting for events in pump() wakes up at least this often
+    heartbeat = QTimer()
+    heartbeat.start(10)
+    # Windows pick the mode up from the sandbox's settings file
+    settings = dict(MODES[args.mode], font_family='DejaVu Sans Mono', font_size=11)
+    with open(os.path.join(SANDBOX, '.hudul_terminal_settings.json'), 'w') as f:
+        json.dump(settings, f)
+    size = int(args.size * 1024 * 1024)
+    workloads = [(workload.__name__, workload(size)) for workload in SYNTHETIC]
+    workloads += [(os.path.basename(path), load_recording(path)) for path in args.recorded]
+
+    results = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'mode': args.mode,
+        'python': platform.python_version(),
+        'throughput': {},
+        'latency': {},
+        'background': {},
+    }
+    print(f"{'workload':<22}{'MB':>8}{'MB/s':>10}{'frames/s':>10}")
+    for name, data in workloads:
+        result = throughput(app, name, data)
+        results['throughput'][name] = result
+        print(f"{name:<22}{len(data) / 1e6:>8.2f}{result['mb_per_s']:>10.3f}"
+              f"{result['frames_per_s']:>10.1f}")
+
+    print(f"\n{'latency':<22}{'p50 ms':>8}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, flood in (('idle', None), ('next_to_flood', workloads[0][1])):
+        result = latency(app, args.keys, flood)
+        results['latency'][name] = result
+        print(f"{name:<22}{result['p50_ms']:>8.2f}{result['p90_ms']:>10.2f}"
+              f"{result['p99_ms']:>10.2f}{result['max_ms']:>10.2f}")
+
+    print(f"\n{'background':<22}{'CPU %':>8}{'frames/s':>10}")
+    for name, result in background(app, args.idle).items():
+        results['background'][name] = result
+        print(f"{name:<22}{result['cpu_percent']:>8.1f}{result['frames_per_s']:>10.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+    app.quit()
+    shutil.rmtree(SANDBOX, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,720 @@
 import sys
 import os
+import socket
+import stat
+import struct
+
+
+def runtime_dir():
+    """Private directory for Herminal's sockets, OSError if someone else owns it"""
+    path = os.path.join(os.environ.get('XDG_RUNTIME_DIR') or '/tmp', f'herminal-{os.getuid()}')
+    try:
+        os.mkdir(path, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(path)
+    if (not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid()
+            or info.st_mode & 0o077):
+        raise OSError(f"{path} is not a private directory of this user")
+    return path
+
+
+def server_path():
+    """Unix socket the resident Herminal server listens on"""
+    return os.path.join(runtime_dir(), 'server.sock')
+
+
+def same_user(fd):
+    """Whether the process at the other end of a Unix socket runs as this user"""
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # Only the private directory keeps others out here
+        return True
+    with socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                      struct.calcsize('3i'))
+    return struct.unpack('3i', credentials)[1] == os.getuid()
+
+
+def host_path():
+    """Unix socket the headless session host listens on"""
+    return os.path.join(runtime_dir(), 'host.sock')
+
+
+def open_in_server():
+    """Ask a running server for a new window, False if none is running"""
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(2)
+            client.connect(server_path())
+            if not same_user(client.fileno()):
+                return False
+            client.sendall(b'open ' + os.fsencode(os.getcwd()) + b'\n')
+            return client.recv(16).startswith(b'ok')
+    except OSError:
+        return False
+
+
+# A plain launch first tries the server, before the heavy imports below
+if __name__ == "__main__" and len(sys.argv) == 1 and open_in_server():
+    sys.exit(0)
+
 import threading
+import multiprocessing
+import subprocess
+import selectors
+import queue
+import termios
+import mmap
+import zlib
+import marshal
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import deque, OrderedDict, namedtuple
 import re
 import json
+import csv
+import unicodedata
+import time
 from PyQt6.QtWidgets import (QApplication, QPlainTextEdit, QVBoxLayout, 
                               QWidget, QLabel, QMenu, QMessageBox, QDialog,
                               QFormLayout, QPushButton, QColorDialog, 
-                              QSpinBox, QFontComboBox, QHBoxLayout, QComboBox)
-from PyQt6.QtCore import pyqtSignal, QObject, Qt
+                              QSpinBox, QFontComboBox, QHBoxLayout, QComboBox,
+                              QSizePolicy, QScrollBar, QCheckBox, QLineEdit,
+                              QTabWidget, QSplitter, QInputDialog)
+from PyQt6.QtCore import pyqtSignal, QObject, Qt, QTimer, QRect, QEvent
 from PyQt6.QtGui import (QTextCharFormat, QColor, QTextCursor, QFont, 
-                         QAction)
+                         QAction, QPainter, QPixmap, QFontMetrics, QShortcut,
+                         QKeySequence)
+from PyQt6.QtNetwork import QLocalServer, QLocalSocket
 import pyte
+from wcwidth import wcwidth
 import ptyprocess
 
 
+class Frame(namedtuple('Frame', 'seq lines cursor')):
+    """Immutable snapshot of the rows changed since the GUI's last frame and the cursor"""
+    
+    __slots__ = ()
+
+
+class PerfStats:
+    """Counters behind a session's performance HUD, each thread writes only its own"""
+    
+    FIELDS = ('time', 'read_bytes_per_s', 'parse_ms_per_frame', 'render_ms_per_frame',
+              'frames_per_s', 'coalesced_frames', 'queue_bytes', 'rss_bytes',
+              'scrollback_bytes')
+    HISTORY = 3600
+    
+    def __init__(self):
+        self.bytes_read = 0
+        self.parse_time = 0.0
+        self.published = 0
+        self.render_time = 0.0
+        self.painted = 0
+        self.last = self.totals()
+        self.samples = deque(maxlen=self.HISTORY)
+    
+    def totals(self):
+        """The counters with the time they were read"""
+        return (time.monotonic(), self.bytes_read, self.parse_time, self.published,
+                self.render_time, self.painted)
+    
+    def restart(self):
+        """Measure the next sample's rates from now"""
+        self.last = self.totals()
+    
+    @staticmethod
+    def rss():
+        """Resident memory of this process in bytes"""
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError, IndexError):
+            return 0
+    
+    def sample(self, queue_bytes, scrollback_bytes):
+        """Record and return the rates since the last sample"""
+        totals = self.totals()
+        elapsed, read, parse, published, render, painted = (
+            max(new - old, 0) for new, old in zip(totals, self.last))
+        self.last = totals
+        frames = max(painted, 1)
+        sample = {
+            'time': round(time.time(), 3),
+            'read_bytes_per_s': round(read / max(elapsed, 1e-6)),
+            'parse_ms_per_frame': round(parse * 1000 / frames, 3),
+            'render_ms_per_frame': round(render * 1000 / frames, 3),
+            'frames_per_s': round(painted / max(elapsed, 1e-6), 1),
+            'coalesced_frames': max(published - painted, 0),
+            'queue_bytes': queue_bytes,
+            'rss_bytes': self.rss(),
+            'scrollback_bytes': scrollback_bytes
+        }
+        self.samples.append(sample)
+        return sample
+    
+    def save(self, path):
+        """Write the samples to path.json and path.csv"""
+        with open(path + '.json', 'w') as f:
+            json.dump({'fields': self.FIELDS, 'samples': list(self.samples)}, f, indent=2)
+        with open(path + '.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, self.FIELDS)
+            writer.writeheader()
+            writer.writerows(self.samples)
+
+
 class Communicate(QObject):
-    output_signal = pyqtSignal(str, dict)
+    frame_signal = pyqtSignal()
     status_signal = pyqtSignal(str)
     settings_signal = pyqtSignal()
     info_signal = pyqtSignal()
+    closed_signal = pyqtSignal()
+    trigger_signal = pyqtSignal(str, str, str)
+    keyboard_signal = pyqtSignal(int)
+
+
+class InputQueue:
+    """Keystrokes and pastes on their way to a PTY, written without blocking"""
+    
+    CHUNK = 4096
+    PASTE_START = b'\x1b[200~'
+    PASTE_END = b'\x1b[201~'
+    
+    def __init__(self):
+        # [data, bytes written, cancellable paste]
+        self.items = deque()
+        self.lock = threading.Lock()
+    
+    def __bool__(self):
+        return bool(self.items)
+    
+    @property
+    def pasting(self):
+        """Whether a paste is still being written"""
+        return any(item[2] for item in list(self.items))
+    
+    def key(self, data):
+        """Queue typed input"""
+        with self.lock:
+            self.items.append([data, 0, False])
+    
+    def paste(self, text, bracketed):
+        """Queue pasted text"""
+        # Pasted lines end in Enter like typed ones
+        data = text.replace('\r\n', '\r').replace('\n', '\r').encode('utf-8')
+        if bracketed:
+            # An end marker in the text would turn the rest into typed input
+            data = self.PASTE_START + data.replace(self.PASTE_END, b'') + self.PASTE_END
+        with self.lock:
+            self.items.append([data, 0, True])
+    
+    def cancel_paste(self):
+        """Drop what is left of queued pastes, True if there was any"""
+        cancelled = False
+        with self.lock:
+            for item in list(self.items):
+                data, written, cancellable = item
+                if not cancellable:
+                    continue
+                cancelled = True
+                if not written:
+                    self.items.remove(item)
+                elif data.startswith(self.PASTE_START):
+                    # The program saw the start marker, finish with the end one
+                    end = min(written, len(data) - len(self.PASTE_END))
+                    item[:] = [data[:end] + self.PASTE_END, written, False]
+                else:
+                    item[:] = [data[:written], written, False]
+        return cancelled
+    
+    def write(self, fd):
+        """Write as much as the PTY takes without blocking"""
+        with self.lock:
+            while self.items:
+                item = self.items[0]
+                data, written = item[0], item[1]
+                try:
+                    written += os.write(fd, data[written:written + self.CHUNK])
+                except BlockingIOError:
+                    return
+                except OSError:
+                    # The child is gone, its exit is noticed by the reader
+                    self.items.clear()
+                    return
+                if written < len(data):
+                    item[1] = written
+                else:
+                    self.items.popleft()
+
+
+class KeyEncoder:
+    """Turn key presses into the bytes xterm sends, from a table per mode"""
+    
+    SHIFT, ALT, CTRL, SUPER = 1, 2, 4, 8
+    # Kitty flags the tables implement, the others are not reported
+    KITTY_DISAMBIGUATE = 1
+    KITTY_ALL_KEYS = 8
+    KITTY_FLAGS = KITTY_DISAMBIGUATE | KITTY_ALL_KEYS
+    
+    # Qt modifiers -> modifier bits, Meta is the Super key outside macOS
+    MODIFIER_BITS = (
+        (Qt.KeyboardModifier.ShiftModifier, SHIFT),
+        (Qt.KeyboardModifier.AltModifier, ALT),
+        (Qt.KeyboardModifier.ControlModifier, CTRL),
+        (Qt.KeyboardModifier.MetaModifier, SUPER),
+    )
+    
+    # Cursor keys end in these, SS3 instead of CSI in application mode
+    CURSOR = {
+        Qt.Key.Key_Up: 'A', Qt.Key.Key_Down: 'B', Qt.Key.Key_Right: 'C',
+        Qt.Key.Key_Left: 'D', Qt.Key.Key_Home: 'H', Qt.Key.Key_End: 'F',
+    }
+    # Editing and function keys sent as CSI number ~
+    TILDE = {
+        Qt.Key.Key_Insert: 2, Qt.Key.Key_Delete: 3,
+        Qt.Key.Key_PageUp: 5, Qt.Key.Key_PageDown: 6,
+        Qt.Key.Key_F5: 15, Qt.Key.Key_F6: 17, Qt.Key.Key_F7: 18, Qt.Key.Key_F8: 19,
+        Qt.Key.Key_F9: 20, Qt.Key.Key_F10: 21, Qt.Key.Key_F11: 23, Qt.Key.Key_F12: 24,
+    }
+    # F1-F4 are SS3 P-S, the kitty protocol sends F3 as CSI 13 ~
+    PF = {Qt.Key.Key_F1: 'P', Qt.Key.Key_F2: 'Q', Qt.Key.Key_F3: 'R', Qt.Key.Key_F4: 'S'}
+    # Keys with a C0 code and their kitty key numbers
+    C0 = {
+        Qt.Key.Key_Escape: ('\x1b', 27), Qt.Key.Key_Return: ('\r', 13),
+        Qt.Key.Key_Enter: ('\r', 13), Qt.Key.Key_Tab: ('\t', 9),
+        Qt.Key.Key_Backtab: ('\t', 9), Qt.Key.Key_Backspace: ('\x7f', 127),
+    }
+    # Modifier keys themselves, reported only with KITTY_ALL_KEYS
+    KITTY_MODIFIERS = {
+        Qt.Key.Key_Shift: 57441, Qt.Key.Key_Control: 57442,
+        Qt.Key.Key_Alt: 57443, Qt.Key.Key_Meta: 57444,
+    }
+    # Ctrl with a key that is not a letter, as xterm sends it
+    CTRL_SYMBOLS = {
+        ' ': '\x00', '@': '\x00', '2': '\x00', '[': '\x1b', '3': '\x1b',
+        '\\': '\x1c', '4': '\x1c', ']': '\x1d', '5': '\x1d', '^': '\x1e',
+        '6': '\x1e', '~': '\x1e', '_': '\x1f', '7': '\x1f', '/': '\x1f',
+        '8': '\x7f', '?': '\x7f',
+    }
+    
+    # Mode -> table, Qt modifiers -> modifier bits
+    tables = {}
+    modifiers = {}
+    
+    @classmethod
+    def encode(cls, key, modifiers, text, app_cursor=False, kitty=0):
+        """Bytes for a key press as text, '' for keys that send nothing"""
+        mode = (app_cursor, kitty & cls.KITTY_FLAGS)
+        table = cls.tables.get(mode)
+        if table is None:
+            table = cls.tables[mode] = cls.build(*mode)
+        bits = cls.modifiers.get(modifiers)
+        if bits is None:
+            bits = cls.modifiers[modifiers] = sum(
+                bit for modifier, bit in cls.MODIFIER_BITS if modifiers & modifier)
+        sequence = table.get((key, bits))
+        if sequence is not None:
+            return sequence
+        if text and bits & cls.ALT and not mode[1]:
+            return '\x1b' + text
+        return text
+    
+    @classmethod
+    def build(cls, app_cursor, kitty):
+        """Table of every key and modifier combination in one mode"""
+        table = {}
+        for bits in range(16):
+            # xterm's modifier parameter, left out when nothing is held
+            param = f';{bits + 1}' if bits else ''
+            alt = '\x1b' if bits & cls.ALT else ''
+            
+            for key, final in cls.CURSOR.items():
+                if bits:
+                    table[key, bits] = f'\x1b[1{param}{final}'
+                else:
+                    table[key, bits] = ('\x1bO' if app_cursor else '\x1b[') + final
+            for key, number in cls.TILDE.items():
+                table[key, bits] = f'\x1b[{number}{param}~'
+            for key, final in cls.PF.items():
+                if kitty and final == 'R':
+                    table[key, bits] = f'\x1b[13{param}~'
+                elif bits:
+                    table[key, bits] = f'\x1b[1{param}{final}'
+                else:
+                    table[key, bits] = ('\x1b[' if kitty else '\x1bO') + final
+            
+            for key, (code, number) in cls.C0.items():
+                held = bits | cls.SHIFT if key == Qt.Key.Key_Backtab else bits
+                if kitty & cls.KITTY_ALL_KEYS or (kitty and (held or number == 27)):
+                    held_param = f';{held + 1}' if held else ''
+                    table[key, bits] = f'\x1b[{number}{held_param}u'
+                elif key == Qt.Key.Key_Backtab:
+                    table[key, bits] = alt + '\x1b[Z'
+                elif key == Qt.Key.Key_Backspace and bits & cls.CTRL:
+                    table[key, bits] = alt + '\x08'
+                else:
+                    table[key, bits] = alt + code
+            
+            for key in range(0x20, 0x7f):
+                char = chr(key).lower()
+                if kitty & cls.KITTY_ALL_KEYS or (kitty and bits & ~cls.SHIFT):
+                    table[key, bits] = f'\x1b[{ord(char)}{param}u'
+                elif bits & cls.SUPER or not bits & (cls.CTRL | cls.ALT):
+                    # Plain and shifted keys type their text
+                    continue
+                elif bits & cls.CTRL:
+                    if char.isalpha():
+                        table[key, bits] = alt + chr(ord(char) - 0x60)
+                    elif chr(key) in cls.CTRL_SYMBOLS:
+                        table[key, bits] = alt + cls.CTRL_SYMBOLS[chr(key)]
+                else:
+                    table[key, bits] = alt + (chr(key) if bits & cls.SHIFT else char)
+            
+            if kitty & cls.KITTY_ALL_KEYS:
+                for key, number in cls.KITTY_MODIFIERS.items():
+                    table[key, bits] = f'\x1b[{number}{param}u'
+        return table
+
+
+class PtyLoop:
+    """One reader thread serving the PTYs of every session"""
+    
+    SLICE = 64 * 1024
+    
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.sessions = []
+        self.calls = deque()
+        # Writing to this pipe wakes the loop to run calls and resizes
+        self.wake_r, self.wake_w = os.pipe()
+        os.set_blocking(self.wake_r, False)
+        os.set_blocking(self.wake_w, False)
+        self.selector.register(self.wake_r, selectors.EVENT_READ, None)
+        
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    def wake(self):
+        """Interrupt the select so pending work runs"""
+        try:
+            os.write(self.wake_w, b'\0')
+        except BlockingIOError:
+            # Already full of wakeups
+            pass
+    
+    def call(self, function):
+        """Run function on the loop thread"""
+        self.calls.append(function)
+        self.wake()
+    
+    def add(self, session):
+        """Start serving a session's PTY"""
+        self.call(lambda: self.attach(session))
+    
+    def remove(self, session):
+        """Stop serving a session and close its PTY or host connection"""
+        def close():
+            self.detach(session)
+            if session.worker is not None:
+                session.worker.close()
+            if session.host is not None:
+                session.host.close()
+                return
+            try:
+                session.ptyproc.close(force=True)
+            except Exception:
+                pass
+        self.call(close)
+    
+    def attach(self, session):
+        """Register a session's descriptors, loop thread only"""
+        self.sessions.append(session)
+        session.events = 0
+        if session.host is not None:
+            self.selector.register(session.host.fd, selectors.EVENT_READ,
+                                   (session, session.host_reply))
+            return
+        self.watch(session)
+        if session.worker is not None:
+            self.selector.register(session.worker.fd, selectors.EVENT_READ,
+                                   (session, session.worker_reply))
+    
+    def detach(self, session):
+        """Unregister a session's descriptors, loop thread only"""
+        if session in self.sessions:
+            self.sessions.remove(session)
+            if session.events:
+                self.selector.unregister(session.ptyproc.fd)
+            if session.worker is not None:
+                self.selector.unregister(session.worker.fd)
+            if session.host is not None:
+                self.selector.unregister(session.host.fd)
+    
+    def watch(self, session):
+        """Poll for output only without a backlog, for room only with input queued"""
+        if session.host is not None:
+            # The host reads and writes the PTY
+            return
+        events = selectors.EVENT_READ if session.backlog is None else 0
+        if session.input:
+            events |= selectors.EVENT_WRITE
+        if events != session.events:
+            if not session.events:
+                self.selector.register(session.ptyproc.fd, events,
+                                       (session, session.read_pty))
+            elif not events:
+                self.selector.unregister(session.ptyproc.fd)
+            else:
+                self.selector.modify(session.ptyproc.fd, events,
+                                     (session, session.read_pty))
+            session.events = events
+    
+    def run(self):
+        """Read ready PTYs and parse their output one slice at a time"""
+        while True:
+            busy = any(session.parse_ready for session in self.sessions)
+            for key, events in self.selector.select(0 if busy else None):
+                if key.data is None:
+                    self.handle_wake()
+                    continue
+                session, step = key.data
+                if session in self.sessions and events & selectors.EVENT_WRITE:
+                    self.serve(session, session.write_input)
+                if session in self.sessions and events & selectors.EVENT_READ:
+                    self.serve(session, step)
+            
+            for session in list(self.sessions):
+                if session.parse_ready:
+                    self.serve(session, session.parse_slice)
+    
+    def serve(self, session, step):
+        """Run one step for a session, dropping it if the step fails"""
+        try:
+            if step() is False:
+                self.detach(session)
+                session.comm.closed_signal.emit()
+            elif session in self.sessions:
+                self.watch(session)
+        except Exception as e:
+            self.detach(session)
+            session.comm.status_signal.emit(f"Error: {str(e)}")
+    
+    def handle_wake(self):
+        """Run queued calls and apply resizes the GUI asked for"""
+        try:
+            os.read(self.wake_r, 4096)
+        except BlockingIOError:
+            pass
+        while self.calls:
+            self.calls.popleft()()
+        for session in list(self.sessions):
+            self.serve(session, session.handle_wake)
+
+
+class ParserWorker:
+    """Parse a session's output in a child process"""
+    
+    class History(list):
+        """Collects the rows a ScrollbackScreen pushes into history"""
+        
+        def append(self, runs, wrapped=False):
+            super().append((runs, wrapped))
+    
+    def __init__(self, columns, lines, triggers=None):
+        # fork would copy the Qt state and the other threads' locks
+        context = multiprocessing.get_context('spawn')
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=ParserWorker.run,
+                                       args=(child, columns, lines, triggers), daemon=True)
+        self.process.start()
+        child.close()
+        self.busy = False
+    
+    @property
+    def fd(self):
+        return self.conn.fileno()
+    
+    def feed(self, data):
+        """Send output to parse"""
+        self.conn.send_bytes(b'D' + data)
+        self.busy = True
+    
+    def resize(self, lines, columns):
+        """Resize the child's screen"""
+        self.conn.send_bytes(b'R' + marshal.dumps((lines, columns)))
+        self.busy = True
+    
+    def receive(self):
+        """Return (history rows, changed rows, cursor, commands, parse time) for the last message"""
+        reply = marshal.loads(self.conn.recv_bytes())
+        self.busy = False
+        return reply
+    
+    def close(self):
+        """Stop the child, it exits once the pipe is closed"""
+        self.conn.close()
+        self.process.join(0.5)
+        if self.process.is_alive():
+            self.process.kill()
+    
+    @staticmethod
+    def run(conn, columns, lines, triggers):
+        """Child process loop"""
+        history = ParserWorker.History()
+        screen = ScrollbackScreen(history, columns, lines, Triggers.compile(triggers))
+        stream = TerminalStream(screen)
+        while True:
+            try:
+                message = conn.recv_bytes()
+            except (EOFError, OSError):
+                return
+            start = time.perf_counter()
+            if message[:1] == b'D':
+                stream.feed(message[1:])
+            else:
+                screen.resize(*marshal.loads(message[1:]))
+            
+            changes = {row: screen.line_runs(row)
+                       for row in screen.dirty if row < screen.lines}
+            screen.dirty.clear()
+            cursor = screen.cursor_state()
+            try:
+                conn.send_bytes(marshal.dumps((list(history), changes, cursor, screen.controls,
+                                               time.perf_counter() - start)))
+            except OSError:
+                # The session closed while we were parsing
+                return
+            history.clear()
+            screen.controls.clear()
+
+
+class SessionRecorder:
+    """Write a session's output to an asciicast v2 file from a thread"""
+    
+    def __init__(self, path, columns, lines, shell=None):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+        header = {
+            'version': 2,
+            'width': columns,
+            'height': lines,
+            'timestamp': int(time.time()),
+            'env': {'SHELL': shell or os.environ.get('SHELL', ''), 'TERM': 'xterm-256color'}
+        }
+        self.file.write(json.dumps(header) + '\n')
+        self.start = time.monotonic()
+        self.queue = queue.SimpleQueue()
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+    
+    @staticmethod
+    def default_path():
+        """A new file name in the home directory"""
+        return os.path.expanduser(time.strftime('~/herminal-%Y%m%d-%H%M%S.cast'))
+    
+    def output(self, data):
+        """Queue output read from the PTY"""
+        self.queue.put((time.monotonic() - self.start, 'o', data))
+    
+    def resize(self, columns, lines):
+        """Queue a resize event"""
+        self.queue.put((time.monotonic() - self.start, 'r', f'{columns}x{lines}'))
+    
+    def close(self):
+        """Write what is queued and close the file"""
+        self.queue.put(None)
+        self.thread.join()
+    
+    def run(self):
+        """Write queued events until close()"""
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+            when, kind, data = event
+            if kind == 'o':
+                # Bytes that are not UTF-8 survive a replay as lone surrogates
+                data = data.decode('utf-8', 'surrogateescape')
+            if self.error is None:
+                try:
+                    self.file.write(json.dumps([round(when, 6), kind, data]) + '\n')
+                    # Flush when the queue runs dry, not after every read
+                    if self.queue.empty():
+                        self.file.flush()
+                except OSError as e:
+                    self.error = e
+        try:
+            self.file.close()
+        except OSError as e:
+            self.error = self.error or e
+    
+    @staticmethod
+    def header(f, path):
+        """Parse the header line of an open recording"""
+        try:
+            header = json.loads(f.readline())
+        except ValueError:
+            header = None
+        if not isinstance(header, dict) or header.get('version') != 2:
+            raise ValueError(f"{path} is not an asciicast v2 recording")
+        return header
+    
+    @staticmethod
+    def read_header(path):
+        """Return a recording's header, for its screen size"""
+        with open(path, encoding='utf-8') as f:
+            return SessionRecorder.header(f, path)
+    
+    @staticmethod
+    def read(path):
+        """Return a recording's header and an iterator of its (time, kind, data) events"""
+        f = open(path, encoding='utf-8')
+        try:
+            header = SessionRecorder.header(f, path)
+        except ValueError:
+            f.close()
+            raise
+        
+        def events():
+            with f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    when, kind, data = json.loads(line)
+                    if kind == 'o':
+                        data = data.encode('utf-8', 'surrogateescape')
+                    yield when, kind, data
+        return header, events()
+    
+    @staticmethod
+    def play(path, speed=1.0):
+        """Write a recording's output to stdout at speed, 0 for as fast as possible"""
+        _, events = SessionRecorder.read(path)
+        fd = sys.stdout.fileno()
+        if os.isatty(fd):
+            # No newline translation or echo, the emulator gets the recorded
+            # bytes and nothing else. Ctrl+C still stops the replay.
+            attrs = termios.tcgetattr(fd)
+            attrs[1] &= ~termios.OPOST
+            attrs[3] &= ~(termios.ECHO | termios.ICANON)
+            termios.tcsetattr(fd, termios.TCSANOW, attrs)
+        start = time.monotonic()
+        for when, kind, data in events:
+            if kind != 'o':
+                continue
+            if speed:
+                delay = start + when / speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        try:
+            while os.read(sys.stdin.fileno(), 1024):
+                pass
+        except OSError:
+            pass
 
 
 class ANSIParser:
@@ -44,519 +740,3998 @@ class ANSIParser:
         '97': QColor(255, 255, 255),    # Bright White
     }
     
+    # pyte color names for the 16 standard colors
+    PYTE_COLORS = {
+        'black': '30', 'red': '31', 'green': '32', 'brown': '33',
+        'blue': '34', 'magenta': '35', 'cyan': '36', 'white': '37',
+        'brightblack': '90', 'brightred': '91', 'brightgreen': '92',
+        'brightbrown': '93', 'brightblue': '94', 'brightmagenta': '95',
+        'brightcyan': '96', 'brightwhite': '97',
+    }
+    
+    # pyte color value -> QColor, shared by every frame
+    _color_cache = {}
+    # Colors cached before the cache starts over, true colors could
+    # otherwise fill it with 16 million entries
+    COLOR_CACHE_LIMIT = 4096
+    
     @staticmethod
     def parse_color(code):
         """Convert ANSI color code to QColor"""
         return ANSIParser.ANSI_COLORS.get(code, QColor(220, 200, 255))
+    
+    @staticmethod
+    def pyte_color(name):
+        """Convert a pyte color (name or 'rrggbb') to QColor, None for default"""
+        color = ANSIParser._color_cache.get(name)
+        if color is None and name not in ANSIParser._color_cache:
+            if name in ANSIParser.PYTE_COLORS:
+                color = ANSIParser.parse_color(ANSIParser.PYTE_COLORS[name])
+            elif name != 'default':
+                # 256-color and truecolor cells carry a hex string
+                color = QColor('#' + name)
+                if not color.isValid():
+                    color = None
+            if len(ANSIParser._color_cache) >= ANSIParser.COLOR_CACHE_LIMIT:
+                ANSIParser._color_cache.clear()
+            ANSIParser._color_cache[name] = color
+        return color
+    
+    @staticmethod
+    def resolve(attrs, default_fg, default_bg):
+        """Return (foreground, background or None) for a run's attributes"""
+        fg = ANSIParser.pyte_color(attrs[0]) or default_fg
+        bg = ANSIParser.pyte_color(attrs[1])
+        if attrs[6]:  # Reverse video
+            fg, bg = bg or default_bg, fg
+        return fg, bg
+    
+    @staticmethod
+    def highlight(runs, start, end):
+        """Return runs with reverse video toggled on text[start:end]"""
+        result = []
+        pos = 0
+        for text, attrs in runs:
+            run_end = pos + len(text)
+            if run_end <= start or pos >= end:
+                result.append((text, attrs))
+            else:
+                flipped = attrs[:6] + (not attrs[6],) + attrs[7:]
+                cut_start = max(start, pos) - pos
+                cut_end = min(end, run_end) - pos
+                for piece, piece_attrs in ((text[:cut_start], attrs),
+                                           (text[cut_start:cut_end], flipped),
+                                           (text[cut_end:], attrs)):
+                    if piece:
+                        result.append((piece, piece_attrs))
+            pos = run_end
+        return tuple(result)
+    
+    @staticmethod
+    def wrap_runs(runs, columns):
+        """Split a line's runs into (runs, offset) rows of at most columns cells"""
+        rows = []
+        current = []
+        cells = 0
+        offset = 0
+        row_start = 0
+        for text, attrs in runs:
+            ascii_text = text.isascii()
+            i = 0
+            while i < len(text):
+                if cells >= columns:
+                    rows.append((tuple(current), row_start))
+                    current = []
+                    cells = 0
+                    row_start = offset + i
+                if ascii_text:
+                    j = min(i + columns - cells, len(text))
+                    cells += j - i
+                else:
+                    j = i
+                    while j < len(text):
+                        width = max(wcwidth(text[j]), 1)
+                        if cells + width > columns and cells:
+                            # A wide character that does not fit starts the next row
+                            cells = columns
+                            break
+                        cells += width
+                        j += 1
+                    if j == i:
+                        continue
+                current.append((text[i:j], attrs))
+                i = j
+            offset += len(text)
+        rows.append((tuple(current), row_start))
+        return rows
+    
+    @staticmethod
+    def line_text(runs):
+        """Return the plain text of a run tuple"""
+        return "".join(text for text, attrs in runs)
 
 
-class SettingsDialog(QDialog):
-    """Settings dialog for customizing terminal appearance"""
+class ScrollbackIndex:
+    """Bloom filters of the 4-grams in each block of scrollback lines"""
     
-    def __init__(self, parent=None, current_settings=None):
-        super().__init__(parent)
-        self.setWindowTitle("⚙️ Terminal Settings")
-        self.setModal(True)
-        self.resize(500, 450)
+    BLOCK_LINES = 1024
+    BLOOM_BITS = 65536
+    GRAM = 4
+    # Grams of the open block kept in a set before they are folded into
+    # its bloom, which is saturated by then anyway
+    MAX_GRAMS = 65536
+    
+    def __init__(self, first_line=0):
+        # (first line, bloom) of every completed block
+        self.blocks = deque()
+        self.block_start = first_line
+        # Grams of the open block, turned into a bloom once it is full
+        self.block_grams = set()
+        self.block_bloom = None
+        self.count = 0
+        # Disk tier that takes the blooms of spilled lines, if any
+        self.spill = None
+    
+    @classmethod
+    def grams(cls, text):
+        """Return the set of lowercased grams of a string"""
+        text = text.lower()
+        size = cls.GRAM
+        return {text[i:i + size] for i in range(len(text) - size + 1)}
+    
+    @staticmethod
+    def literals(pattern, regex):
+        """Return substrings every match of a search must contain"""
+        if not regex:
+            return [pattern]
+        if '|' in pattern or '(?' in pattern:
+            return []
         
-        self.settings = current_settings or {}
-        self.setup_ui()
+        literals = []
+        current = ''
+        depth = 0
+        i = 0
+        while i < len(pattern):
+            char = pattern[i]
+            if char == '\\':
+                escaped = pattern[i + 1:i + 2]
+                if escaped and not escaped.isalnum() and depth == 0:
+                    current += escaped
+                else:
+                    literals.append(current)
+                    current = ''
+                i += 2
+                continue
+            if char in '*?{':
+                # The previous character is optional
+                literals.append(current[:-1])
+                current = ''
+                if char == '{':
+                    end = pattern.find('}', i)
+                    i = end if end != -1 else len(pattern)
+            elif char == '[':
+                # Skip the character class, a leading ] is part of it
+                literals.append(current)
+                current = ''
+                i += 2 if pattern[i + 1:i + 2] == '^' else 1
+                if pattern[i:i + 1] == ']':
+                    i += 1
+                while i < len(pattern) and pattern[i] != ']':
+                    i += 2 if pattern[i] == '\\' else 1
+                if i >= len(pattern):
+                    # Unterminated, better no literals than wrong ones
+                    return []
+            elif char in '.^$+()':
+                literals.append(current)
+                current = ''
+                depth += {'(': 1, ')': -1}.get(char, 0)
+            elif depth == 0:
+                current += char
+            i += 1
+        literals.append(current)
+        return [literal for literal in literals if len(literal) >= ScrollbackIndex.GRAM]
     
-    def apply_theme_to_dialog(self, settings):
-        """Apply current theme colors to the settings dialog"""
-        bg_color = settings['bg_color']
-        text_color = settings['text_color']
-        sel_color = settings['selection_color']
+    def add(self, text):
+        """Index the next history line"""
+        text = text.lower()
+        size = self.GRAM
+        self.block_grams.update([text[i:i + size] for i in range(len(text) - size + 1)])
         
-        # Darken background for dialog
-        bg_q = QColor(bg_color)
-        dialog_bg = QColor(
-            max(0, bg_q.red() - 20),
-            max(0, bg_q.green() - 20),
-            max(0, bg_q.blue() - 20)
-        ).name()
+        self.count += 1
+        if self.count == self.BLOCK_LINES:
+            self.blocks.append((self.block_start, self.fold()))
+            self.block_start += self.count
+            self.block_bloom = None
+            self.count = 0
+        elif len(self.block_grams) >= self.MAX_GRAMS:
+            self.fold()
+    
+    def fold(self, grams=None, bloom=None):
+        """Set the bits of grams, by default the open block's, in a bloom"""
+        if grams is None:
+            grams = self.block_grams
+            self.block_grams = set()
+            if self.block_bloom is None:
+                self.block_bloom = bytearray(self.BLOOM_BITS // 8)
+            bloom = self.block_bloom
+        mask = self.BLOOM_BITS - 1
+        for gram in grams:
+            bit = hash(gram) & mask
+            bloom[bit >> 3] |= 1 << (bit & 7)
+        return bloom
+    
+    def extend(self, text):
+        """Index more text of the last added line"""
+        grams = self.grams(text)
+        if self.count or not self.blocks:
+            self.block_grams.update(grams)
+            if len(self.block_grams) >= self.MAX_GRAMS:
+                self.fold()
+            return
+        # The line closed the previous block, its bloom takes the grams
+        self.fold(grams, self.blocks[-1][1])
+    
+    def discard_before(self, line):
+        """Forget or spill blocks that only cover lines no longer in memory"""
+        while self.blocks and self.blocks[0][0] + self.BLOCK_LINES <= line:
+            start, bloom = self.blocks.popleft()
+            if self.spill is not None and start + self.BLOCK_LINES > self.spill.first:
+                self.spill.add_bloom(start, bloom)
+    
+    def candidates(self, literals):
+        """Return (start, end) line ranges that may contain all literals"""
+        mask = self.BLOOM_BITS - 1
+        bits = {hash(gram) & mask
+                for literal in literals for gram in self.grams(literal)}
+        blocks = list(self.blocks)
+        spill = self.spill
+        if spill is not None:
+            blocks = list(spill.blooms()) + blocks
+        ranges = [(start, start + self.BLOCK_LINES)
+                  for start, bloom in blocks
+                  if all(bloom[bit >> 3] & (1 << (bit & 7)) for bit in bits)]
+        # The open block is always scanned
+        ranges.append((self.block_start, self.block_start + self.count))
+        return ranges
+
+
+class ScrollbackSpill:
+    """Disk tier for lines pushed out of the in-memory scrollback"""
+    
+    SEGMENT_LINES = 4096
+    # Decompressed segments kept around for scrolling
+    CACHED_SEGMENTS = 4
+    
+    def __init__(self, first_line):
+        cache_dir = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                                 os.path.expanduser('~/.cache'), 'herminal')
+        os.makedirs(cache_dir, exist_ok=True)
+        self.remove_stale(cache_dir)
+        self.path = os.path.join(cache_dir, f'scrollback-{os.getpid()}-{id(self):x}.seg')
+        self.file = open(self.path, 'w+b')
+        self.map = None
+        self.lock = threading.Lock()
         
-        # Lighten selection color for buttons
-        sel_q = QColor(sel_color)
-        btn_hover = sel_q.lighter(120).name()
+        # Every segment holds exactly SEGMENT_LINES lines
+        self.first = first_line
+        self.pending = []
+        self.segments = []  # (offset, length) per segment
+        # (first line, offset, length) of each spilled ScrollbackIndex bloom
+        self.bloom_blocks = []
+        self.cache = OrderedDict()
+    
+    @staticmethod
+    def remove_stale(cache_dir):
+        """Delete spill files left behind by sessions that crashed"""
+        for name in os.listdir(cache_dir):
+            if not name.startswith('scrollback-'):
+                continue
+            try:
+                os.kill(int(name.split('-')[1]), 0)
+            except ProcessLookupError:
+                try:
+                    os.unlink(os.path.join(cache_dir, name))
+                except OSError:
+                    pass
+            except (ValueError, IndexError, PermissionError):
+                pass
+    
+    @property
+    def total(self):
+        """Absolute number of the line after the last spilled one"""
+        return self.first + len(self.segments) * self.SEGMENT_LINES + len(self.pending)
+    
+    def append(self, entry):
+        """Spill one packed line, writing a segment once the batch is full"""
+        self.pending.append(entry)
+        if len(self.pending) >= self.SEGMENT_LINES:
+            data = zlib.compress(marshal.dumps(self.pending), 1)
+            with self.lock:
+                self.segments.append((self.write(data), len(data)))
+                self.pending = []
+    
+    def write(self, data):
+        """Append data to the file, returning its offset; hold the lock"""
+        offset = self.file.seek(0, os.SEEK_END)
+        self.file.write(data)
+        self.file.flush()
+        return offset
+    
+    def read(self, offset, length):
+        """Return bytes of the file; hold the lock"""
+        if self.map is None or len(self.map) < offset + length:
+            # The file has grown since it was mapped
+            if self.map is not None:
+                self.map.close()
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self.map[offset:offset + length]
+    
+    def add_bloom(self, start, bloom):
+        """Spill the bloom of the index block starting at line start"""
+        data = zlib.compress(bloom, 1)
+        with self.lock:
+            self.bloom_blocks.append((start, self.write(data), len(data)))
+    
+    def blooms(self):
+        """Yield (first line, bloom) of the spilled index blocks"""
+        with self.lock:
+            blocks = list(self.bloom_blocks)
+        for start, offset, length in blocks:
+            with self.lock:
+                if self.file.closed:
+                    return
+                data = self.read(offset, length)
+            yield start, zlib.decompress(data)
+    
+    def segment(self, number):
+        """Return the decoded lines of a segment"""
+        lines = self.cache.get(number)
+        if lines is not None:
+            self.cache.move_to_end(number)
+            return lines
         
-        # Style the dialog with current theme
-        self.setStyleSheet(f"""
-            QDialog {{
-                background-color: {dialog_bg};
-                color: {text_color};
-            }}
-            QLabel {{
-                color: {text_color};
-            }}
-            QPushButton {{
-                background-color: {sel_color};
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 6px 12px;
-            }}
-            QPushButton:hover {{
-                background-color: {btn_hover};
-            }}
-            QSpinBox, QFontComboBox, QComboBox {{
-                background-color: {bg_color};
-                color: {text_color};
-                border: 1px solid {sel_color};
-                border-radius: 3px;
-                padding: 4px;
-            }}
-            QSpinBox::up-button, QSpinBox::down-button {{
-                background-color: {sel_color};
-                border: none;
-            }}
-            QSpinBox::up-button:hover, QSpinBox::down-button:hover {{
-                background-color: {btn_hover};
-            }}
-            QComboBox::drop-down {{
-                background-color: {sel_color};
-                border: none;
-            }}
-            QComboBox QAbstractItemView {{
-                background-color: {dialog_bg};
-                color: {text_color};
-                selection-background-color: {sel_color};
-            }}
-        """)
+        lines = marshal.loads(zlib.decompress(self.read(*self.segments[number])))
         
-    def setup_ui(self):
-        layout = QVBoxLayout()
+        self.cache[number] = lines
+        if len(self.cache) > self.CACHED_SEGMENTS:
+            self.cache.popitem(last=False)
+        return lines
+    
+    def get(self, index):
+        """Return the packed line with an absolute number, None if unknown"""
+        if index < self.first:
+            return None
+        number, line = divmod(index - self.first, self.SEGMENT_LINES)
+        with self.lock:
+            if self.file.closed:
+                return None
+            if number < len(self.segments):
+                return self.segment(number)[line]
+            if number == len(self.segments) and line < len(self.pending):
+                return self.pending[line]
+            return None
+    
+    def close(self):
+        """Drop the spill file"""
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.close()
+            self.cache.clear()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+
+class Scrollback:
+    """Bounded history of lines that scrolled off the top of the screen"""
+    
+    CHUNK_SHIFT = 12
+    CHUNK_MASK = (1 << CHUNK_SHIFT) - 1
+    
+    # Attributes of a blank pyte cell
+    DEFAULT_ATTRS = pyte.screens.Char(" ")[1:]
+    # Rough per-line overhead of the tuple, deque slot and empty runs
+    LINE_OVERHEAD = 120
+    # Distinct attribute tuples interned, later ones are stored as the
+    # default so a flood of true colors cannot grow the table forever
+    MAX_ATTRS = 65536
+    
+    def __init__(self, max_lines=100000, max_bytes=64 * 1024 * 1024):
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+        # chunk number -> list of (text, packed runs)
+        self.chunks = {}
+        self.start = 0
+        self.end = 0
+        self.bytes_used = 0
+        self.spill = None
+        # Held while the spill is swapped or written to
+        self.lock = threading.Lock()
+        # The newest line continues in the row still on screen
+        self.open = False
+        # Lines before this one no longer change
+        self.settled = 0
+        self.index = ScrollbackIndex()
+        # Interned attribute tuples, id 0 is the default
+        self.attr_table = [self.DEFAULT_ATTRS]
+        self.attr_ids = {self.DEFAULT_ATTRS: 0}
+    
+    def __len__(self):
+        return self.total - self.first
+    
+    @property
+    def total(self):
+        """Number of lines ever appended"""
+        return self.end
+    
+    @property
+    def first(self):
+        """Absolute number of the oldest line still available"""
+        spill = self.spill
+        return spill.first if spill else self.start
+    
+    def set_limits(self, max_lines, max_bytes):
+        """Change the caps, trimming on the next append"""
+        self.max_lines = max_lines
+        self.max_bytes = max_bytes
+    
+    def set_disk(self, enabled):
+        """Turn spilling of old lines to disk on or off"""
+        with self.lock:
+            if enabled and self.spill is None:
+                self.spill = ScrollbackSpill(self.start)
+            elif not enabled and self.spill is not None:
+                spill, self.spill = self.spill, None
+                spill.close()
+            self.index.spill = self.spill
+    
+    def close(self):
+        """Release the disk tier, if any"""
+        self.set_disk(False)
+    
+    def append(self, runs, wrapped=False):
+        """Store a row given as (text, attrs) runs, wrapped joins the next row onto it"""
+        runs = list(runs)
+        # Trailing default blanks are implied, except inside a wrapped line
+        while not wrapped and runs and runs[-1][1] == self.DEFAULT_ATTRS:
+            text = runs[-1][0].rstrip(' ')
+            if text:
+                runs[-1] = (text, runs[-1][1])
+                break
+            runs.pop()
+        
+        text = "".join(text for text, attrs in runs)
+        if all(attrs == self.DEFAULT_ATTRS for _, attrs in runs):
+            packed = b''
+        else:
+            packed = array('I')
+            for run_text, attrs in runs:
+                packed.append(len(run_text))
+                packed.append(self.attr_id(attrs))
+            packed = packed.tobytes()
+        self.store(text, packed, wrapped)
+    
+    def load(self, entries, attr_table, wrapped=False):
+        """Append lines packed by another Scrollback with its attribute table"""
+        ids = array('I', (self.attr_id(tuple(attrs)) for attrs in attr_table))
+        last = len(entries) - 1
+        for number, (text, packed) in enumerate(entries):
+            if packed:
+                # Translate the attribute ids into this table's
+                values = array('I')
+                values.frombytes(packed)
+                values[1::2] = array('I', (ids[attr_id] for attr_id in values[1::2]))
+                packed = values.tobytes()
+            self.store(text, packed, wrapped and number == last)
+    
+    def attr_id(self, attrs):
+        """Intern an attribute tuple, returning its id"""
+        attr_id = self.attr_ids.get(attrs)
+        if attr_id is None:
+            if len(self.attr_table) >= self.MAX_ATTRS:
+                return 0
+            attr_id = self.attr_ids[attrs] = len(self.attr_table)
+            self.attr_table.append(attrs)
+        return attr_id
+    
+    def store(self, text, packed, wrapped):
+        """Append a packed row, joining it to an open line"""
+        if self.open and self.end > self.start:
+            # Continue the line the previous row wrapped from
+            chunk = self.chunks[(self.end - 1) >> self.CHUNK_SHIFT]
+            head, head_packed = chunk[-1]
+            self.bytes_used -= len(head_packed)
+            if head_packed or packed:
+                packed = ((head_packed or self.plain_run(head)) +
+                          (packed or self.plain_run(text)))
+            chunk[-1] = (head + text, packed)
+            self.index.extend(head[1 - ScrollbackIndex.GRAM:] + text)
+            self.bytes_used += len(text) + len(packed)
+        else:
+            chunk = self.chunks.get(self.end >> self.CHUNK_SHIFT)
+            if chunk is None:
+                chunk = self.chunks[self.end >> self.CHUNK_SHIFT] = []
+            chunk.append((text, packed))
+            self.end += 1
+            self.index.add(text)
+            self.bytes_used += len(text) + len(packed) + self.LINE_OVERHEAD
+        self.open = wrapped
+        self.settled = self.end - 1 if wrapped else self.end
+        
+        # set_disk may swap the spill from the GUI thread
+        with self.lock:
+            while self.end > self.start and (self.end - self.start > self.max_lines or
+                                             self.bytes_used > self.max_bytes):
+                chunk = self.chunks[self.start >> self.CHUNK_SHIFT]
+                entry = chunk[self.start & self.CHUNK_MASK]
+                chunk[self.start & self.CHUNK_MASK] = None
+                self.bytes_used -= len(entry[0]) + len(entry[1]) + self.LINE_OVERHEAD
+                if self.spill is not None:
+                    self.spill.append(entry)
+                self.start += 1
+                if not self.start & self.CHUNK_MASK:
+                    del self.chunks[(self.start - 1) >> self.CHUNK_SHIFT]
+            self.index.discard_before(self.start)
+    
+    @staticmethod
+    def plain_run(text):
+        """Packed run covering text with default attributes"""
+        return array('I', (len(text), 0)).tobytes() if text else b''
+    
+    def decode(self, entry):
+        """Expand a stored line back into (text, attrs) runs"""
+        text, packed = entry
+        if not packed:
+            return ((text, self.DEFAULT_ATTRS),) if text else ()
+        
+        runs = []
+        values = array('I')
+        values.frombytes(packed)
+        pos = 0
+        for i in range(0, len(values), 2):
+            length = values[i]
+            runs.append((text[pos:pos + length], self.attr_table[values[i + 1]]))
+            pos += length
+        return tuple(runs)
+    
+    def entry(self, index):
+        """Return the packed line with an absolute number, None if unknown"""
+        if index < self.start:
+            spill = self.spill
+            return spill.get(index) if spill else None
+        try:
+            return self.chunks[index >> self.CHUNK_SHIFT][index & self.CHUNK_MASK]
+        except (KeyError, IndexError):
+            return None
+    
+    def get(self, index):
+        """Return the runs of an absolute line number, () once discarded"""
+        entry = self.entry(index)
+        return self.decode(entry) if entry else ()
+    
+    def get_text(self, index):
+        """Return the plain text of an absolute line number"""
+        entry = self.entry(index)
+        return entry[0] if entry else ''
+    
+    def tail(self, offset, count):
+        """Return up to count lines starting offset lines from the end"""
+        first = self.total - offset
+        return [self.get(index)
+                for index in range(first, min(first + count, self.total))]
+
+
+class ScrollbackLayout:
+    """Scrollback lines wrapped into rows at one screen width, measured lazily"""
+    
+    BATCH = 20000
+    
+    def __init__(self, scrollback, columns, end):
+        self.scrollback = scrollback
+        self.columns = columns
+        self.pivot = min(end, scrollback.settled)
+        # after[i] is the row line pivot + i ends at, before[i] how many
+        # rows line pivot - 1 - i starts above the pivot
+        self.after = array('Q')
+        self.before = array('Q')
+    
+    @property
+    def low(self):
+        """Oldest measured line"""
+        return self.pivot - len(self.before)
+    
+    @property
+    def high(self):
+        """Line after the newest measured one"""
+        return self.pivot + len(self.after)
+    
+    def line_rows(self, line):
+        """Number of rows a line takes at this width"""
+        text = self.scrollback.get_text(line)
+        if text.isascii():
+            return max(1, -(-len(text) // self.columns))
+        return len(ANSIParser.wrap_runs(((text, None),), self.columns))
+    
+    def extend(self, end):
+        """Measure the lines that settled since the last call"""
+        first = self.scrollback.first
+        settled = min(end, self.scrollback.settled)
+        if self.high < settled:
+            rows = self.after[-1] if self.after else 0
+            for line in range(self.high, settled):
+                rows += self.line_rows(line)
+                self.after.append(rows)
+        
+        if self.pivot < first <= self.high and (first - self.pivot) * 2 > len(self.after):
+            # Most measured lines were discarded, move the pivot up
+            shift = self.after[first - self.pivot - 1]
+            self.after = array('Q', [rows - shift for rows in self.after[first - self.pivot:]])
+            self.before = array('Q')
+            self.pivot = first
+    
+    def measure_back(self, count=BATCH):
+        """Measure up to count older lines, False once none are left"""
+        low = self.low
+        stop = max(self.scrollback.first, low - count)
+        rows = self.before[-1] if self.before else 0
+        for line in range(low - 1, stop - 1, -1):
+            rows += self.line_rows(line)
+            self.before.append(rows)
+        return stop > self.scrollback.first
+    
+    def position(self, line):
+        """Row a line starts at, relative to the pivot"""
+        line = max(line, self.scrollback.first)
+        if line < self.low:
+            self.measure_back(self.low - line)
+        if line >= self.high:
+            rows = self.after[-1] if self.after else 0
+            # Unsettled lines are measured on every call
+            for unsettled in range(self.high, line):
+                rows += self.line_rows(unsettled)
+            return rows
+        if line > self.pivot:
+            return self.after[line - self.pivot - 1]
+        if line == self.pivot:
+            return 0
+        return -self.before[min(self.pivot - 1 - line, len(self.before) - 1)]
+    
+    def rows(self, end):
+        """Estimated number of history rows before line end"""
+        self.extend(end)
+        first = self.scrollback.first
+        start = min(max(first, self.low), end)
+        rows = self.position(end) - self.position(start)
+        if start > first:
+            lines = end - start
+            rows += (start - first) * rows // lines if lines else start - first
+        return rows
+    
+    def locate(self, back, end):
+        """Return (line, row in line) of the row back rows above line end"""
+        self.extend(end)
+        target = self.position(end) - back
+        line = end
+        # Walk up through the unsettled lines first
+        while line > self.high:
+            line -= 1
+            start = self.position(line)
+            if start <= target:
+                return line, target - start
+        if target >= 0:
+            line = self.pivot + bisect_right(self.after, target)
+        else:
+            index = bisect_left(self.before, -target)
+            batch = 256
+            while index >= len(self.before) and self.low > self.scrollback.first:
+                self.measure_back(batch)
+                batch = min(batch * 2, self.BATCH)
+                index = bisect_left(self.before, -target)
+            if index >= len(self.before):
+                return self.scrollback.first, 0
+            line = self.pivot - 1 - index
+        if line < self.scrollback.first:
+            return self.scrollback.first, 0
+        return line, target - self.position(line)
+    
+    def view(self, back, count, end):
+        """Return (runs, line, offset) for up to count rows, from back rows above end"""
+        line, skip = self.locate(back, end)
+        rows = []
+        while len(rows) < min(count, back) and line < end:
+            wrapped = ANSIParser.wrap_runs(self.scrollback.get(line), self.columns)
+            rows.extend((runs, line, offset) for runs, offset in wrapped[skip:])
+            line += 1
+            skip = 0
+        return rows[:min(count, back)]
+
+
+class Triggers:
+    """User-defined patterns matched against completed output lines"""
+    
+    ACTIONS = ('highlight', 'notify', 'bell')
+    # "(?i)" and friends at the start of a pattern
+    GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+    # Group references by number, which joining the patterns renumbers
+    NUMBERED = re.compile(r'\\[1-9]|\(\?\(\d')
+    
+    def __init__(self, triggers):
+        # (action, pattern, pyte background color or None)
+        self.triggers = []
+        # (pattern, reason) of triggers left out
+        self.skipped = []
+        alternatives = []
+        # Substrings one of which every match contains, None if unknown
+        self.needles = []
+        for trigger in triggers:
+            pattern = trigger.get('pattern')
+            action = trigger.get('action', 'highlight')
+            if action not in self.ACTIONS:
+                self.skipped.append((pattern, f"unknown action {action!r}"))
+                continue
+            try:
+                scoped = self.scope_flags(pattern)
+                re.compile(scoped)
+            except (re.error, TypeError) as e:
+                self.skipped.append((pattern, str(e)))
+                continue
+            color = QColor(trigger.get('color', ''))
+            self.triggers.append((action, pattern,
+                                  color.name()[1:] if color.isValid() else None))
+            alternatives.append(scoped)
+            if self.needles is not None:
+                needles = self.needles_of(pattern)
+                self.needles = self.needles + needles if needles else None
+        
+        self.regex = None
+        if not any(self.NUMBERED.search(alternative) for alternative in alternatives):
+            try:
+                self.regex = re.compile('|'.join(f'(?P<t{number}>{alternative})'
+                                                 for number, alternative in enumerate(alternatives)))
+            except re.error:
+                pass
+        if self.regex is not None:
+            self.groups = [self.regex.groupindex[f't{number}']
+                           for number in range(len(self.triggers))]
+        else:
+            self.regexes = [re.compile(alternative) for alternative in alternatives]
+    
+    @classmethod
+    def scope_flags(cls, pattern):
+        """pattern with leading global flags turned into a scoped group"""
+        match = cls.GLOBAL_FLAGS.match(pattern)
+        if match is None:
+            return pattern
+        return f'(?{match.group(1)}:{pattern[match.end():]})'
+    
+    @staticmethod
+    def needles_of(pattern):
+        """Substrings one of which every match of pattern contains, [] if unknown"""
+        # Plain alternatives like ERROR|FATAL count branch by branch
+        branches = ([pattern] if set(pattern) & set('()[]\\')
+                    else pattern.split('|'))
+        needles = []
+        for branch in branches:
+            literals = ScrollbackIndex.literals(branch, True)
+            if not literals:
+                return []
+            needles.append(max(literals, key=len))
+        return needles
+    
+    @classmethod
+    def compile(cls, triggers):
+        """Triggers for a settings list, None when there are none"""
+        triggers = cls(triggers or [])
+        return triggers if triggers.triggers else None
+    
+    def scan(self, text):
+        """Yield (action, pattern, color, start, end) for each match in text"""
+        if self.needles is not None:
+            for needle in self.needles:
+                if needle in text:
+                    break
+            else:
+                return
+        if self.regex is None:
+            yield from self.scan_each(text)
+            return
+        for match in self.regex.finditer(text):
+            if match.end() == match.start():
+                continue
+            for number, group in enumerate(self.groups):
+                if match.start(group) >= 0:
+                    yield self.triggers[number] + match.span()
+                    break
+    
+    def scan_each(self, text):
+        """scan() with a regex per trigger, leftmost match first like the joined regex"""
+        pos = 0
+        while pos <= len(text):
+            best = None
+            for number, regex in enumerate(self.regexes):
+                match = regex.search(text, pos)
+                if match is not None and (best is None or match.start() < best[1].start()):
+                    best = number, match
+            if best is None:
+                return
+            number, match = best
+            if match.end() == match.start():
+                pos = match.end() + 1
+                continue
+            yield self.triggers[number] + match.span()
+            pos = match.end()
+
+
+class ScreenRow:
+    """Cells of one CompactScreen row"""
+    
+    __slots__ = ('chars', 'attrs', 'combined')
+    
+    def __init__(self, chars, attrs):
+        # Code points and attr_table ids, one per cell
+        self.chars = chars
+        self.attrs = attrs
+        # Column -> text of cells with combining marks, usually None
+        self.combined = None
+
+
+class CompactScreen(pyte.Screen):
+    """pyte screen keeping its cells in packed arrays instead of Char objects"""
+    
+    # Interned attributes that trigger dropping the ones no cell uses
+    MAX_ATTRS = 4096
+    CODEC = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+    # Printable ASCII, the common case draw() writes in bulk
+    TEXT_RUNS = re.compile(r'[\x20-\x7e]+|[^\x20-\x7e]+')
+    
+    @property
+    def display(self):
+        """Screen rows as text, like pyte's"""
+        return [self.row_text(y) for y in range(self.lines)]
+    
+    def reset(self):
+        """Reset the terminal and blank every row"""
+        super().reset()
+        self.attr_table = []
+        self.attr_ids = {}
+        self.attr_limit = self.MAX_ATTRS
+        self.rows = [self.blank_row() for _ in range(self.lines)]
+    
+    def attr_id(self, attrs):
+        """Id of an attributes tuple, interned on first use"""
+        attr = self.attr_ids.get(attrs)
+        if attr is None:
+            attr = self.attr_ids[attrs] = len(self.attr_table)
+            self.attr_table.append(attrs)
+        return attr
+    
+    def cursor_attr(self):
+        """Id of the cursor's attributes, called before cells are written"""
+        if len(self.attr_table) > self.attr_limit:
+            self.compact_attrs()
+        return self.attr_id(self.cursor.attrs[1:])
+    
+    def compact_attrs(self):
+        """Forget attributes no cell uses and renumber the others"""
+        used = set()
+        for row in self.rows:
+            used.update(row.attrs)
+        table = self.attr_table
+        self.attr_table = []
+        self.attr_ids = {}
+        renumber = {attr: self.attr_id(table[attr]) for attr in sorted(used)}
+        for row in self.rows:
+            row.attrs = array('I', map(renumber.__getitem__, row.attrs))
+        # A screen full of distinct styles must not compact on every draw
+        self.attr_limit = max(self.MAX_ATTRS, 2 * len(self.attr_table))
+    
+    def blank_row(self):
+        """A row of spaces in the default style"""
+        return ScreenRow(array('I', [32]) * self.columns,
+                         array('I', [self.attr_id(self.default_char[1:])]) * self.columns)
+    
+    def fill(self, row, start, end, code, attr):
+        """Set cells start..end of a row to one character and style"""
+        if end > start:
+            row.chars[start:end] = array('I', [code]) * (end - start)
+            row.attrs[start:end] = array('I', [attr]) * (end - start)
+            if row.combined:
+                for x in [x for x in row.combined if start <= x < end]:
+                    del row.combined[x]
+    
+    def cells_text(self, row, start, end):
+        """Text of cells start..end, wide character stubs add nothing"""
+        if row.combined and any(start <= x < end for x in row.combined):
+            combined = row.combined
+            return "".join(combined[x] if x in combined else chr(code) if code else ''
+                           for x, code in enumerate(row.chars[start:end], start))
+        text = row.chars[start:end].tobytes().decode(self.CODEC)
+        return text.replace('\x00', '') if '\x00' in text else text
+    
+    def row_text(self, y):
+        """Text of row y"""
+        return self.cells_text(self.rows[y], 0, self.columns)
+    
+    def line_runs(self, y):
+        """Row y as (text, attrs) runs, attrs being a pyte Char without its data"""
+        if y >= len(self.rows):
+            return ()
+        row = self.rows[y]
+        attrs = row.attrs
+        table = self.attr_table
+        current = attrs[0]
+        if attrs.count(current) == len(attrs):
+            return ((self.cells_text(row, 0, len(attrs)), table[current]),)
+        runs = []
+        start = 0
+        for x, attr in enumerate(attrs):
+            if attr != current:
+                runs.append((self.cells_text(row, start, x), table[current]))
+                start = x
+                current = attr
+        runs.append((self.cells_text(row, start, len(attrs)), table[current]))
+        return tuple(runs)
+    
+    def draw(self, data):
+        """Display text at the cursor, as pyte does"""
+        data = data.translate(self.g1_charset if self.charset else self.g0_charset)
+        attr = self.cursor_attr()
+        insert = pyte.modes.IRM in self.mode
+        if data.isascii() and data.isprintable() and not insert:
+            self.draw_ascii(data, attr)
+        else:
+            for run in self.TEXT_RUNS.findall(data):
+                if run[0].isascii() and run[0].isprintable() and not insert:
+                    self.draw_ascii(run, attr)
+                elif not self.draw_chars(run, attr, insert):
+                    # pyte stops at an unprintable character
+                    break
+        self.dirty.add(self.cursor.y)
+    
+    def draw_ascii(self, text, attr):
+        """Draw printable ASCII a row at a time"""
+        cursor = self.cursor
+        columns = self.columns
+        start = 0
+        while start < len(text):
+            if cursor.x == columns:
+                if pyte.modes.DECAWM in self.mode:
+                    self.dirty.add(cursor.y)
+                    self.carriage_return()
+                    self.linefeed()
+                else:
+                    # Each further character overwrites the last column
+                    row = self.rows[cursor.y]
+                    self.fill(row, columns - 1, columns, ord(text[-1]), attr)
+                    return
+            count = min(len(text) - start, columns - cursor.x)
+            row = self.rows[cursor.y]
+            end = cursor.x + count
+            row.chars[cursor.x:end] = array('I', text[start:start + count].encode(self.CODEC))
+            row.attrs[cursor.x:end] = array('I', [attr]) * count
+            if row.combined:
+                for x in [x for x in row.combined if cursor.x <= x < end]:
+                    del row.combined[x]
+            cursor.x = end
+            start += count
+    
+    def draw_chars(self, text, attr, insert):
+        """Draw text a character at a time, False at an unprintable one"""
+        cursor = self.cursor
+        columns = self.columns
+        for char in text:
+            width = wcwidth(char)
+            if cursor.x == columns:
+                if pyte.modes.DECAWM in self.mode:
+                    self.dirty.add(cursor.y)
+                    self.carriage_return()
+                    self.linefeed()
+                elif width > 0:
+                    cursor.x -= width
+            if insert and width > 0:
+                self.insert_characters(width)
+            
+            row = self.rows[cursor.y]
+            x = cursor.x
+            if width == 1 or width == 2:
+                row.chars[x] = ord(char)
+                row.attrs[x] = attr
+                if row.combined:
+                    row.combined.pop(x, None)
+                if width == 2 and x + 1 < columns:
+                    row.chars[x + 1] = 0
+                    row.attrs[x + 1] = attr
+                    if row.combined:
+                        row.combined.pop(x + 1, None)
+            elif width == 0 and unicodedata.combining(char):
+                # Combines with the previous cell, on this row or above
+                if cursor.x:
+                    self.combine(row, cursor.x - 1, char)
+                elif cursor.y:
+                    self.combine(self.rows[cursor.y - 1], columns - 1, char)
+                    self.dirty.add(cursor.y - 1)
+            else:
+                return False
+            if width > 0:
+                cursor.x = min(cursor.x + width, columns)
+        return True
+    
+    def combine(self, row, x, char):
+        """Add a combining mark to a cell"""
+        text = unicodedata.normalize('NFC', self.cells_text(row, x, x + 1) + char)
+        row.chars[x] = ord(text[0])
+        if len(text) > 1:
+            if row.combined is None:
+                row.combined = {}
+            row.combined[x] = text
+        elif row.combined:
+            row.combined.pop(x, None)
+    
+    def tab(self):
+        """Move to the next tab stop, which a resize may have left off screen"""
+        super().tab()
+        self.cursor.x = min(self.cursor.x, self.columns - 1)
+    
+    def index(self):
+        """Move the cursor down, scrolling the margins at the bottom"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == bottom:
+            self.dirty.update(range(top, bottom + 1))
+            del self.rows[top]
+            self.rows.insert(bottom, self.blank_row())
+        else:
+            self.cursor_down()
+    
+    def reverse_index(self):
+        """Move the cursor up, scrolling the margins at the top"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == top:
+            self.dirty.update(range(top, bottom + 1))
+            del self.rows[bottom]
+            self.rows.insert(top, self.blank_row())
+        else:
+            self.cursor_up()
+    
+    def insert_lines(self, count=None):
+        """Insert blank rows at the cursor, pushing rows below off the bottom margin"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        y = self.cursor.y
+        if top <= y <= bottom:
+            count = min(count or 1, bottom - y + 1)
+            self.dirty.update(range(y, bottom + 1))
+            del self.rows[bottom - count + 1:bottom + 1]
+            self.rows[y:y] = [self.blank_row() for _ in range(count)]
+            self.carriage_return()
+    
+    def delete_lines(self, count=None):
+        """Delete rows at the cursor, pulling rows below up to it"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        y = self.cursor.y
+        if top <= y <= bottom:
+            count = min(count or 1, bottom - y + 1)
+            self.dirty.update(range(y, bottom + 1))
+            del self.rows[y:y + count]
+            self.rows[bottom - count + 1:bottom - count + 1] = [
+                self.blank_row() for _ in range(count)]
+            self.carriage_return()
+    
+    def insert_characters(self, count=None):
+        """Insert blanks at the cursor, shifting the rest of the row right"""
+        y, x, columns = self.cursor.y, self.cursor.x, self.columns
+        self.dirty.add(y)
+        count = min(count or 1, columns - x)
+        if count <= 0:
+            return
+        row = self.rows[y]
+        row.chars[x + count:] = row.chars[x:columns - count]
+        row.attrs[x + count:] = row.attrs[x:columns - count]
+        if row.combined:
+            row.combined = {(column + count if column >= x else column): text
+                            for column, text in row.combined.items()
+                            if column + count < columns or column < x}
+        self.fill(row, x, x + count, 32, self.attr_id(self.default_char[1:]))
+    
+    def delete_characters(self, count=None):
+        """Delete cells at the cursor, shifting the rest of the row left"""
+        y, x, columns = self.cursor.y, self.cursor.x, self.columns
+        self.dirty.add(y)
+        count = min(count or 1, columns - x)
+        if count <= 0:
+            return
+        row = self.rows[y]
+        if row.combined:
+            row.combined = {(column - count if column >= x else column): text
+                            for column, text in row.combined.items()
+                            if not x <= column < x + count}
+        row.chars[x:columns - count] = row.chars[x + count:]
+        row.attrs[x:columns - count] = row.attrs[x + count:]
+        self.fill(row, columns - count, columns, 32, self.attr_id(self.default_char[1:]))
+    
+    def erase_characters(self, count=None):
+        """Blank cells from the cursor in the cursor's style"""
+        attr = self.cursor_attr()
+        self.dirty.add(self.cursor.y)
+        x = self.cursor.x
+        self.fill(self.rows[self.cursor.y], x, min(x + (count or 1), self.columns), 32, attr)
+    
+    def erase_in_line(self, how=0, private=False):
+        """Blank part of the cursor row in the cursor's style"""
+        attr = self.cursor_attr()
+        self.dirty.add(self.cursor.y)
+        if how == 0:
+            start, end = self.cursor.x, self.columns
+        elif how == 1:
+            start, end = 0, self.cursor.x + 1
+        elif how == 2:
+            start, end = 0, self.columns
+        else:
+            return
+        self.fill(self.rows[self.cursor.y], start, min(end, self.columns), 32, attr)
+    
+    def erase_in_display(self, how=0, *args, **kwargs):
+        """Blank part of the screen in the cursor's style"""
+        if how == 0:
+            interval = range(self.cursor.y + 1, self.lines)
+        elif how == 1:
+            interval = range(self.cursor.y)
+        elif how == 2 or how == 3:
+            interval = range(self.lines)
+        else:
+            return
+        attr = self.cursor_attr()
+        self.dirty.update(interval)
+        for y in interval:
+            self.fill(self.rows[y], 0, self.columns, 32, attr)
+        if how == 0 or how == 1:
+            self.erase_in_line(how)
+    
+    def alignment_display(self):
+        """Fill the screen with E's (DECALN)"""
+        self.dirty.update(range(self.lines))
+        for row in self.rows:
+            row.chars = array('I', [ord('E')]) * self.columns
+            row.combined = None
+    
+    def set_mode(self, *modes, **kwargs):
+        """Set modes, turning the cells to reverse video for DECSCNM"""
+        super().set_mode(*modes, **kwargs)
+        if kwargs.get('private') and pyte.modes.DECSCNM >> 5 in modes:
+            self.restyle_cells(reverse=True)
+    
+    def reset_mode(self, *modes, **kwargs):
+        """Reset modes, turning reverse video off the cells for DECSCNM"""
+        super().reset_mode(*modes, **kwargs)
+        if kwargs.get('private') and pyte.modes.DECSCNM >> 5 in modes:
+            self.restyle_cells(reverse=False)
+    
+    def restyle_cells(self, reverse):
+        """Set or clear reverse video on every cell (DECSCNM)"""
+        restyled = {}
+        for row in self.rows:
+            for attr in set(row.attrs) - restyled.keys():
+                attrs = self.attr_table[attr]
+                restyled[attr] = self.attr_id(attrs[:6] + (reverse,) + attrs[7:])
+            row.attrs = array('I', map(restyled.__getitem__, row.attrs))
+    
+    def resize(self, lines=None, columns=None):
+        """Resize like pyte: rows go from the top, cells from the right"""
+        lines = lines or self.lines
+        columns = columns or self.columns
+        if lines == self.lines and columns == self.columns:
+            return
+        self.dirty.update(range(lines))
+        if lines < self.lines:
+            self.save_cursor()
+            self.cursor_position(0, 0)
+            self.delete_lines(self.lines - lines)
+            self.restore_cursor()
+            del self.rows[lines:]
+            # delete_lines() marked rows down to the old bottom
+            self.dirty.intersection_update(range(lines))
+        else:
+            self.rows.extend(self.blank_row() for _ in range(lines - self.lines))
+        
+        if columns < self.columns:
+            for row in self.rows:
+                del row.chars[columns:]
+                del row.attrs[columns:]
+                if row.combined:
+                    row.combined = {x: text for x, text in row.combined.items() if x < columns}
+        elif columns > self.columns:
+            blank = self.attr_id(self.default_char[1:])
+            for row in self.rows:
+                row.chars.extend(array('I', [32]) * (columns - len(row.chars)))
+                row.attrs.extend(array('I', [blank]) * (columns - len(row.attrs)))
+        self.lines, self.columns = lines, columns
+        # pyte leaves the cursor where it was, which may now be off screen
+        self.cursor.x = min(self.cursor.x, columns)
+        self.cursor.y = min(self.cursor.y, lines - 1)
+        self.set_margins()
+
+
+class ScrollbackScreen(CompactScreen):
+    """pyte screen that saves lines scrolled off the top into a Scrollback"""
+    
+    CONTROL_OSC = 1729
+    # Shell helper name -> command it sends
+    HELPERS = {'hsettings': 'settings', 'hinfo': 'info'}
+    # Longest soft-wrapped line the triggers look at
+    MAX_LINE = 8192
+    # Deepest kitty keyboard flag stack a program can build
+    KEYBOARD_DEPTH = 16
+    
+    def __init__(self, scrollback, columns, lines, triggers=None):
+        self.scrollback = scrollback
+        self.triggers = triggers
+        self.controls = []
+        super().__init__(columns, lines)
+    
+    @staticmethod
+    def helper_dir():
+        """Directory holding the helper scripts, written on first use"""
+        path = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                            os.path.expanduser('~/.cache'), 'herminal', 'bin')
+        os.makedirs(path, exist_ok=True)
+        for name, command in ScrollbackScreen.HELPERS.items():
+            script = (f"#!/bin/sh\n"
+                      f"printf '\\033]{ScrollbackScreen.CONTROL_OSC};{command}\\007'\n")
+            helper = os.path.join(path, name)
+            try:
+                with open(helper) as f:
+                    if f.read() == script:
+                        continue
+            except OSError:
+                pass
+            with open(helper, 'w') as f:
+                f.write(script)
+            os.chmod(helper, 0o755)
+        return path
+    
+    def herminal_control(self, command):
+        """Collect a command sent over Herminal's private OSC 1729"""
+        if command in self.HELPERS.values():
+            self.control(command)
+    
+    def control(self, command):
+        """Queue a command for the GUI unless one of its kind is queued"""
+        kind = command[:3] if isinstance(command, tuple) else command
+        for queued in self.controls:
+            if (queued[:3] if isinstance(queued, tuple) else queued) == kind:
+                return
+        self.controls.append(command)
+    
+    @property
+    def bracketed_paste(self):
+        """Whether the program turned on bracketed paste (DECSET 2004)"""
+        # pyte keeps private modes shifted left by 5
+        return (2004 << 5) in self.mode
+    
+    @property
+    def app_cursor(self):
+        """Whether the program turned on application cursor keys (DECCKM)"""
+        return (1 << 5) in self.mode
+    
+    def keyboard(self, marker, params):
+        """Apply a kitty keyboard protocol CSI marker params u"""
+        flags = (params[0] if params else 0) & KeyEncoder.KITTY_FLAGS
+        stack = self.keyboard_stack
+        if marker == '>':
+            stack.append(self.keyboard_flags)
+            del stack[:-self.KEYBOARD_DEPTH]
+            self.keyboard_flags = flags
+        elif marker == '<':
+            count = max(params[0] if params else 1, 1)
+            start = max(len(stack) - count, 0)
+            # Popping past the bottom empties the stack and the flags
+            self.keyboard_flags = stack[start] if count <= len(stack) else 0
+            del stack[start:]
+        elif marker == '=':
+            how = params[1] if len(params) > 1 else 1
+            if how == 1:
+                self.keyboard_flags = flags
+            elif how == 2:
+                self.keyboard_flags |= flags
+            elif how == 3:
+                self.keyboard_flags &= ~flags
+        else:
+            self.control(('keyboard', self.keyboard_flags))
+    
+    def cursor_state(self):
+        """Cursor position, screen geometry and the modes input follows"""
+        return (self.cursor.x, self.cursor.y, self.lines, self.columns,
+                self.bracketed_paste, self.app_cursor, self.keyboard_flags)
+    
+    def reset(self):
+        """Reset the screen and forget soft wraps"""
+        self.wrapped = set()
+        self.drawing = False
+        # Text and cell counts of the rows the current line wrapped out of
+        self.partial = ''
+        self.partial_rows = []
+        self.keyboard_flags = 0
+        self.keyboard_stack = []
+        super().reset()
+    
+    def shift_wrapped(self, top, bottom, count):
+        """Move wrap marks of rows top..bottom by count, dropping those pushed out"""
+        moved = {row + count for row in self.wrapped
+                 if top <= row <= bottom and top <= row + count <= bottom}
+        self.wrapped = {row for row in self.wrapped
+                        if not top <= row <= bottom} | moved
+    
+    def draw(self, data):
+        """Display text, noting the rows it wraps out of"""
+        self.drawing = True
+        try:
+            super().draw(data)
+        finally:
+            self.drawing = False
+    
+    def carriage_return(self):
+        """Return to column 0, noting a soft wrap when draw() made it"""
+        if self.drawing:
+            self.wrapped.add(self.cursor.y)
+        super().carriage_return()
+    
+    def index(self):
+        """Move the cursor down, saving the top line if the screen scrolls"""
+        if self.triggers is not None:
+            self.complete_line()
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == bottom:
+            # Only a full-screen scroll moves a line into history
+            if top == 0:
+                self.scrollback.append(
+                    self.line_runs(0),
+                    0 in self.wrapped)
+            if self.wrapped:
+                self.shift_wrapped(top, bottom, -1)
+        super().index()
+    
+    def complete_line(self):
+        """Run the triggers over the cursor row once a linefeed ends its line"""
+        text = self.row_text(self.cursor.y)
+        if self.drawing:
+            # A soft wrap, the line goes on in the next row
+            self.partial += text
+            self.partial_rows.append(len(text))
+            if len(self.partial) > self.MAX_LINE:
+                self.partial = self.partial[-self.MAX_LINE:]
+                self.partial_rows = []
+            return
+        
+        rows = self.partial_rows + [len(text)]
+        text = self.partial + text
+        self.partial = ''
+        self.partial_rows = []
+        for action, pattern, color, start, end in self.triggers.scan(text):
+            if action == 'highlight':
+                self.highlight(rows, len(text) - sum(rows), start, end, color)
+            else:
+                self.control(('trigger', action, pattern, text.rstrip()))
+    
+    def highlight(self, rows, skipped, start, end, color):
+        """Paint a match over the rows of the line ending at the cursor row"""
+        y = self.cursor.y - len(rows) + 1
+        pos = skipped
+        for length in rows:
+            if y >= 0 and pos < end and start < pos + length:
+                row = self.rows[y]
+                table = self.attr_table
+                offset = pos
+                for x in range(self.columns):
+                    if start <= offset < end:
+                        attrs = table[row.attrs[x]]
+                        attrs = (attrs[:1] + (color,) + attrs[2:] if color
+                                 else attrs[:6] + (not attrs[6],) + attrs[7:])
+                        row.attrs[x] = self.attr_id(attrs)
+                    offset += len(self.cells_text(row, x, x + 1))
+                self.dirty.add(y)
+            pos += length
+            y += 1
+    
+    def reverse_index(self):
+        """Move the cursor up, scrolling wrap marks down with the rows"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if self.cursor.y == top and self.wrapped:
+            self.shift_wrapped(top, bottom, 1)
+        super().reverse_index()
+    
+    def insert_lines(self, count=None):
+        """Insert blank lines, moving wrap marks below them down"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom and self.wrapped:
+            self.shift_wrapped(self.cursor.y, bottom, count or 1)
+        super().insert_lines(count)
+    
+    def delete_lines(self, count=None):
+        """Delete lines, moving wrap marks below them up"""
+        top, bottom = self.margins or pyte.screens.Margins(0, self.lines - 1)
+        if top <= self.cursor.y <= bottom and self.wrapped:
+            self.shift_wrapped(self.cursor.y, bottom, -(count or 1))
+        super().delete_lines(count)
+    
+    def erase_in_line(self, how=0, private=False):
+        """Erase part of a line; erasing its end ends a soft wrap"""
+        if how != 1:
+            self.wrapped.discard(self.cursor.y)
+        super().erase_in_line(how, private)
+    
+    def erase_in_display(self, how=0, *args, **kwargs):
+        """Erase part of the display along with its wrap marks"""
+        if how == 0:
+            self.wrapped = {row for row in self.wrapped if row < self.cursor.y}
+        elif how == 1:
+            self.wrapped = {row for row in self.wrapped if row >= self.cursor.y}
+        else:
+            self.wrapped = set()
+        super().erase_in_display(how, *args, **kwargs)
+    
+    def resize(self, lines=None, columns=None):
+        """Resize, keeping the cursor row and saving rows pushed off the top"""
+        lines = lines or self.lines
+        if lines < self.lines:
+            # Like xterm, only scroll away as many rows as the cursor needs
+            drop = max(0, self.cursor.y + 1 - lines)
+            if drop:
+                self.set_margins()
+                y, x = self.cursor.y, self.cursor.x
+                self.cursor_position(1, 1)
+                for row in range(drop):
+                    self.scrollback.append(
+                        self.line_runs(row),
+                        row in self.wrapped)
+                self.delete_lines(drop)
+                self.cursor.y, self.cursor.x = y - drop, x
+            # The rest comes off the bottom, which pyte would cut from the top
+            del self.rows[lines:]
+            self.wrapped = {row for row in self.wrapped if row < lines}
+            # delete_lines() marked rows down to the old bottom
+            self.dirty.intersection_update(range(lines))
+            self.dirty.update(range(lines))
+            self.lines = lines
+        super().resize(lines, columns)
+        self.set_margins()
+
+
+class TerminalStream(pyte.ByteStream):
+    """pyte ByteStream that cuts out kitty keyboard sequences and the private OSC"""
+    
+    SEQUENCES = re.compile(rb'\x1b\[([<=>?])([0-9;]*)u|\x1b\]%d;([a-z]*)(?:\x07|\x1b\\)'
+                           % ScrollbackScreen.CONTROL_OSC)
+    PARTIAL = re.compile(rb'\x1b(\[([<=>?][0-9;]*)?|\][0-9]{0,4}(;[a-z]*\x1b?)?)?\Z')
+    
+    def __init__(self, screen):
+        super().__init__(screen)
+        self.held = b''
+    
+    def feed(self, data):
+        # Readers hand over memoryview slices of their backlog, one copy
+        # makes bytes of them whether or not a tail was held back
+        data = self.held + data if self.held else bytes(data)
+        self.held = b''
+        # An OSC cut before its "ESC \\" ends in another escape
+        for escape in (data.rfind(b'\x1b]', -32), data.rfind(b'\x1b', -32)):
+            if escape >= 0 and self.PARTIAL.match(data, escape):
+                data, self.held = data[:escape], data[escape:]
+                break
+        start = 0
+        for match in self.SEQUENCES.finditer(data):
+            super().feed(data[start:match.start()])
+            if match[3] is not None:
+                self.listener.herminal_control(match[3].decode())
+            else:
+                self.listener.keyboard(match[1].decode(),
+                                       [int(param) for param in match[2].split(b';') if param])
+            start = match.end()
+        super().feed(data[start:] if start else data)
+
+
+class SessionHost:
+    """Headless process that owns shells so they outlive the GUI"""
+    
+    # Messages are marshalled tuples behind a 4-byte length: clients send
+    # new, attach, list, input, paste, cancel, resize, record, kill and
+    # settings, see handle(); the host answers with snapshot, delta,
+    # sessions, closed and detached.
+    READ_SIZE = 64 * 1024
+    # Stop reading a shell while its client is this many rows behind
+    MAX_UNSENT = 100000
+    # Exit after this many seconds without shells or clients
+    LINGER = 10
+    # Settings windows forward to the host's shells
+    SETTINGS = ('scrollback_lines', 'scrollback_mb', 'scrollback_disk', 'triggers')
+    
+    class History(Scrollback):
+        """Scrollback that also queues new rows for the attached client"""
+        
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.unsent = None
+        
+        def append(self, runs, wrapped=False):
+            super().append(runs, wrapped)
+            if self.unsent is not None:
+                self.unsent.append((runs, wrapped))
+    
+    class Session:
+        """A shell owned by the host"""
+        
+        def __init__(self, number, shell, cwd, env, lines, columns, settings):
+            self.number = number
+            self.name = os.path.basename(shell)
+            self.shell = shell
+            self.ptyproc = ptyprocess.PtyProcess.spawn(
+                [shell], cwd=cwd, env=env, dimensions=(lines, columns))
+            os.set_blocking(self.ptyproc.fd, False)
+            self.input = InputQueue()
+            self.history = SessionHost.History(settings['scrollback_lines'],
+                                               settings['scrollback_mb'] * 1024 * 1024)
+            self.history.set_disk(settings['scrollback_disk'])
+            self.screen = ScrollbackScreen(self.history, columns, lines,
+                                           Triggers.compile(settings['triggers']))
+            self.stream = TerminalStream(self.screen)
+            self.backlog = None
+            # Selector events the PTY is registered for
+            self.events = 0
+            self.client = None
+            # Rows changed since the client's last update
+            self.dirty = set()
+            self.pending = False
+            self.recorder = None
+    
+    class Client:
+        """A GUI pane connected to the host"""
+        
+        def __init__(self, sock):
+            self.sock = sock
+            self.inbuf = bytearray()
+            self.outbuf = bytearray()
+            self.session = None
+            self.events = selectors.EVENT_READ
+    
+    def __init__(self):
+        self.settings = HerminalWindow.load_settings()
+        self.selector = selectors.DefaultSelector()
+        self.sessions = {}
+        self.clients = set()
+        self.next_number = 1
+        self.idle_since = time.monotonic()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    
+    def listen(self):
+        """Start listening, False if another host already is"""
+        path = host_path()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+                return False
+            except OSError:
+                pass
+        # A socket file left behind by a host that died
+        if os.path.exists(path):
+            os.unlink(path)
+        self.listener.bind(path)
+        os.chmod(path, 0o600)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ, self.accept)
+        return True
+    
+    @staticmethod
+    def pack(message):
+        """Frame a message for the socket"""
+        data = marshal.dumps(message)
+        return len(data).to_bytes(4, 'big') + data
+    
+    @staticmethod
+    def unpack(buffer):
+        """Remove and return the complete messages at the start of buffer"""
+        messages = []
+        pos = 0
+        while len(buffer) - pos >= 4:
+            end = pos + 4 + int.from_bytes(buffer[pos:pos + 4], 'big')
+            if len(buffer) < end:
+                break
+            messages.append(marshal.loads(buffer[pos + 4:end]))
+            pos = end
+        del buffer[:pos]
+        return messages
+    
+    def run(self):
+        """Serve shells and clients until none are left"""
+        while True:
+            busy = any(session.backlog is not None for session in self.sessions.values())
+            for key, events in self.selector.select(0 if busy else self.LINGER):
+                key.data(events)
+            
+            for session in list(self.sessions.values()):
+                if session.backlog is not None:
+                    self.parse_slice(session)
+                if session.number in self.sessions:
+                    self.watch(session)
+            for client in list(self.clients):
+                self.update_events(client)
+            
+            if self.sessions or self.clients:
+                self.idle_since = time.monotonic()
+            elif time.monotonic() - self.idle_since >= self.LINGER:
+                break
+        
+        self.listener.close()
+        os.unlink(host_path())
+    
+    def accept(self, events):
+        """Take a new client connection"""
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        if not same_user(sock.fileno()):
+            sock.close()
+            return
+        sock.setblocking(False)
+        client = SessionHost.Client(sock)
+        self.clients.add(client)
+        self.selector.register(sock, client.events,
+                               lambda events: self.serve_client(client, events))
+    
+    def watch(self, session):
+        """Read a shell only while its output is parsed and its client keeps up"""
+        unsent = session.history.unsent
+        events = 0
+        if session.backlog is None and not (unsent and len(unsent) >= self.MAX_UNSENT):
+            events |= selectors.EVENT_READ
+        if session.input:
+            events |= selectors.EVENT_WRITE
+        if events != session.events:
+            if not session.events:
+                self.selector.register(session.ptyproc.fd, events,
+                                       lambda events: self.serve_pty(session, events))
+            elif not events:
+                self.selector.unregister(session.ptyproc.fd)
+            else:
+                self.selector.modify(session.ptyproc.fd, events,
+                                     lambda events: self.serve_pty(session, events))
+            session.events = events
+    
+    def serve_pty(self, session, events):
+        """Write queued input to a shell and read its output"""
+        # Ended earlier in the same select() batch
+        if self.sessions.get(session.number) is not session:
+            return
+        try:
+            if events & selectors.EVENT_WRITE:
+                session.input.write(session.ptyproc.fd)
+            if events & selectors.EVENT_READ and session.number in self.sessions:
+                self.read_pty(session)
+        except Exception as e:
+            print(f"Ending session {session.number}: {e!r}")
+            self.end_session(session)
+    
+    def read_pty(self, session):
+        """Read a shell's output into its backlog"""
+        try:
+            output = os.read(session.ptyproc.fd, self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            # Linux raises EIO once the child side is gone
+            output = b''
+        if not output:
+            self.end_session(session)
+            return
+        if session.recorder is not None:
+            session.recorder.output(output)
+        session.backlog = memoryview(output)
+    
+    def parse_slice(self, session):
+        """Parse the next PtyLoop.SLICE bytes of a shell's backlog"""
+        data = session.backlog[:PtyLoop.SLICE]
+        session.backlog = session.backlog[PtyLoop.SLICE:] or None
+        session.stream.feed(data)
+        self.changed(session)
+    
+    def changed(self, session):
+        """Note that the screen moved on since the client's last update"""
+        if session.client is not None:
+            session.dirty.update(session.screen.dirty)
+            session.pending = True
+        else:
+            # Nobody to open a dialog for
+            session.screen.controls.clear()
+        session.screen.dirty.clear()
+    
+    def end_session(self, session):
+        """Forget a shell that exited or was killed"""
+        if self.sessions.pop(session.number, None) is None:
+            return
+        if session.events:
+            self.selector.unregister(session.ptyproc.fd)
+        try:
+            session.ptyproc.close(force=True)
+        except Exception:
+            pass
+        session.history.close()
+        self.record(session, None)
+        client = session.client
+        if client is not None:
+            self.queue_update(client)
+            client.outbuf += self.pack(('closed',))
+            client.session = None
+    
+    def serve_client(self, client, events):
+        """Read a client's requests and send it what it is owed"""
+        if client not in self.clients:
+            return
+        try:
+            self.serve_requests(client, events)
+        except Exception as e:
+            print(f"Dropping client: {e!r}")
+            self.drop_client(client)
+    
+    def serve_requests(self, client, events):
+        """Read and act on a client's requests, then flush its updates"""
+        if events & selectors.EVENT_READ:
+            try:
+                data = client.sock.recv(self.READ_SIZE)
+            except BlockingIOError:
+                data = None
+            except OSError:
+                data = b''
+            if data == b'':
+                self.drop_client(client)
+                return
+            if data:
+                client.inbuf += data
+                for message in self.unpack(client.inbuf):
+                    self.handle(client, message)
+        if events & selectors.EVENT_WRITE:
+            self.flush(client)
+    
+    def handle(self, client, message):
+        """Act on one client request"""
+        kind = message[0]
+        session = client.session
+        if kind == 'new':
+            _, lines, columns, cwd, shell, env = message
+            try:
+                session = SessionHost.Session(self.next_number, shell, cwd, env,
+                                              lines, columns, self.settings)
+            except Exception as e:
+                client.outbuf += self.pack(('closed', str(e)))
+                return
+            self.sessions[session.number] = session
+            self.next_number += 1
+            self.attach(client, session, lines, columns)
+        elif kind == 'attach':
+            _, number, lines, columns = message
+            session = self.sessions.get(number)
+            if session is None:
+                client.outbuf += self.pack(('closed',))
+                return
+            self.attach(client, session, lines, columns)
+        elif kind == 'settings':
+            self.apply_settings(message[1])
+        elif kind == 'list':
+            client.outbuf += self.pack(('sessions', [
+                (number, session.name, session.client is not None)
+                for number, session in sorted(self.sessions.items())]))
+        elif session is None:
+            # Input racing the shell's exit
+            return
+        elif kind == 'input':
+            session.input.key(message[1])
+        elif kind == 'paste':
+            session.input.paste(message[1], session.screen.bracketed_paste)
+        elif kind == 'cancel':
+            session.input.cancel_paste()
+        elif kind == 'resize':
+            self.resize(session, *message[1:])
+        elif kind == 'record':
+            self.record(session, message[1])
+        elif kind == 'kill':
+            self.end_session(session)
+    
+    def apply_settings(self, values):
+        """Take settings changed in a window to new and running shells"""
+        self.settings.update((key, values[key]) for key in self.SETTINGS if key in values)
+        triggers = Triggers.compile(self.settings['triggers'])
+        for session in self.sessions.values():
+            session.history.set_limits(self.settings['scrollback_lines'],
+                                       self.settings['scrollback_mb'] * 1024 * 1024)
+            session.history.set_disk(self.settings['scrollback_disk'])
+            session.screen.triggers = triggers
+    
+    def attach(self, client, session, lines, columns):
+        """Hand a session to a client, starting with a snapshot"""
+        if client.session is not None:
+            client.session.client = None
+            client.session.history.unsent = None
+        previous = session.client
+        if previous is not None and previous is not client:
+            previous.session = None
+            previous.outbuf += self.pack(('detached',))
+        session.client = client
+        client.session = session
+        self.resize(session, lines, columns)
+        
+        history = session.history
+        history.unsent = []
+        screen = session.screen
+        entries = [history.entry(line) for line in range(history.first, history.total)]
+        rows = {row: screen.line_runs(row)
+                for row in range(screen.lines)}
+        session.dirty.clear()
+        session.pending = False
+        client.outbuf += self.pack(('snapshot', entries, history.attr_table, history.open,
+                                    rows, self.cursor(session)))
+    
+    def resize(self, session, lines, columns):
+        """Resize a shell's screen and tell the shell"""
+        if (lines, columns) == (session.screen.lines, session.screen.columns):
+            return
+        # Sends SIGWINCH to the foreground process group
+        session.ptyproc.setwinsize(lines, columns)
+        session.screen.resize(lines, columns)
+        if session.recorder is not None:
+            session.recorder.resize(columns, lines)
+        self.changed(session)
+    
+    def record(self, session, path):
+        """Start recording a shell's output to path, or stop at None"""
+        if session.recorder is not None:
+            session.recorder.close()
+            session.recorder = None
+        if path is None:
+            return
+        try:
+            session.recorder = SessionRecorder(path, session.screen.columns,
+                                               session.screen.lines, session.shell)
+        except OSError as e:
+            session.screen.control(('status', f"Error: {e}"))
+            self.changed(session)
+    
+    @staticmethod
+    def cursor(session):
+        """Cursor position, screen geometry and input modes"""
+        return session.screen.cursor_state()
+    
+    def queue_update(self, client):
+        """Queue the history and rows changed since the client's last update"""
+        session = client.session
+        if session is None or not session.pending:
+            return
+        history = session.history.unsent
+        session.history.unsent = []
+        screen = session.screen
+        rows = {row: screen.line_runs(row)
+                for row in session.dirty if row < screen.lines}
+        session.dirty.clear()
+        session.pending = False
+        controls = screen.controls
+        screen.controls = []
+        client.outbuf += self.pack(('delta', history, rows, self.cursor(session), controls))
+    
+    def flush(self, client):
+        """Send as much as the client's socket takes"""
+        if not client.outbuf:
+            # Only build an update once the last one went out
+            self.queue_update(client)
+        try:
+            sent = client.sock.send(client.outbuf)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.drop_client(client)
+            return
+        del client.outbuf[:sent]
+    
+    def update_events(self, client):
+        """Wait for the client's socket to drain only when there is news"""
+        session = client.session
+        events = selectors.EVENT_READ
+        if client.outbuf or (session is not None and session.pending):
+            events |= selectors.EVENT_WRITE
+        if events != client.events:
+            self.selector.modify(client.sock, events, self.selector.get_key(client.sock).data)
+            client.events = events
+    
+    def drop_client(self, client):
+        """Forget a disconnected client, its session keeps running detached"""
+        if client not in self.clients:
+            return
+        self.selector.unregister(client.sock)
+        client.sock.close()
+        self.clients.discard(client)
+        session = client.session
+        if session is not None:
+            session.client = None
+            session.history.unsent = None
+            session.dirty.clear()
+            session.pending = False
+
+
+class HostLink:
+    """A pane's connection to its shell in the SessionHost"""
+    
+    def __init__(self):
+        self.sock = self.connect()
+        self.inbuf = bytearray()
+        self.received = 0
+        # Input comes from the GUI thread, resizes from the loop thread
+        self.lock = threading.Lock()
+    
+    @property
+    def fd(self):
+        return self.sock.fileno()
+    
+    @staticmethod
+    def connect(start=True):
+        """Connect to the host, starting it first if needed"""
+        path = host_path()
+        for attempt in range(100):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(path)
+            except OSError:
+                sock.close()
+                if not start:
+                    raise
+            else:
+                if same_user(sock.fileno()):
+                    return sock
+                sock.close()
+                raise OSError(f"{path} belongs to another user")
+            if attempt == 0:
+                # A new session keeps the host out of the window's process group
+                subprocess.Popen([sys.executable, os.path.abspath(__file__), '--host'],
+                                 stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.DEVNULL, start_new_session=True)
+            time.sleep(0.05)
+        raise OSError(f"Session host did not start on {path}")
+    
+    @staticmethod
+    def list_sessions():
+        """Return (number, name, attached) for the host's sessions, [] if none runs"""
+        try:
+            sock = HostLink.connect(start=False)
+        except OSError:
+            return []
+        with sock:
+            sock.settimeout(2)
+            sock.sendall(SessionHost.pack(('list',)))
+            buffer = bytearray()
+            while True:
+                data = sock.recv(65536)
+                if not data:
+                    return []
+                buffer += data
+                messages = SessionHost.unpack(buffer)
+                if messages:
+                    return messages[0][1]
+    
+    def request(self, message):
+        """Send a request to the host"""
+        with self.lock:
+            self.sock.sendall(SessionHost.pack(message))
+    
+    def receive(self):
+        """Return the messages that arrived, EOFError once the host is gone"""
+        data = self.sock.recv(1024 * 1024)
+        if not data:
+            raise EOFError
+        self.received += len(data)
+        self.inbuf += data
+        return SessionHost.unpack(self.inbuf)
+    
+    def close(self):
+        """Close the connection, which detaches the session"""
+        self.sock.close()
+
+
+class SettingsDialog(QDialog):
+    """Settings dialog for customizing terminal appearance"""
+    
+    def __init__(self, parent=None, current_settings=None):
+        super().__init__(parent)
+        self.setWindowTitle("⚙️ Terminal Settings")
+        self.setModal(True)
+        self.resize(500, 450)
+        
+        self.settings = current_settings or {}
+        self.setup_ui()
+    
+    def apply_theme_to_dialog(self, settings):
+        """Apply current theme colors to the settings dialog"""
+        bg_color = settings['bg_color']
+        text_color = settings['text_color']
+        sel_color = settings['selection_color']
+        
+        # Darken background for dialog
+        bg_q = QColor(bg_color)
+        dialog_bg = QColor(
+            max(0, bg_q.red() - 20),
+            max(0, bg_q.green() - 20),
+            max(0, bg_q.blue() - 20)
+        ).name()
+        
+        # Lighten selection color for buttons
+        sel_q = QColor(sel_color)
+        btn_hover = sel_q.lighter(120).name()
+        
+        # Style the dialog with current theme
+        self.setStyleSheet(f"""
+            QDialog {{
+                background-color: {dialog_bg};
+                color: {text_color};
+            }}
+            QLabel {{
+                color: {text_color};
+            }}
+            QPushButton {{
+                background-color: {sel_color};
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 6px 12px;
+            }}
+            QPushButton:hover {{
+                background-color: {btn_hover};
+            }}
+            QSpinBox, QFontComboBox, QComboBox {{
+                background-color: {bg_color};
+                color: {text_color};
+                border: 1px solid {sel_color};
+                border-radius: 3px;
+                padding: 4px;
+            }}
+            QSpinBox::up-button, QSpinBox::down-button {{
+                background-color: {sel_color};
+                border: none;
+            }}
+            QSpinBox::up-button:hover, QSpinBox::down-button:hover {{
+                background-color: {btn_hover};
+            }}
+            QComboBox::drop-down {{
+                background-color: {sel_color};
+                border: none;
+            }}
+            QComboBox QAbstractItemView {{
+                background-color: {dialog_bg};
+                color: {text_color};
+                selection-background-color: {sel_color};
+            }}
+        """)
+        
+    def setup_ui(self):
+        layout = QVBoxLayout()
         
         # Form layout for settings
         form = QFormLayout()
         
-        # Background color
-        bg_layout = QHBoxLayout()
-        self.bg_color = self.settings.get('bg_color', '#1a0a2e')
-        self.bg_preview = QLabel()
-        self.bg_preview.setFixedSize(50, 30)
-        self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
-        bg_btn = QPushButton("Choose Color")
-        bg_btn.clicked.connect(lambda: self.choose_color('bg'))
-        bg_layout.addWidget(self.bg_preview)
-        bg_layout.addWidget(bg_btn)
-        bg_layout.addStretch()
-        form.addRow("Background Color:", bg_layout)
+        # Background color
+        bg_layout = QHBoxLayout()
+        self.bg_color = self.settings.get('bg_color', '#1a0a2e')
+        self.bg_preview = QLabel()
+        self.bg_preview.setFixedSize(50, 30)
+        self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
+        bg_btn = QPushButton("Choose Color")
+        bg_btn.clicked.connect(lambda: self.choose_color('bg'))
+        bg_layout.addWidget(self.bg_preview)
+        bg_layout.addWidget(bg_btn)
+        bg_layout.addStretch()
+        form.addRow("Background Color:", bg_layout)
+        
+        # Text color
+        text_layout = QHBoxLayout()
+        self.text_color = self.settings.get('text_color', '#e0d0ff')
+        self.text_preview = QLabel()
+        self.text_preview.setFixedSize(50, 30)
+        self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
+        text_btn = QPushButton("Choose Color")
+        text_btn.clicked.connect(lambda: self.choose_color('text'))
+        text_layout.addWidget(self.text_preview)
+        text_layout.addWidget(text_btn)
+        text_layout.addStretch()
+        form.addRow("Text Color:", text_layout)
+        
+        # Selection color
+        sel_layout = QHBoxLayout()
+        self.sel_color = self.settings.get('selection_color', '#6a4c93')
+        self.sel_preview = QLabel()
+        self.sel_preview.setFixedSize(50, 30)
+        self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
+        sel_btn = QPushButton("Choose Color")
+        sel_btn.clicked.connect(lambda: self.choose_color('sel'))
+        sel_layout.addWidget(self.sel_preview)
+        sel_layout.addWidget(sel_btn)
+        sel_layout.addStretch()
+        form.addRow("Selection Color:", sel_layout)
+        
+        # Font family
+        self.font_combo = QFontComboBox()
+        self.font_combo.setFontFilters(QFontComboBox.FontFilter.MonospacedFonts)
+        current_font = self.settings.get('font_family', 'Consolas')
+        self.font_combo.setCurrentFont(QFont(current_font))
+        form.addRow("Font Family:", self.font_combo)
+        
+        # Font size
+        self.font_size = QSpinBox()
+        self.font_size.setRange(8, 24)
+        self.font_size.setValue(self.settings.get('font_size', 11))
+        form.addRow("Font Size:", self.font_size)
+        
+        # Cursor style
+        self.cursor_style = QComboBox()
+        self.cursor_style.addItems(["Block", "Underline", "Beam"])
+        self.cursor_style.setCurrentText(self.settings.get('cursor_style', 'Block'))
+        form.addRow("Cursor Style:", self.cursor_style)
+        
+        # Renderer
+        self.renderer = QComboBox()
+        self.renderer.addItem("Text Document", 'text')
+        self.renderer.addItem("Cell Grid", 'grid')
+        self.renderer.setCurrentIndex(self.renderer.findData(self.settings.get('renderer', 'text')))
+        self.renderer.setToolTip("Cell Grid paints the screen directly and is faster for full-screen apps")
+        form.addRow("Renderer:", self.renderer)
+        
+        # Opacity/Transparency
+        self.opacity = QSpinBox()
+        self.opacity.setRange(10, 100)
+        self.opacity.setValue(self.settings.get('opacity', 100))
+        self.opacity.setSuffix("%")
+        self.opacity.setToolTip("Lower values make the window more transparent")
+        form.addRow("Transparency:", self.opacity)
+        
+        # Render rate limit
+        self.max_fps = QSpinBox()
+        self.max_fps.setRange(10, 240)
+        self.max_fps.setValue(self.settings.get('max_fps', 60))
+        self.max_fps.setSuffix(" fps")
+        self.max_fps.setToolTip("Upper bound on screen repaints per second during bulk output")
+        form.addRow("Max Frame Rate:", self.max_fps)
+        
+        # Scrollback size
+        self.scrollback_lines = QSpinBox()
+        self.scrollback_lines.setRange(0, 10000000)
+        self.scrollback_lines.setSingleStep(10000)
+        self.scrollback_lines.setValue(self.settings.get('scrollback_lines', 100000))
+        self.scrollback_lines.setSuffix(" lines")
+        form.addRow("Scrollback:", self.scrollback_lines)
+        
+        self.scrollback_disk = QCheckBox("Keep older history on disk")
+        self.scrollback_disk.setChecked(self.settings.get('scrollback_disk', False))
+        self.scrollback_disk.setToolTip("Lines beyond the scrollback limit are compressed to ~/.cache/herminal")
+        form.addRow("", self.scrollback_disk)
+        
+        self.parse_worker = QCheckBox("Parse output in a worker process")
+        self.parse_worker.setChecked(self.settings.get('parse_worker', False))
+        self.parse_worker.setToolTip("Heavy output in one tab no longer slows down typing in others. "
+                                     "Applies to tabs and panes opened afterwards")
+        form.addRow("", self.parse_worker)
+        
+        self.session_host = QCheckBox("Keep shells running in a session host")
+        self.session_host.setChecked(self.settings.get('session_host', False))
+        self.session_host.setToolTip("Shells outlive their window and are reattached when Herminal "
+                                     "starts again. Applies to tabs and panes opened afterwards")
+        form.addRow("", self.session_host)
+        
+        self.kitty_keyboard = QCheckBox("Kitty keyboard protocol")
+        self.kitty_keyboard.setChecked(self.settings.get('kitty_keyboard', False))
+        self.kitty_keyboard.setToolTip("Programs that ask for it get every key and modifier "
+                                       "unambiguously, e.g. Ctrl+I apart from Tab")
+        form.addRow("", self.kitty_keyboard)
+        
+        layout.addLayout(form)
+        
+        # Preset themes
+        layout.addWidget(QLabel("\n📦 Preset Themes:"))
+        
+        # Create scrollable theme grid
+        themes_widget = QWidget()
+        themes_layout = QVBoxLayout()
+        
+        # Row 1
+        row1 = QHBoxLayout()
+        themes = [
+            ('purple', '🌙 Purple Night'),
+            ('ocean', '🌊 Ocean'),
+            ('forest', '🌳 Forest'),
+            ('fire', '🔥 Fire'),
+            ('sunset', '🌅 Sunset')
+        ]
+        for theme_id, theme_name in themes:
+            btn = QPushButton(theme_name)
+            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
+            row1.addWidget(btn)
+        themes_layout.addLayout(row1)
+        
+        # Row 2
+        row2 = QHBoxLayout()
+        themes = [
+            ('dracula', '🧛 Dracula'),
+            ('monokai', '🎨 Monokai'),
+            ('solarized_dark', '☀️ Solarized Dark'),
+            ('nord', '❄️ Nord'),
+            ('gruvbox', '🍂 Gruvbox')
+        ]
+        for theme_id, theme_name in themes:
+            btn = QPushButton(theme_name)
+            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
+            row2.addWidget(btn)
+        themes_layout.addLayout(row2)
+        
+        # Row 3
+        row3 = QHBoxLayout()
+        themes = [
+            ('tokyo_night', '🗼 Tokyo Night'),
+            ('cyberpunk', '🤖 Cyberpunk'),
+            ('matrix', '💚 Matrix'),
+            ('amber', '🟠 Amber'),
+            ('synthwave', '🌆 Synthwave')
+        ]
+        for theme_id, theme_name in themes:
+            btn = QPushButton(theme_name)
+            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
+            row3.addWidget(btn)
+        themes_layout.addLayout(row3)
+        
+        # Row 4
+        row4 = QHBoxLayout()
+        themes = [
+            ('cherry_blossom', '🌸 Cherry Blossom'),
+            ('lavender', '💜 Lavender'),
+            ('mint', '🍃 Mint'),
+            ('coffee', '☕ Coffee'),
+            ('midnight', '🌃 Midnight')
+        ]
+        for theme_id, theme_name in themes:
+            btn = QPushButton(theme_name)
+            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
+            row4.addWidget(btn)
+        themes_layout.addLayout(row4)
+        
+        themes_widget.setLayout(themes_layout)
+        layout.addWidget(themes_widget)
+        
+        # Buttons
+        button_layout = QHBoxLayout()
+        
+        save_btn = QPushButton("💾 Save")
+        save_btn.clicked.connect(self.accept)
+        save_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #6a4c93;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 20px;
+                font-weight: bold;
+            }
+            QPushButton:hover {
+                background-color: #8b5fbf;
+            }
+        """)
+        
+        cancel_btn = QPushButton("❌ Cancel")
+        cancel_btn.clicked.connect(self.reject)
+        cancel_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #555;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 20px;
+            }
+            QPushButton:hover {
+                background-color: #777;
+            }
+        """)
+        
+        reset_btn = QPushButton("🔄 Reset")
+        reset_btn.clicked.connect(self.reset_defaults)
+        reset_btn.setStyleSheet("""
+            QPushButton {
+                background-color: #d9534f;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 8px 20px;
+            }
+            QPushButton:hover {
+                background-color: #c9302c;
+            }
+        """)
+        
+        button_layout.addWidget(reset_btn)
+        button_layout.addStretch()
+        button_layout.addWidget(cancel_btn)
+        button_layout.addWidget(save_btn)
+        
+        layout.addLayout(button_layout)
+        
+        self.setLayout(layout)
+        
+        # Style the dialog
+        self.setStyleSheet("""
+            QDialog {
+                background-color: #2d1b4e;
+                color: #e0d0ff;
+            }
+            QLabel {
+                color: #e0d0ff;
+            }
+            QPushButton {
+                background-color: #6a4c93;
+                color: white;
+                border: none;
+                border-radius: 4px;
+                padding: 6px 12px;
+            }
+            QPushButton:hover {
+                background-color: #8b5fbf;
+            }
+            QSpinBox, QFontComboBox, QComboBox {
+                background-color: #1a0a2e;
+                color: #e0d0ff;
+                border: 1px solid #6a4c93;
+                border-radius: 3px;
+                padding: 4px;
+            }
+        """)
+        
+    def choose_color(self, color_type):
+        """Open color picker dialog"""
+        if color_type == 'bg':
+            current = QColor(self.bg_color)
+        elif color_type == 'text':
+            current = QColor(self.text_color)
+        else:
+            current = QColor(self.sel_color)
+            
+        color = QColorDialog.getColor(current, self, "Choose Color")
+        
+        if color.isValid():
+            hex_color = color.name()
+            if color_type == 'bg':
+                self.bg_color = hex_color
+                self.bg_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
+            elif color_type == 'text':
+                self.text_color = hex_color
+                self.text_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
+            else:
+                self.sel_color = hex_color
+                self.sel_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
+    
+    def apply_preset(self, theme):
+        """Apply a preset theme"""
+        presets = {
+            'purple': {
+                'bg_color': '#1a0a2e',
+                'text_color': '#e0d0ff',
+                'selection_color': '#6a4c93'
+            },
+            'ocean': {
+                'bg_color': '#001f3f',
+                'text_color': '#7fdbff',
+                'selection_color': '#0074d9'
+            },
+            'forest': {
+                'bg_color': '#0d1f0d',
+                'text_color': '#90ee90',
+                'selection_color': '#2d5a2d'
+            },
+            'fire': {
+                'bg_color': '#1a0a00',
+                'text_color': '#ffcc99',
+                'selection_color': '#cc3300'
+            },
+            'sunset': {
+                'bg_color': '#2d1b2e',
+                'text_color': '#ffb347',
+                'selection_color': '#ff6b9d'
+            },
+            'dracula': {
+                'bg_color': '#282a36',
+                'text_color': '#f8f8f2',
+                'selection_color': '#44475a'
+            },
+            'monokai': {
+                'bg_color': '#272822',
+                'text_color': '#f8f8f2',
+                'selection_color': '#49483e'
+            },
+            'solarized_dark': {
+                'bg_color': '#002b36',
+                'text_color': '#839496',
+                'selection_color': '#073642'
+            },
+            'nord': {
+                'bg_color': '#2e3440',
+                'text_color': '#d8dee9',
+                'selection_color': '#434c5e'
+            },
+            'gruvbox': {
+                'bg_color': '#282828',
+                'text_color': '#ebdbb2',
+                'selection_color': '#504945'
+            },
+            'tokyo_night': {
+                'bg_color': '#1a1b26',
+                'text_color': '#c0caf5',
+                'selection_color': '#414868'
+            },
+            'cyberpunk': {
+                'bg_color': '#0a0e27',
+                'text_color': '#00ff9f',
+                'selection_color': '#ff00ff'
+            },
+            'matrix': {
+                'bg_color': '#000000',
+                'text_color': '#00ff00',
+                'selection_color': '#003300'
+            },
+            'amber': {
+                'bg_color': '#1a1200',
+                'text_color': '#ffb000',
+                'selection_color': '#664400'
+            },
+            'synthwave': {
+                'bg_color': '#2b213a',
+                'text_color': '#ff7edb',
+                'selection_color': '#6d77b3'
+            },
+            'cherry_blossom': {
+                'bg_color': '#2d1a2e',
+                'text_color': '#ffb3d9',
+                'selection_color': '#944d6b'
+            },
+            'lavender': {
+                'bg_color': '#1e1433',
+                'text_color': '#e6d9ff',
+                'selection_color': '#7b68a6'
+            },
+            'mint': {
+                'bg_color': '#0f2922',
+                'text_color': '#98ff98',
+                'selection_color': '#2d5a4a'
+            },
+            'coffee': {
+                'bg_color': '#1a0f0a',
+                'text_color': '#d4a574',
+                'selection_color': '#6b4423'
+            },
+            'midnight': {
+                'bg_color': '#0c0f1a',
+                'text_color': '#a8b5d1',
+                'selection_color': '#1e2742'
+            }
+        }
+        
+        if theme in presets:
+            preset = presets[theme]
+            self.bg_color = preset['bg_color']
+            self.text_color = preset['text_color']
+            self.sel_color = preset['selection_color']
+            
+            self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
+            self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
+            self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
+    
+    def reset_defaults(self):
+        """Reset to default settings"""
+        self.bg_color = '#1a0a2e'
+        self.text_color = '#e0d0ff'
+        self.sel_color = '#6a4c93'
+        
+        self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
+        self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
+        self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
+        
+        self.font_combo.setCurrentFont(QFont('Consolas'))
+        self.font_size.setValue(11)
+        self.cursor_style.setCurrentText('Block')
+        self.renderer.setCurrentIndex(self.renderer.findData('text'))
+        self.opacity.setValue(100)
+        self.max_fps.setValue(60)
+        self.scrollback_lines.setValue(100000)
+        self.scrollback_disk.setChecked(False)
+        self.parse_worker.setChecked(False)
+        self.session_host.setChecked(False)
+        self.kitty_keyboard.setChecked(False)
+    
+    def get_settings(self):
+        """Return current settings"""
+        # Keep keys this dialog doesn't edit
+        settings = dict(self.settings)
+        settings.update({
+            'bg_color': self.bg_color,
+            'text_color': self.text_color,
+            'selection_color': self.sel_color,
+            'font_family': self.font_combo.currentFont().family(),
+            'font_size': self.font_size.value(),
+            'cursor_style': self.cursor_style.currentText(),
+            'renderer': self.renderer.currentData(),
+            'opacity': self.opacity.value(),
+            'max_fps': self.max_fps.value(),
+            'scrollback_lines': self.scrollback_lines.value(),
+            'scrollback_disk': self.scrollback_disk.isChecked(),
+            'parse_worker': self.parse_worker.isChecked(),
+            'session_host': self.session_host.isChecked(),
+            'kitty_keyboard': self.kitty_keyboard.isChecked()
+        })
+        return settings
+
+
+class TerminalGridView(QWidget):
+    """Paint the terminal cell grid directly with QPainter and a glyph cache"""
+    
+    PADDING = 10
+    # Entries a glyph or style cache holds before it starts over, so a
+    # flood of true colors cannot grow them forever
+    CACHE_LIMIT = 8192
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.setAttribute(Qt.WidgetAttribute.WA_OpaquePaintEvent)
+        
+        self.lines = []
+        self.cursor_x = 0
+        self.cursor_y = 0
+        self.cursor_style = 'Block'
+        self.bg_color = QColor('#1a0a2e')
+        self.text_color = QColor('#e0d0ff')
+        
+        # (char, color, bold, italic) -> QPixmap, valid for the current font only
+        self.glyph_cache = {}
+        # run attributes -> (fg, bg, bold, italic, underline, strikeout)
+        self.styles = {}
+        self.set_font(self.font())
+        # Painting time goes to the session's PerfStats when set
+        self.perf = None
+    
+    def set_font(self, font):
+        """Use a new font and measure its cell size"""
+        self.setFont(font)
+        self.fonts = {}
+        for bold in (False, True):
+            for italic in (False, True):
+                variant = QFont(font)
+                variant.setBold(bold)
+                variant.setItalic(italic)
+                self.fonts[bold, italic] = variant
+        metrics = QFontMetrics(font)
+        self.cell_width = max(1, metrics.horizontalAdvance('M'))
+        self.cell_height = max(1, metrics.height())
+        self.ascent = metrics.ascent()
+        self.glyph_cache.clear()
+        self.update()
+    
+    def set_colors(self, bg_color, text_color, cursor_style):
+        """Apply theme colors and the cursor style"""
+        self.bg_color = QColor(bg_color)
+        self.text_color = QColor(text_color)
+        self.cursor_style = cursor_style
+        self.glyph_cache.clear()
+        self.styles.clear()
+        self.update()
+    
+    def update_lines(self, lines, cursor_attr):
+        """Store changed rows and repaint just their strips"""
+        rows = cursor_attr['lines']
+        if len(self.lines) != rows:
+            self.lines = (self.lines + [()] * rows)[:rows]
+            self.update()
+        
+        for row, line in lines.items():
+            if row < rows and self.lines[row] != line:
+                self.lines[row] = line
+                self.update_row(row)
+        
+        # Repaint where the cursor was and where it is now
+        if (cursor_attr['x'], cursor_attr['y']) != (self.cursor_x, self.cursor_y):
+            self.update_row(self.cursor_y)
+            self.cursor_x = cursor_attr['x']
+            self.cursor_y = cursor_attr['y']
+            self.update_row(self.cursor_y)
+    
+    def update_row(self, row):
+        """Schedule a repaint of one screen row"""
+        top = self.PADDING + row * self.cell_height
+        self.update(QRect(0, top, self.width(), self.cell_height))
+    
+    def style(self, attrs):
+        """Return the cached paint style for a run's attributes"""
+        style = self.styles.get(attrs)
+        if style is None:
+            if len(self.styles) >= self.CACHE_LIMIT:
+                self.styles.clear()
+            fg, bg = ANSIParser.resolve(attrs, self.text_color, self.bg_color)
+            style = self.styles[attrs] = (fg, bg, attrs[2], attrs[3],
+                                          attrs[4], attrs[5])
+        return style
+    
+    def glyph(self, char, color, bold=False, italic=False):
+        """Return the cached pixmap for a character"""
+        key = (char, color.rgba(), bold, italic)
+        pixmap = self.glyph_cache.get(key)
+        if pixmap is None:
+            ratio = self.devicePixelRatioF()
+            width = self.cell_width * max(1, wcwidth(char))
+            pixmap = QPixmap(int(width * ratio), int(self.cell_height * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.GlobalColor.transparent)
+            painter = QPainter(pixmap)
+            painter.setFont(self.fonts[bold, italic])
+            painter.setPen(color)
+            painter.drawText(0, self.ascent, char)
+            painter.end()
+            if len(self.glyph_cache) >= self.CACHE_LIMIT:
+                self.glyph_cache.clear()
+            self.glyph_cache[key] = pixmap
+        return pixmap
+    
+    def paintEvent(self, event):
+        """Blit the glyphs of every row inside the exposed area"""
+        start = time.perf_counter()
+        painter = QPainter(self)
+        rect = event.rect()
+        painter.fillRect(rect, self.bg_color)
+        
+        cell_w, cell_h = self.cell_width, self.cell_height
+        first = max(0, (rect.top() - self.PADDING) // cell_h)
+        last = min(len(self.lines) - 1, (rect.bottom() - self.PADDING) // cell_h)
+        
+        for row in range(first, last + 1):
+            top = self.PADDING + row * cell_h
+            x = 0
+            for text, attrs in self.lines[row]:
+                fg, bg, bold, italic, underline, strikeout = self.style(attrs)
+                if text.isascii():
+                    widths = None
+                    cells = len(text)
+                else:
+                    widths = [max(wcwidth(char), 1) for char in text]
+                    cells = sum(widths)
+                left = self.PADDING + x * cell_w
+                
+                if bg is not None:
+                    painter.fillRect(left, top, cells * cell_w, cell_h, bg)
+                for i, char in enumerate(text):
+                    if char != ' ':
+                        painter.drawPixmap(self.PADDING + x * cell_w, top,
+                                           self.glyph(char, fg, bold, italic))
+                    x += widths[i] if widths else 1
+                if underline:
+                    painter.fillRect(left, top + self.ascent + 1,
+                                     cells * cell_w, 1, fg)
+                if strikeout:
+                    painter.fillRect(left, top + cell_h // 2,
+                                     cells * cell_w, 1, fg)
+        
+        self.paint_cursor(painter)
+        painter.end()
+        if self.perf is not None:
+            self.perf.render_time += time.perf_counter() - start
+    
+    def paint_cursor(self, painter):
+        """Draw the cursor in the configured style"""
+        if not 0 <= self.cursor_y < len(self.lines):
+            return
+        left = self.PADDING + self.cursor_x * self.cell_width
+        top = self.PADDING + self.cursor_y * self.cell_height
+        
+        if self.cursor_style == 'Underline':
+            painter.fillRect(left, top + self.cell_height - 2,
+                             self.cell_width, 2, self.text_color)
+        elif self.cursor_style == 'Beam':
+            painter.fillRect(left, top, 2, self.cell_height, self.text_color)
+        else:
+            painter.fillRect(left, top, self.cell_width, self.cell_height,
+                             self.text_color)
+            # Redraw the covered character in the background color
+            char = self.char_at(self.cursor_y, self.cursor_x)
+            if char.strip():
+                painter.drawPixmap(left, top, self.glyph(char, self.bg_color))
+    
+    def char_at(self, row, column):
+        """Return the character drawn at a cell, '' if there is none"""
+        x = 0
+        for text, attrs in self.lines[row]:
+            for char in text:
+                if x == column:
+                    return char
+                x += max(wcwidth(char), 1)
+        return ''
+
+
+class EnhancedTerminal(QWidget):
+    """One shell session: its PTY, emulator, scrollback and view"""
+    
+    # Output arriving this soon after a key press is painted immediately
+    INTERACTIVE_WINDOW = 0.05
+    # Screen size until the window reports its real size
+    COLUMNS = 100
+    ROWS = 30
+    # Quiet time after the last resize event before the child is told
+    RESIZE_DELAY = 100
+    # PTY read buffer bounds, the reader adapts between them
+    READ_MIN = 64 * 1024
+    READ_MAX = 1024 * 1024
+    # Shortest time between two firings of a trigger or private OSC command
+    TRIGGER_INTERVAL = 1.0
+    
+    def __init__(self, main_window, attach=None, replay=None):
+        super().__init__()
+        self.main_window = main_window
+        self.loop = main_window.loop
+        
+        self.setup_ui()
+        self.setup_terminal(attach, replay)
+        self.apply_settings()
+        
+        self.command_history = []
+        self.history_index = -1
+        self.current_line = ""
+    
+    @property
+    def settings(self):
+        """Settings are shared by every session of the window"""
+        return self.main_window.settings
+    
+    def setup_ui(self):
+        """Setup the user interface"""
+        main_layout = QVBoxLayout()
+        main_layout.setContentsMargins(0, 0, 0, 0)
+        main_layout.setSpacing(0)
+        
+        # Terminal output area
+        self.output = QPlainTextEdit()
+        self.output.setReadOnly(True)
+        # Lines are rewritten in place every frame, an undo stack only grows
+        self.output.setUndoRedoEnabled(False)
+        
+        # History is scrolled with our own scrollbar, the document only
+        # ever holds what is on screen
+        self.output.setVerticalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.output.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        
+        # Alternative renderer that paints the cell grid directly
+        self.grid = TerminalGridView()
+        self.grid.hide()
+        self.view = self.output
+        
+        # Performance counters and their overlay, hidden until Ctrl+Shift+P
+        self.perf = PerfStats()
+        self.grid.perf = self.perf
+        self.hud = QLabel(self)
+        self.hud.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+        self.hud.hide()
+        self.hud_timer = QTimer(self)
+        self.hud_timer.timeout.connect(self.update_hud)
+        
+        # Scrollback position, 0 means following live output
+        self.scroll_offset = 0
+        self.history_seen = 0
+        # Rows of history at the screen width, measured lazily
+        self.layout = None
+        self.layout_timer = QTimer(self)
+        self.layout_timer.timeout.connect(self.measure_layout)
+        self.scrollbar = QScrollBar(Qt.Orientation.Vertical)
+        self.scrollbar.setRange(0, 0)
+        self.scrollbar.valueChanged.connect(
+            lambda value: self.scroll_to(self.scrollbar.maximum() - value))
+        
+        view_layout = QHBoxLayout()
+        view_layout.setContentsMargins(0, 0, 0, 0)
+        view_layout.setSpacing(0)
+        view_layout.addWidget(self.output)
+        view_layout.addWidget(self.grid)
+        view_layout.addWidget(self.scrollbar)
+        main_layout.addLayout(view_layout)
+        
+        # Mouse wheel scrolls through history in both renderers
+        self.output.viewport().installEventFilter(self)
+        self.grid.installEventFilter(self)
+        
+        # Last painted screen contents, used to fill a freshly shown renderer
+        self.screen_lines = []
+        self.screen_cursor = None
+        
+        # Scrollback search, hidden until Ctrl+Shift+F
+        self.search_hit = None  # (absolute line, start, end)
+        self.search_query = None
+        # (line, text offset) shown on each row while scrolled back
+        self.row_origins = None
+        self.search_bar = QWidget()
+        search_layout = QHBoxLayout()
+        search_layout.setContentsMargins(8, 4, 8, 4)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search scrollback")
+        self.search_input.returnPressed.connect(lambda: self.search(backwards=True))
+        self.search_regex = QCheckBox("Regex")
+        prev_btn = QPushButton("▲")
+        prev_btn.setToolTip("Previous (older) match")
+        prev_btn.clicked.connect(lambda: self.search(backwards=True))
+        next_btn = QPushButton("▼")
+        next_btn.setToolTip("Next (newer) match")
+        next_btn.clicked.connect(lambda: self.search(backwards=False))
+        close_btn = QPushButton("✕")
+        close_btn.clicked.connect(self.close_search)
+        search_layout.addWidget(QLabel("🔍"))
+        search_layout.addWidget(self.search_input)
+        search_layout.addWidget(self.search_regex)
+        search_layout.addWidget(prev_btn)
+        search_layout.addWidget(next_btn)
+        search_layout.addWidget(close_btn)
+        self.search_bar.setLayout(search_layout)
+        self.search_bar.hide()
+        main_layout.addWidget(self.search_bar)
+        
+        search_shortcut = QShortcut(QKeySequence("Ctrl+Shift+F"), self)
+        search_shortcut.setContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+        search_shortcut.activated.connect(self.open_search)
+        close_shortcut = QShortcut(QKeySequence("Escape"), self.search_bar)
+        close_shortcut.setContext(Qt.ShortcutContext.WidgetWithChildrenShortcut)
+        close_shortcut.activated.connect(self.close_search)
+        
+        self.setLayout(main_layout)
+        self.output.setFocus()
+        
+        # Context menu
+        self.setup_context_menu()
+        
+    def apply_settings(self):
+        """Apply current settings to terminal"""
+        # Set font
+        font = QFont(self.settings['font_family'], self.settings['font_size'])
+        font.setStyleHint(QFont.StyleHint.Monospace)
+        self.output.setFont(font)
+        self.grid.set_font(font)
+        
+        # Set colors
+        bg_color = self.settings['bg_color']
+        text_color = self.settings['text_color']
+        sel_color = self.settings['selection_color']
+        
+        self.output.setStyleSheet(f"""
+            QPlainTextEdit {{
+                background-color: {bg_color};
+                color: {text_color};
+                border: none;
+                padding: 10px;
+                selection-background-color: {sel_color};
+            }}
+        """)
+        
+        # The search bar uses the status bar colors
+        bg_q = QColor(bg_color)
+        status_bg = QColor(
+            max(0, bg_q.red() - 30),
+            max(0, bg_q.green() - 30),
+            max(0, bg_q.blue() - 30)
+        ).name()
+        status_text = QColor(text_color).name()
+        
+        self.search_bar.setStyleSheet(f"""
+            QWidget {{
+                background-color: {status_bg};
+                color: {status_text};
+            }}
+            QLineEdit {{
+                background-color: {bg_color};
+                border: 1px solid {sel_color};
+                border-radius: 3px;
+                padding: 3px;
+            }}
+            QPushButton {{
+                background-color: {sel_color};
+                color: white;
+                border: none;
+                border-radius: 3px;
+                padding: 3px 8px;
+            }}
+        """)
+        
+        self.grid.set_colors(bg_color, text_color, self.settings['cursor_style'])
+        
+        # The HUD's columns line up in the terminal font
+        self.hud.setFont(font)
+        self.hud.setStyleSheet(f"""
+            QLabel {{
+                background-color: rgba(0, 0, 0, 170);
+                color: {text_color};
+                border: 1px solid {sel_color};
+                border-radius: 4px;
+                padding: 6px;
+            }}
+        """)
+        
+        # Formats depend on the theme's default colors
+        self.default_fg = QColor(text_color)
+        self.default_bg = QColor(bg_color)
+        self.formats = {}
+        
+        # Show the selected renderer and bring it up to date
+        view = self.grid if self.settings['renderer'] == 'grid' else self.output
+        if view is not self.view:
+            self.view.hide()
+            self.view = view
+            self.view.show()
+            self.view.setFocus()
+        if self.screen_lines:
+            # Repaint everything in the new theme or renderer
+            self.paint_lines(dict(enumerate(self.screen_lines)),
+                             self.screen_cursor, force=True)
+        
+        # A new font or renderer fits a different number of cells
+        self.resize_timer.start(self.RESIZE_DELAY)
+        
+        # Minimum time between two repaints
+        self.frame_interval = 1.0 / self.settings['max_fps']
+        
+        if hasattr(self, 'scrollback'):
+            self.scrollback.set_limits(self.settings['scrollback_lines'],
+                                       self.settings['scrollback_mb'] * 1024 * 1024)
+            self.scrollback.set_disk(self.settings['scrollback_disk'])
+        if getattr(self, 'host', None) is not None:
+            self.send_host_settings()
+        
+    def send_host_settings(self):
+        """Hand the settings the host applies to its shells to the host"""
+        try:
+            self.host.request(('settings', {key: self.settings[key]
+                                            for key in SessionHost.SETTINGS}))
+        except OSError:
+            pass
+    
+    def setup_context_menu(self):
+        """Setup right-click context menu"""
+        for view in (self.output, self.grid):
+            view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+            view.customContextMenuRequested.connect(self.show_context_menu)
+        
+    def show_context_menu(self, position):
+        """Show context menu"""
+        menu = QMenu(self)
+        
+        # Get current theme colors
+        bg_color = self.settings['bg_color']
+        text_color = self.settings['text_color']
+        sel_color = self.settings['selection_color']
+        
+        # Darken background for menu
+        bg_q = QColor(bg_color)
+        menu_bg = QColor(
+            max(0, bg_q.red() - 20),
+            max(0, bg_q.green() - 20),
+            max(0, bg_q.blue() - 20)
+        ).name()
+        
+        menu.setStyleSheet(f"""
+            QMenu {{
+                background-color: {menu_bg};
+                color: {text_color};
+                border: 1px solid {sel_color};
+            }}
+            QMenu::item:selected {{
+                background-color: {sel_color};
+            }}
+        """)
+        
+        copy_action = QAction("📋 Copy", self)
+        copy_action.triggered.connect(self.copy_selection)
+        menu.addAction(copy_action)
         
-        # Text color
-        text_layout = QHBoxLayout()
-        self.text_color = self.settings.get('text_color', '#e0d0ff')
-        self.text_preview = QLabel()
-        self.text_preview.setFixedSize(50, 30)
-        self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
-        text_btn = QPushButton("Choose Color")
-        text_btn.clicked.connect(lambda: self.choose_color('text'))
-        text_layout.addWidget(self.text_preview)
-        text_layout.addWidget(text_btn)
-        text_layout.addStretch()
-        form.addRow("Text Color:", text_layout)
+        paste_action = QAction("📄 Paste", self)
+        paste_action.triggered.connect(self.paste_clipboard)
+        menu.addAction(paste_action)
         
-        # Selection color
-        sel_layout = QHBoxLayout()
-        self.sel_color = self.settings.get('selection_color', '#6a4c93')
-        self.sel_preview = QLabel()
-        self.sel_preview.setFixedSize(50, 30)
-        self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
-        sel_btn = QPushButton("Choose Color")
-        sel_btn.clicked.connect(lambda: self.choose_color('sel'))
-        sel_layout.addWidget(self.sel_preview)
-        sel_layout.addWidget(sel_btn)
-        sel_layout.addStretch()
-        form.addRow("Selection Color:", sel_layout)
+        if self.input.pasting:
+            cancel_paste_action = QAction("✋ Cancel Paste", self)
+            cancel_paste_action.triggered.connect(self.cancel_paste)
+            menu.addAction(cancel_paste_action)
         
-        # Font family
-        self.font_combo = QFontComboBox()
-        self.font_combo.setFontFilters(QFontComboBox.FontFilter.MonospacedFonts)
-        current_font = self.settings.get('font_family', 'Consolas')
-        self.font_combo.setCurrentFont(QFont(current_font))
-        form.addRow("Font Family:", self.font_combo)
+        menu.addSeparator()
         
-        # Font size
-        self.font_size = QSpinBox()
-        self.font_size.setRange(8, 24)
-        self.font_size.setValue(self.settings.get('font_size', 11))
-        form.addRow("Font Size:", self.font_size)
+        new_tab_action = QAction("➕ New Tab", self)
+        new_tab_action.triggered.connect(self.main_window.new_tab)
+        menu.addAction(new_tab_action)
         
-        # Cursor style
-        self.cursor_style = QComboBox()
-        self.cursor_style.addItems(["Block", "Underline", "Beam"])
-        self.cursor_style.setCurrentText(self.settings.get('cursor_style', 'Block'))
-        form.addRow("Cursor Style:", self.cursor_style)
+        split_right_action = QAction("◫ Split Right", self)
+        split_right_action.triggered.connect(
+            lambda: self.main_window.split(self, Qt.Orientation.Horizontal))
+        menu.addAction(split_right_action)
         
-        # Opacity/Transparency
-        self.opacity = QSpinBox()
-        self.opacity.setRange(10, 100)
-        self.opacity.setValue(self.settings.get('opacity', 100))
-        self.opacity.setSuffix("%")
-        self.opacity.setToolTip("Lower values make the window more transparent")
-        form.addRow("Transparency:", self.opacity)
+        split_down_action = QAction("⊟ Split Down", self)
+        split_down_action.triggered.connect(
+            lambda: self.main_window.split(self, Qt.Orientation.Vertical))
+        menu.addAction(split_down_action)
         
-        layout.addLayout(form)
+        if self.host is not None:
+            detach_action = QAction("⏏ Detach", self)
+            detach_action.triggered.connect(lambda: self.main_window.detach_session(self))
+            menu.addAction(detach_action)
         
-        # Preset themes
-        layout.addWidget(QLabel("\n📦 Preset Themes:"))
+        attach_action = QAction("🔗 Attach Session…", self)
+        attach_action.triggered.connect(self.main_window.attach_session)
+        menu.addAction(attach_action)
         
-        # Create scrollable theme grid
-        themes_widget = QWidget()
-        themes_layout = QVBoxLayout()
+        hud_action = QAction("📈 Performance HUD", self)
+        hud_action.setCheckable(True)
+        hud_action.setChecked(self.hud.isVisible())
+        hud_action.triggered.connect(self.toggle_hud)
+        menu.addAction(hud_action)
         
-        # Row 1
-        row1 = QHBoxLayout()
-        themes = [
-            ('purple', '🌙 Purple Night'),
-            ('ocean', '🌊 Ocean'),
-            ('forest', '🌳 Forest'),
-            ('fire', '🔥 Fire'),
-            ('sunset', '🌅 Sunset')
-        ]
-        for theme_id, theme_name in themes:
-            btn = QPushButton(theme_name)
-            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
-            row1.addWidget(btn)
-        themes_layout.addLayout(row1)
+        metrics_action = QAction("💾 Save Metrics", self)
+        metrics_action.triggered.connect(self.save_metrics)
+        menu.addAction(metrics_action)
         
-        # Row 2
-        row2 = QHBoxLayout()
-        themes = [
-            ('dracula', '🧛 Dracula'),
-            ('monokai', '🎨 Monokai'),
-            ('solarized_dark', '☀️ Solarized Dark'),
-            ('nord', '❄️ Nord'),
-            ('gruvbox', '🍂 Gruvbox')
-        ]
-        for theme_id, theme_name in themes:
-            btn = QPushButton(theme_name)
-            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
-            row2.addWidget(btn)
-        themes_layout.addLayout(row2)
+        record_action = QAction("⏹ Stop Recording" if self.recording else "⏺ Start Recording", self)
+        record_action.triggered.connect(self.toggle_recording)
+        menu.addAction(record_action)
         
-        # Row 3
-        row3 = QHBoxLayout()
-        themes = [
-            ('tokyo_night', '🗼 Tokyo Night'),
-            ('cyberpunk', '🤖 Cyberpunk'),
-            ('matrix', '💚 Matrix'),
-            ('amber', '🟠 Amber'),
-            ('synthwave', '🌆 Synthwave')
-        ]
-        for theme_id, theme_name in themes:
-            btn = QPushButton(theme_name)
-            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
-            row3.addWidget(btn)
-        themes_layout.addLayout(row3)
+        menu.addSeparator()
         
-        # Row 4
-        row4 = QHBoxLayout()
-        themes = [
-            ('cherry_blossom', '🌸 Cherry Blossom'),
-            ('lavender', '💜 Lavender'),
-            ('mint', '🍃 Mint'),
-            ('coffee', '☕ Coffee'),
-            ('midnight', '🌃 Midnight')
-        ]
-        for theme_id, theme_name in themes:
-            btn = QPushButton(theme_name)
-            btn.clicked.connect(lambda checked, t=theme_id: self.apply_preset(t))
-            row4.addWidget(btn)
-        themes_layout.addLayout(row4)
+        settings_action = QAction("⚙️ Settings", self)
+        settings_action.triggered.connect(self.main_window.open_settings)
+        menu.addAction(settings_action)
         
-        themes_widget.setLayout(themes_layout)
-        layout.addWidget(themes_widget)
+        info_action = QAction("ℹ️ Help & Info", self)
+        info_action.triggered.connect(self.main_window.show_info)
+        menu.addAction(info_action)
         
-        # Buttons
-        button_layout = QHBoxLayout()
+        clear_action = QAction("🗑 Clear", self)
+        clear_action.triggered.connect(self.clear_terminal)
+        menu.addAction(clear_action)
         
-        save_btn = QPushButton("💾 Save")
-        save_btn.clicked.connect(self.accept)
-        save_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #6a4c93;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 8px 20px;
-                font-weight: bold;
-            }
-            QPushButton:hover {
-                background-color: #8b5fbf;
-            }
-        """)
+        menu.exec(self.view.mapToGlobal(position))
+    
+    def setup_terminal(self, attach=None, replay=None):
+        """Setup terminal backend, a host session to attach or a recording to replay"""
+        self.scrollback = Scrollback(self.settings['scrollback_lines'],
+                                     self.settings['scrollback_mb'] * 1024 * 1024)
+        self.host = None
+        # Recording in progress, the path and, outside the host, the writer
+        self.recording = None
+        self.recorder = None
+        # A replay keeps the recorded screen size whatever the pane's size
+        self.fixed_size = None
+        rows, columns = self.ROWS, self.COLUMNS
+        replay_error = None
+        if replay is not None:
+            try:
+                header = SessionRecorder.read_header(replay[0])
+                self.fixed_size = rows, columns = header['height'], header['width']
+            except (OSError, ValueError, KeyError) as e:
+                # Open a shell instead and say why
+                replay_error, replay = f"Error: {e}", None
+        # Triggers are compiled where the screen lives, bad ones are reported here
+        skipped = Triggers(self.settings['triggers']).skipped
+        if (self.settings['session_host'] and replay is None) or attach is not None:
+            # The host owns the PTY and the screen, history is mirrored here
+            self.worker = None
+            self.screen = None
+        elif self.settings['parse_worker']:
+            # The screen lives in the worker, history still lives here
+            self.worker = ParserWorker(columns, rows, self.settings['triggers'])
+            self.screen = None
+        else:
+            self.worker = None
+            self.screen = ScrollbackScreen(self.scrollback, columns, rows,
+                                           Triggers.compile(self.settings['triggers']))
+            # ByteStream decodes UTF-8 incrementally, so a multibyte character
+            # split across two reads comes out whole
+            self.stream = TerminalStream(self.screen)
         
-        cancel_btn = QPushButton("❌ Cancel")
-        cancel_btn.clicked.connect(self.reject)
-        cancel_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #555;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 8px 20px;
-            }
-            QPushButton:hover {
-                background-color: #777;
-            }
-        """)
+        # Resize events are debounced so a window drag reflows the screen
+        # and signals the child once, after the drag settles
+        self.resize_timer = QTimer(self)
+        self.resize_timer.setSingleShot(True)
+        self.resize_timer.timeout.connect(self.sync_size)
+        # Set by the GUI, applied on the loop thread after a wakeup
+        self.pending_resize = None
+        # Read but not yet parsed output, loop thread only
+        self.backlog = None
+        # Keys and pastes the PTY has not taken yet
+        self.input = InputQueue()
+        self.bufsize = self.READ_MIN
+        # Command kind -> when it last fired, loop thread only
+        self.control_times = {}
+        
+        shell = os.environ.get("SHELL", "/bin/zsh")
+        self.shell_name = attach[1] if attach else os.path.basename(shell)
+        command = [shell]
+        if replay is not None:
+            path, speed = replay
+            self.shell_name = os.path.basename(path)
+            command = [sys.executable, os.path.abspath(__file__),
+                       '--play', path, '--speed', str(speed)]
+        try:
+            # Set TERM environment variable for proper terminal emulation
+            env = os.environ.copy()
+            env['TERM'] = 'xterm-256color'
+            # hsettings and hinfo are small scripts on the shell's PATH
+            try:
+                env['PATH'] = ScrollbackScreen.helper_dir() + os.pathsep + env.get('PATH', '')
+            except OSError:
+                pass
+            if self.screen is None and self.worker is None:
+                self.host = HostLink()
+                # The host may have started with older settings
+                self.send_host_settings()
+                if attach is not None:
+                    self.host.request(('attach', attach[0], self.ROWS, self.COLUMNS))
+                else:
+                    self.host.request(('new', self.ROWS, self.COLUMNS,
+                                       self.main_window.cwd or os.getcwd(), shell, env))
+                self.ptyproc = None
+            else:
+                self.ptyproc = ptyprocess.PtyProcess.spawn(
+                    command, cwd=self.main_window.cwd, env=env,
+                    dimensions=(rows, columns))
+                # Input is written without blocking, see InputQueue
+                os.set_blocking(self.ptyproc.fd, False)
+            if replay is not None:
+                self.update_status(f"Replaying {replay[0]}")
+            elif replay_error is not None:
+                self.update_status(replay_error)
+            elif skipped:
+                self.update_status("Triggers skipped: " + "; ".join(
+                    f"{pattern!r}: {reason}" for pattern, reason in skipped))
+            else:
+                self.update_status(f"Shell: {shell} | 'hsettings' = settings, 'hinfo' = help")
+        except Exception as e:
+            self.update_status(f"Error: {str(e)}")
+            return
+        
+        # Frame handoff without locks. The reader publishes each Frame by
+        # replacing self.frame and keeps every row changed after the last
+        # frame the GUI reports in shown_seq, so a skipped frame loses
+        # nothing. Each side only writes its own fields: the reader sets
+        # frame and frame_requested, the GUI shown_seq and clears
+        # frame_requested before it picks up the latest frame.
+        self.frame = None
+        self.shown_seq = 0
+        self.unshown_lines = {}  # row -> (seq, runs), reader thread only
+        self.frame_requested = False
+        self.frame_interval = 1.0 / self.settings['max_fps']
+        self.last_frame_time = 0.0
+        self.last_key_time = 0.0
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.render_frame)
+        
+        self.comm = Communicate()
+        self.comm.frame_signal.connect(self.schedule_frame)
+        self.comm.status_signal.connect(self.update_status)
+        self.comm.settings_signal.connect(self.main_window.open_settings)
+        self.comm.info_signal.connect(self.main_window.show_info)
+        self.comm.trigger_signal.connect(self.fire_trigger)
+        self.comm.keyboard_signal.connect(self.answer_keyboard_query)
+        self.comm.closed_signal.connect(lambda: self.main_window.close_session(self))
+        
+        self.loop.add(self)
+    
+    def read_pty(self):
+        """Read the PTY into the backlog, False once the shell is gone"""
+        try:
+            output = os.read(self.ptyproc.fd, self.bufsize)
+        except BlockingIOError:
+            return
+        except OSError:
+            # Linux raises EIO once the child side is gone
+            output = b''
+        if not output:
+            self.comm.status_signal.emit("Terminal closed")
+            return False
+        # Set and cleared by the GUI
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.output(output)
+        self.perf.bytes_read += len(output)
+        
+        # Grow the buffer while reads fill it, shrink it when output calms down
+        if len(output) == self.bufsize and self.bufsize < self.READ_MAX:
+            self.bufsize *= 2
+        elif len(output) < self.bufsize // 4 and self.bufsize > self.READ_MIN:
+            self.bufsize //= 2
+        
+        self.backlog = memoryview(output)
+    
+    @property
+    def parse_ready(self):
+        """Whether there is output to parse and a parser free to take it"""
+        return self.backlog is not None and not (self.worker and self.worker.busy)
+    
+    def parse_slice(self):
+        """Parse the next PtyLoop.SLICE bytes of the backlog"""
+        data = self.backlog[:PtyLoop.SLICE]
+        self.backlog = self.backlog[PtyLoop.SLICE:] or None
+        if self.worker is not None:
+            self.worker.feed(data)
+            return
+        start = time.perf_counter()
+        self.stream.feed(data)
+        changes = self.screen_changes()
+        self.perf.parse_time += time.perf_counter() - start
+        self.publish_frame(*changes)
+        if self.screen.controls:
+            self.run_controls(self.screen.controls)
+            self.screen.controls.clear()
+    
+    def worker_reply(self):
+        """Take the worker's history rows and changed rows"""
+        history, changes, cursor, controls, parse_time = self.worker.receive()
+        self.perf.parse_time += parse_time
+        for runs, wrapped in history:
+            self.scrollback.append(runs, wrapped)
+        self.publish_frame(changes, cursor)
+        self.run_controls(controls)
+        if self.pending_resize is not None:
+            self.handle_wake()
+    
+    def host_reply(self):
+        """Take the host's snapshot or updates, False once the shell is gone"""
+        try:
+            messages = self.host.receive()
+        except (EOFError, OSError):
+            self.comm.status_signal.emit("Session host exited")
+            return False
+        # The host parses, the pane's share is taking in its updates
+        self.perf.bytes_read = self.host.received
+        start = time.perf_counter()
+        for message in messages:
+            kind = message[0]
+            if kind == 'snapshot':
+                _, entries, attr_table, wrapped, changes, cursor = message
+                self.scrollback.load(entries, attr_table, wrapped)
+                self.publish_frame(changes, cursor)
+            elif kind == 'delta':
+                _, history, changes, cursor, controls = message
+                for runs, wrapped in history:
+                    self.scrollback.append(runs, wrapped)
+                self.publish_frame(changes, cursor)
+                self.run_controls(controls)
+            elif kind == 'detached':
+                self.comm.status_signal.emit("Session was attached in another pane")
+                return False
+            else:
+                self.comm.status_signal.emit(
+                    f"Error: {message[1]}" if len(message) > 1 else "Terminal closed")
+                return False
+        self.perf.parse_time += time.perf_counter() - start
+    
+    def run_controls(self, controls):
+        """Act on private OSC commands and trigger matches, each kind once a second"""
+        now = time.monotonic()
+        for command in controls:
+            kind = command[:3] if isinstance(command, tuple) else command
+            if now - self.control_times.get(kind, 0.0) < self.TRIGGER_INTERVAL:
+                continue
+            self.control_times[kind] = now
+            if command == 'settings':
+                self.comm.settings_signal.emit()
+            elif command == 'info':
+                self.comm.info_signal.emit()
+            elif command[0] == 'status':
+                self.comm.status_signal.emit(command[1])
+            elif command[0] == 'trigger':
+                _, action, pattern, text = command
+                self.comm.trigger_signal.emit(action, pattern, text)
+            elif command[0] == 'keyboard':
+                self.comm.keyboard_signal.emit(command[1])
+    
+    def screen_changes(self):
+        """Return the rows pyte touched since the last call and the cursor"""
+        changes = {row: self.render_line(row)
+                   for row in self.screen.dirty if row < self.screen.lines}
+        self.screen.dirty.clear()
+        return changes, self.screen.cursor_state()
+    
+    def handle_wake(self):
+        """Apply a resize the GUI queued for the loop thread"""
+        size = self.pending_resize
+        if size is None or (self.worker and self.worker.busy):
+            # A busy worker gets the resize along with its next reply
+            return
+        self.pending_resize = None
+        rows, columns = size
+        if self.host is not None:
+            self.host.request(('resize', rows, columns))
+            return
+        # Sends SIGWINCH to the foreground process group
+        self.ptyproc.setwinsize(rows, columns)
+        recorder = self.recorder
+        if recorder is not None:
+            recorder.resize(columns, rows)
+        if self.worker is not None:
+            self.worker.resize(rows, columns)
+        else:
+            self.screen.resize(rows, columns)
+            self.publish_frame(*self.screen_changes())
+    
+    def publish_frame(self, changes, cursor):
+        """Publish a snapshot of the lines changed since the GUI's last frame"""
+        seq = self.frame.seq + 1 if self.frame else 1
+        self.perf.published += 1
+        x, y, lines, columns, bracketed_paste, app_cursor, keyboard = cursor
+        
+        # Forget rows the GUI has painted, add the ones just changed
+        unshown = self.unshown_lines
+        shown = self.shown_seq
+        for row in [row for row, (changed, _) in unshown.items()
+                    if changed <= shown or row >= lines]:
+            del unshown[row]
+        for row, runs in changes.items():
+            unshown[row] = (seq, runs)
+        
+        cursor_attr = {
+            'x': x,
+            'y': y,
+            'lines': lines,
+            'columns': columns,
+            'history': self.scrollback.total,
+            'bracketed_paste': bracketed_paste,
+            'app_cursor': app_cursor,
+            'keyboard': keyboard,
+            'attrs': {}
+        }
+        
+        # Publish before looking at the flag, see setup_terminal
+        self.frame = Frame(seq, {row: runs for row, (_, runs) in unshown.items()},
+                           cursor_attr)
+        if not self.frame_requested:
+            self.frame_requested = True
+            self.comm.frame_signal.emit()
+    
+    def render_line(self, row):
+        """Return a single screen row as attribute runs"""
+        return self.screen.line_runs(row)
+    
+    def write_pty(self, text):
+        """Send typed text to the shell"""
+        if self.host is not None:
+            self.host.request(('input', text.encode('utf-8')))
+            return
+        self.input.key(text.encode('utf-8'))
+        self.flush_input()
+    
+    def flush_input(self):
+        """Write what the PTY takes now, leave the rest to the loop thread"""
+        if not hasattr(self, 'comm'):
+            return
+        self.input.write(self.ptyproc.fd)
+        if self.input:
+            # The loop polls the PTY for room once it wakes
+            self.loop.wake()
+    
+    def write_input(self):
+        """Write queued input once the PTY has room, loop thread"""
+        self.input.write(self.ptyproc.fd)
+    
+    def schedule_frame(self):
+        """Paint now or once the current frame interval has passed"""
+        if self.frame_timer.isActive():
+            return
+        
+        now = time.monotonic()
+        # A keystroke echo skips the rate limit so typing stays snappy
+        if now - self.last_key_time < self.INTERACTIVE_WINDOW:
+            self.last_key_time = 0.0
+            self.render_frame()
+            return
+        
+        wait = self.frame_interval - (now - self.last_frame_time)
+        if wait <= 0:
+            self.render_frame()
+        else:
+            self.frame_timer.start(int(wait * 1000) + 1)
+    
+    def render_frame(self):
+        """Paint the latest frame the reader published"""
+        if not self.exposed():
+            # frame_requested stays set, so the reader keeps parsing but
+            # stops signalling until catch_up() paints the latest frame
+            return
+        self.frame_requested = False
+        frame = self.frame
+        if frame is not None and frame.seq != self.shown_seq:
+            start = time.perf_counter()
+            self.paint_lines(frame.lines, frame.cursor)
+            self.shown_seq = frame.seq
+            self.perf.render_time += time.perf_counter() - start
+            self.perf.painted += 1
+        self.last_frame_time = time.monotonic()
+    
+    def exposed(self):
+        """Whether the pane is on the current tab of a shown, uncovered window"""
+        if not self.isVisible():
+            return False
+        window = self.window()
+        handle = window.windowHandle()
+        return not window.isMinimized() and (handle is None or handle.isExposed())
+    
+    def catch_up(self):
+        """Paint what the reader published while the pane was out of sight"""
+        if getattr(self, 'frame_requested', False) and self.exposed():
+            self.schedule_frame()
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        # Switching to the pane's tab
+        self.catch_up()
+    
+    def paint_lines(self, lines, cursor_attr, force=False):
+        """Hand changed lines to the active renderer"""
+        rows = cursor_attr['lines']
+        if len(self.screen_lines) != rows:
+            self.screen_lines = (self.screen_lines + [()] * rows)[:rows]
+        
+        # pyte marks rows dirty even when they end up unchanged
+        if not force:
+            lines = {row: runs for row, runs in lines.items()
+                     if row < rows and self.screen_lines[row] != runs}
+        for row, runs in lines.items():
+            self.screen_lines[row] = runs
+        self.screen_cursor = cursor_attr
+        
+        if self.layout is None or self.layout.columns != cursor_attr['columns']:
+            self.relayout(cursor_attr['columns'])
+        
+        if self.scroll_offset:
+            # Keep the viewport on the same history lines while output scrolls
+            grown = (self.layout.position(cursor_attr['history']) -
+                     self.layout.position(self.history_seen))
+            self.history_seen = cursor_attr['history']
+            self.scroll_offset = min(self.scroll_offset + grown,
+                                     self.layout.rows(self.history_seen))
+            self.update_scrollbar()
+            self.render_viewport()
+            return
+        self.history_seen = cursor_attr['history']
+        self.row_origins = None
+        self.update_scrollbar()
+        self.render_view(lines, cursor_attr)
+    
+    def relayout(self, columns):
+        """Rewrap history for a new screen width, measuring only the rows in view"""
+        old = self.layout
+        self.layout = ScrollbackLayout(self.scrollback, columns, self.history_seen)
+        if old is not None and self.scroll_offset:
+            # Keep the line at the top of the viewport in place
+            line, _ = old.locate(self.scroll_offset, self.history_seen)
+            self.scroll_offset = (self.layout.position(self.history_seen) -
+                                  self.layout.position(line))
+        self.layout_timer.start(0)
+    
+    def measure_layout(self):
+        """Measure another batch of older history while the GUI is idle"""
+        if not self.layout.measure_back():
+            self.layout_timer.stop()
+        self.update_scrollbar()
+    
+    def render_view(self, lines, cursor_attr):
+        """Send rows to the active renderer"""
+        if self.search_hit is not None:
+            line, start, end = self.search_hit
+            if self.row_origins is None:
+                rows = {line - self.history_seen: 0}
+            else:
+                rows = {row: offset for row, (origin, offset)
+                        in enumerate(self.row_origins) if origin == line}
+            lines = dict(lines)
+            for row, offset in rows.items():
+                if row in lines:
+                    lines[row] = ANSIParser.highlight(lines[row], start - offset,
+                                                      end - offset)
+        
+        if self.view is self.grid:
+            self.grid.update_lines(lines, cursor_attr)
+        else:
+            self.update_output(lines, cursor_attr)
+    
+    def render_viewport(self):
+        """Paint history lines above the top of the screen"""
+        if self.screen_cursor is None:
+            return
+        rows = len(self.screen_lines)
+        history = self.layout.view(self.scroll_offset, rows, self.history_seen)
+        lines = [runs for runs, _, _ in history] + self.screen_lines[:rows - len(history)]
+        self.row_origins = ([(line, offset) for _, line, offset in history] +
+                            [(self.history_seen + row, 0)
+                             for row in range(rows - len(history))])
+        
+        # The cursor moves down with the screen, off the bottom if need be
+        cursor_attr = dict(self.screen_cursor)
+        cursor_attr['y'] += len(history)
+        self.render_view(dict(enumerate(lines)), cursor_attr)
+    
+    def scroll_to(self, offset):
+        """Show the screen scrolled back by offset history lines"""
+        history = self.layout.rows(self.history_seen) if self.layout else 0
+        offset = max(0, min(offset, history))
+        if offset == self.scroll_offset:
+            return
+        self.scroll_offset = offset
+        self.update_scrollbar()
+        if offset:
+            self.render_viewport()
+        elif self.screen_cursor is not None:
+            self.row_origins = None
+            self.render_view(dict(enumerate(self.screen_lines)), self.screen_cursor)
+    
+    def refresh_view(self):
+        """Repaint every visible row"""
+        if self.scroll_offset:
+            self.render_viewport()
+        elif self.screen_cursor is not None:
+            self.row_origins = None
+            self.render_view(dict(enumerate(self.screen_lines)), self.screen_cursor)
+    
+    def open_search(self):
+        """Show the search bar"""
+        self.search_bar.show()
+        self.search_input.setFocus()
+        self.search_input.selectAll()
+    
+    def close_search(self):
+        """Hide the search bar and drop the highlight"""
+        self.search_bar.hide()
+        self.search_hit = None
+        self.refresh_view()
+        self.view.setFocus()
+    
+    def search(self, backwards=True):
+        """Jump to the previous or next line matching the search text"""
+        pattern = self.search_input.text()
+        if not pattern:
+            return
+        regex = self.search_regex.isChecked()
+        # A new query starts again from the bottom
+        if (pattern, regex) != self.search_query:
+            self.search_query = (pattern, regex)
+            self.search_hit = None
+        try:
+            matcher = re.compile(pattern if regex else re.escape(pattern), re.IGNORECASE)
+        except re.error as e:
+            self.update_status(f"Invalid regex: {e}")
+            return
         
-        reset_btn = QPushButton("🔄 Reset")
-        reset_btn.clicked.connect(self.reset_defaults)
-        reset_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #d9534f;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 8px 20px;
-            }
-            QPushButton:hover {
-                background-color: #c9302c;
-            }
-        """)
+        scrollback = self.scrollback
+        history_end = self.history_seen
+        rows = len(self.screen_lines)
         
-        button_layout.addWidget(reset_btn)
-        button_layout.addStretch()
-        button_layout.addWidget(cancel_btn)
-        button_layout.addWidget(save_btn)
+        # Visible screen rows continue the absolute numbering of history
+        def text_of(line):
+            if line >= history_end:
+                return ANSIParser.line_text(self.screen_lines[line - history_end])
+            return scrollback.get_text(line)
         
-        layout.addLayout(button_layout)
+        literals = ScrollbackIndex.literals(pattern, regex)
+        if literals:
+            # Lines the reader added after the last frame are not shown yet
+            ranges = [(start, min(end, history_end))
+                      for start, end in scrollback.index.candidates(literals)]
+        else:
+            ranges = [(scrollback.first, history_end)]
+        ranges.append((history_end, history_end + rows))
         
-        self.setLayout(layout)
+        if self.search_hit is not None:
+            origin = self.search_hit[0]
+        else:
+            origin = history_end + rows if backwards else scrollback.first - 1
         
-        # Style the dialog
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #2d1b4e;
-                color: #e0d0ff;
-            }
-            QLabel {
-                color: #e0d0ff;
-            }
-            QPushButton {
-                background-color: #6a4c93;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                padding: 6px 12px;
-            }
-            QPushButton:hover {
-                background-color: #8b5fbf;
-            }
-            QSpinBox, QFontComboBox, QComboBox {
-                background-color: #1a0a2e;
-                color: #e0d0ff;
-                border: 1px solid #6a4c93;
-                border-radius: 3px;
-                padding: 4px;
-            }
-        """)
+        if backwards:
+            lines = (line for start, end in reversed(ranges)
+                     for line in range(min(end, origin) - 1, max(start, scrollback.first) - 1, -1))
+        else:
+            lines = (line for start, end in ranges
+                     for line in range(max(start, origin + 1, scrollback.first), end))
         
-    def choose_color(self, color_type):
-        """Open color picker dialog"""
-        if color_type == 'bg':
-            current = QColor(self.bg_color)
-        elif color_type == 'text':
-            current = QColor(self.text_color)
+        for line in lines:
+            matches = list(matcher.finditer(text_of(line)))
+            matches = [match for match in matches if match.end() > match.start()]
+            if matches:
+                match = matches[-1] if backwards else matches[0]
+                self.show_search_hit(line, match.start(), match.end())
+                return
+        self.update_status(f"No {'earlier' if backwards else 'later'} match for '{pattern}'")
+    
+    def show_search_hit(self, line, start, end):
+        """Scroll a match into view and highlight it"""
+        self.search_hit = (line, start, end)
+        rows = len(self.screen_lines)
+        if line >= self.history_seen:
+            self.scroll_offset = 0
         else:
-            current = QColor(self.sel_color)
+            # Put the row holding the match in the middle of the viewport
+            layout = self.layout
+            wrapped = ANSIParser.wrap_runs(self.scrollback.get(line), layout.columns)
+            skip = sum(1 for _, offset in wrapped[1:] if offset <= start)
+            back = layout.position(self.history_seen) - layout.position(line) - skip
+            self.scroll_offset = max(back, min(back + rows // 2,
+                                               layout.rows(self.history_seen)))
+        self.update_scrollbar()
+        self.refresh_view()
+        self.update_status(f"Match at line {line - self.scrollback.first + 1}")
+    
+    def update_scrollbar(self):
+        """Match the scrollbar to the history size and position"""
+        history = self.layout.rows(self.history_seen) if self.layout else 0
+        self.scrollbar.blockSignals(True)
+        self.scrollbar.setRange(0, history)
+        self.scrollbar.setPageStep(max(1, len(self.screen_lines)))
+        self.scrollbar.setValue(history - self.scroll_offset)
+        self.scrollbar.blockSignals(False)
+    
+    def eventFilter(self, obj, event):
+        """Scroll history with the mouse wheel and track the view size"""
+        if event.type() == QEvent.Type.Resize:
+            self.resize_timer.start(self.RESIZE_DELAY)
+        elif event.type() == QEvent.Type.Wheel:
+            # Three lines per notch
+            steps = event.angleDelta().y() // 40
+            self.scroll_to(self.scroll_offset + steps)
+            return True
+        return super().eventFilter(obj, event)
+    
+    def screen_size(self):
+        """Rows and columns that fit in the active view"""
+        if self.view is self.grid:
+            cell_w, cell_h = self.grid.cell_width, self.grid.cell_height
+            width = self.grid.width() - 2 * self.grid.PADDING
+            height = self.grid.height() - 2 * self.grid.PADDING
+        else:
+            metrics = QFontMetrics(self.output.font())
+            cell_w = max(1, metrics.horizontalAdvance('M'))
+            cell_h = max(1, metrics.lineSpacing())
+            margin = int(self.output.document().documentMargin())
+            viewport = self.output.viewport()
+            # One column spare so a full row never wraps in the document
+            width = viewport.width() - 2 * margin - cell_w
+            height = viewport.height() - 2 * margin
+        return max(2, height // cell_h), max(10, width // cell_w)
+    
+    def sync_size(self):
+        """Tell the reader about a new screen size once resizing settles"""
+        if not hasattr(self, 'ptyproc') or not self.view.isVisible():
+            return
+        size = self.fixed_size or self.screen_size()
+        frame = self.frame
+        if frame is not None and size == (frame.cursor['lines'], frame.cursor['columns']):
+            return
+        self.pending_resize = size
+        self.loop.wake()
+    
+    def update_output(self, lines, cursor_attr):
+        """Replace the changed screen lines in place with their colors"""
+        document = self.output.document()
+        if len(self.formats) >= TerminalGridView.CACHE_LIMIT:
+            # The document keeps every format it was given until it is
+            # cleared, so start both over and repaint what is visible
+            self.formats.clear()
+            document.clear()
+            self.refresh_view()
+            return
+        text_cursor = QTextCursor(document)
+        text_cursor.beginEditBlock()
+        
+        # Make sure there is one block per screen row
+        missing = cursor_attr['lines'] - document.blockCount()
+        if missing > 0:
+            text_cursor.movePosition(QTextCursor.MoveOperation.End)
+            text_cursor.insertText('\n' * missing)
+        elif missing < 0:
+            # The screen shrank, drop the rows below its new bottom
+            last = document.findBlockByNumber(cursor_attr['lines'] - 1)
+            text_cursor.setPosition(last.position() + last.length() - 1)
+            text_cursor.movePosition(QTextCursor.MoveOperation.End,
+                                     QTextCursor.MoveMode.KeepAnchor)
+            text_cursor.removeSelectedText()
+        
+        for row in sorted(lines):
+            block = document.findBlockByNumber(row)
+            if not block.isValid():
+                continue
             
-        color = QColorDialog.getColor(current, self, "Choose Color")
+            # Select the old contents of the row and overwrite them
+            text_cursor.setPosition(block.position())
+            text_cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock,
+                                     QTextCursor.MoveMode.KeepAnchor)
+            text_cursor.removeSelectedText()
+            for text, attrs in lines[row]:
+                text_cursor.insertText(text, self.char_format(attrs))
         
-        if color.isValid():
-            hex_color = color.name()
-            if color_type == 'bg':
-                self.bg_color = hex_color
-                self.bg_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
-            elif color_type == 'text':
-                self.text_color = hex_color
-                self.text_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
-            else:
-                self.sel_color = hex_color
-                self.sel_preview.setStyleSheet(f"background-color: {hex_color}; border: 1px solid #888;")
+        text_cursor.endEditBlock()
+        
+        # Auto-scroll to bottom
+        self.output.verticalScrollBar().setValue(
+            self.output.verticalScrollBar().maximum()
+        )
     
-    def apply_preset(self, theme):
-        """Apply a preset theme"""
-        presets = {
-            'purple': {
-                'bg_color': '#1a0a2e',
-                'text_color': '#e0d0ff',
-                'selection_color': '#6a4c93'
-            },
-            'ocean': {
-                'bg_color': '#001f3f',
-                'text_color': '#7fdbff',
-                'selection_color': '#0074d9'
-            },
-            'forest': {
-                'bg_color': '#0d1f0d',
-                'text_color': '#90ee90',
-                'selection_color': '#2d5a2d'
-            },
-            'fire': {
-                'bg_color': '#1a0a00',
-                'text_color': '#ffcc99',
-                'selection_color': '#cc3300'
-            },
-            'sunset': {
-                'bg_color': '#2d1b2e',
-                'text_color': '#ffb347',
-                'selection_color': '#ff6b9d'
-            },
-            'dracula': {
-                'bg_color': '#282a36',
-                'text_color': '#f8f8f2',
-                'selection_color': '#44475a'
-            },
-            'monokai': {
-                'bg_color': '#272822',
-                'text_color': '#f8f8f2',
-                'selection_color': '#49483e'
-            },
-            'solarized_dark': {
-                'bg_color': '#002b36',
-                'text_color': '#839496',
-                'selection_color': '#073642'
-            },
-            'nord': {
-                'bg_color': '#2e3440',
-                'text_color': '#d8dee9',
-                'selection_color': '#434c5e'
-            },
-            'gruvbox': {
-                'bg_color': '#282828',
-                'text_color': '#ebdbb2',
-                'selection_color': '#504945'
-            },
-            'tokyo_night': {
-                'bg_color': '#1a1b26',
-                'text_color': '#c0caf5',
-                'selection_color': '#414868'
-            },
-            'cyberpunk': {
-                'bg_color': '#0a0e27',
-                'text_color': '#00ff9f',
-                'selection_color': '#ff00ff'
-            },
-            'matrix': {
-                'bg_color': '#000000',
-                'text_color': '#00ff00',
-                'selection_color': '#003300'
-            },
-            'amber': {
-                'bg_color': '#1a1200',
-                'text_color': '#ffb000',
-                'selection_color': '#664400'
-            },
-            'synthwave': {
-                'bg_color': '#2b213a',
-                'text_color': '#ff7edb',
-                'selection_color': '#6d77b3'
-            },
-            'cherry_blossom': {
-                'bg_color': '#2d1a2e',
-                'text_color': '#ffb3d9',
-                'selection_color': '#944d6b'
-            },
-            'lavender': {
-                'bg_color': '#1e1433',
-                'text_color': '#e6d9ff',
-                'selection_color': '#7b68a6'
-            },
-            'mint': {
-                'bg_color': '#0f2922',
-                'text_color': '#98ff98',
-                'selection_color': '#2d5a4a'
-            },
-            'coffee': {
-                'bg_color': '#1a0f0a',
-                'text_color': '#d4a574',
-                'selection_color': '#6b4423'
-            },
-            'midnight': {
-                'bg_color': '#0c0f1a',
-                'text_color': '#a8b5d1',
-                'selection_color': '#1e2742'
-            }
-        }
+    def char_format(self, attrs):
+        """Return the shared QTextCharFormat for a run's attributes"""
+        char_format = self.formats.get(attrs)
+        if char_format is None:
+            fg, bg = ANSIParser.resolve(attrs, self.default_fg, self.default_bg)
+            char_format = QTextCharFormat()
+            char_format.setForeground(fg)
+            if bg is not None:
+                char_format.setBackground(bg)
+            if attrs[2]:
+                char_format.setFontWeight(QFont.Weight.Bold)
+            char_format.setFontItalic(attrs[3])
+            char_format.setFontUnderline(attrs[4])
+            char_format.setFontStrikeOut(attrs[5])
+            self.formats[attrs] = char_format
+        return char_format
+    
+    def update_status(self, message):
+        """Update status bar"""
+        self.main_window.update_status(message)
+    
+    def fire_trigger(self, action, pattern, text):
+        """Ring the bell or send a desktop notification for a matched line"""
+        self.update_status(f"Trigger {pattern!r}: {text[:80]}")
+        if action == 'bell':
+            QApplication.beep()
+        elif action == 'notify':
+            try:
+                subprocess.Popen(['notify-send', '--app-name=Herminal', 'Herminal', text],
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            except OSError:
+                # No notification daemon tools, the status bar has to do
+                pass
+    
+    def answer_keyboard_query(self, flags):
+        """Report the kitty keyboard flags in effect, if the protocol is on"""
+        if self.settings['kitty_keyboard']:
+            self.write_pty(f'\x1b[?{flags}u')
+    
+    def toggle_hud(self):
+        """Show or hide the performance overlay"""
+        if self.hud.isVisible():
+            self.hud_timer.stop()
+            self.hud.hide()
+            return
+        # Rates shown start from now, not from the last time it was open
+        self.perf.restart()
+        self.hud.setText("measuring…")
+        self.place_hud()
+        self.hud.show()
+        self.hud.raise_()
+        self.hud_timer.start(1000)
+    
+    def update_hud(self):
+        """Take a sample of the counters and show it"""
+        backlog = self.backlog
+        queued = len(backlog) if backlog is not None else 0
+        if self.host is not None:
+            queued += len(self.host.inbuf)
+        sample = self.perf.sample(queued, self.scrollback.bytes_used)
+        self.hud.setText(
+            f"read    {sample['read_bytes_per_s'] / 1024:9.1f} KiB/s\n"
+            f"parse   {sample['parse_ms_per_frame']:9.2f} ms/frame\n"
+            f"render  {sample['render_ms_per_frame']:9.2f} ms/frame\n"
+            f"frames  {sample['frames_per_s']:9.1f} /s\n"
+            f"merged  {sample['coalesced_frames']:9d} frames\n"
+            f"queue   {queued / 1024:9.1f} KiB\n"
+            f"memory  {sample['rss_bytes'] / 2**20:9.1f} MiB\n"
+            f"history {sample['scrollback_bytes'] / 2**20:9.1f} MiB")
+        self.place_hud()
+    
+    def place_hud(self):
+        """Keep the overlay in the view's top right corner"""
+        self.hud.adjustSize()
+        view = self.view.geometry()
+        self.hud.move(view.right() - self.hud.width() - 8, view.top() + 8)
+    
+    def resizeEvent(self, event):
+        """Move the overlay along with the view"""
+        super().resizeEvent(event)
+        if self.hud.isVisible():
+            self.place_hud()
+    
+    def save_metrics(self):
+        """Write the HUD's samples to a JSON and a CSV file"""
+        if not self.perf.samples:
+            # Never shown, a single sample covers the whole session
+            self.update_hud()
+        path = os.path.expanduser(time.strftime('~/herminal-metrics-%Y%m%d-%H%M%S'))
+        try:
+            self.perf.save(path)
+        except OSError as e:
+            self.update_status(f"Error: {e}")
+            return
+        self.update_status(f"Metrics saved to {path}.json and {path}.csv")
+    
+    def toggle_recording(self):
+        """Start or stop recording the shell's output to an asciicast file"""
+        if not hasattr(self, 'comm'):
+            return
+        if self.recording is None:
+            path = SessionRecorder.default_path()
+            if self.host is not None:
+                # The host owns the PTY, so it writes the file
+                self.host.request(('record', path))
+            else:
+                frame = self.frame
+                rows, columns = ((frame.cursor['lines'], frame.cursor['columns'])
+                                 if frame else self.fixed_size or (self.ROWS, self.COLUMNS))
+                try:
+                    self.recorder = SessionRecorder(path, columns, rows)
+                except OSError as e:
+                    self.update_status(f"Error: {e}")
+                    return
+            self.recording = path
+            self.update_status(f"Recording to {path}")
+            return
         
-        if theme in presets:
-            preset = presets[theme]
-            self.bg_color = preset['bg_color']
-            self.text_color = preset['text_color']
-            self.sel_color = preset['selection_color']
-            
-            self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
-            self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
-            self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
+        path, self.recording = self.recording, None
+        if self.host is not None:
+            self.host.request(('record', None))
+        else:
+            recorder, self.recorder = self.recorder, None
+            recorder.close()
+            if recorder.error is not None:
+                self.update_status(f"Error: {recorder.error}")
+                return
+        self.update_status(f"Recording saved to {path}")
     
-    def reset_defaults(self):
-        """Reset to default settings"""
-        self.bg_color = '#1a0a2e'
-        self.text_color = '#e0d0ff'
-        self.sel_color = '#6a4c93'
+    def clear_terminal(self):
+        """Clear terminal output"""
+        self.write_pty('clear\n')
+    
+    def copy_selection(self):
+        """Copy selected text to clipboard"""
+        if self.view is self.grid:
+            self.update_status("Selection is only available with the Text Document renderer")
+            return
+        cursor = self.output.textCursor()
+        if cursor.hasSelection():
+            QApplication.clipboard().setText(cursor.selectedText())
+            self.update_status("Copied to clipboard")
+    
+    def paste_clipboard(self):
+        """Paste from clipboard, bracketed if the program asked for it"""
+        text = QApplication.clipboard().text()
+        if not text:
+            return
+        if self.host is not None:
+            # The host knows the program's paste mode
+            self.host.request(('paste', text))
+        else:
+            frame = self.frame
+            self.input.paste(text, bool(frame and frame.cursor['bracketed_paste']))
+            self.flush_input()
+        if len(text) > InputQueue.CHUNK:
+            self.update_status(f"Pasting {len(text) // 1024} KiB, Ctrl+C cancels")
+    
+    def cancel_paste(self):
+        """Drop the rest of a paste still being written"""
+        if self.host is not None:
+            self.host.request(('cancel',))
+        elif self.input.cancel_paste():
+            self.flush_input()
+            self.update_status("Paste cancelled")
+    
+    def shutdown(self, kill=True):
+        """Close the shell and remove its on-disk scrollback, without kill only detach"""
+        if self.host is not None and kill:
+            try:
+                self.host.request(('kill',))
+            except OSError:
+                pass
+        if hasattr(self, 'comm'):
+            self.loop.remove(self)
+        elif self.worker is not None:
+            self.worker.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.resize_timer.stop()
+        self.layout_timer.stop()
+        self.scrollback.close()
+    
+    def keyPressEvent(self, event):
+        """Handle key press events"""
+        self.last_key_time = time.monotonic()
+        key = event.key()
+        mod = event.modifiers()
+        text = event.text()
         
-        self.bg_preview.setStyleSheet(f"background-color: {self.bg_color}; border: 1px solid #888;")
-        self.text_preview.setStyleSheet(f"background-color: {self.text_color}; border: 1px solid #888;")
-        self.sel_preview.setStyleSheet(f"background-color: {self.sel_color}; border: 1px solid #888;")
+        # Shift+PageUp/PageDown page through scrollback
+        if mod & Qt.KeyboardModifier.ShiftModifier and key in (Qt.Key.Key_PageUp, Qt.Key.Key_PageDown):
+            page = max(1, len(self.screen_lines) - 1)
+            if key == Qt.Key.Key_PageUp:
+                self.scroll_to(self.scroll_offset + page)
+            else:
+                self.scroll_to(self.scroll_offset - page)
+            event.accept()
+            return
         
-        self.font_combo.setCurrentFont(QFont('Consolas'))
-        self.font_size.setValue(11)
-        self.cursor_style.setCurrentText('Block')
-        self.opacity.setValue(100)
-    
-    def get_settings(self):
-        """Return current settings"""
-        return {
-            'bg_color': self.bg_color,
-            'text_color': self.text_color,
-            'selection_color': self.sel_color,
-            'font_family': self.font_combo.currentFont().family(),
-            'font_size': self.font_size.value(),
-            'cursor_style': self.cursor_style.currentText(),
-            'opacity': self.opacity.value()
-        }
+        # Typing jumps back to live output
+        if key not in (Qt.Key.Key_Shift, Qt.Key.Key_Control, Qt.Key.Key_Alt, Qt.Key.Key_Meta):
+            self.scroll_to(0)
+        
+        if key == Qt.Key.Key_C and mod & Qt.KeyboardModifier.ControlModifier:
+            # Ctrl+C drops a paste in progress before the interrupt
+            self.cancel_paste()
+        
+        # The program's key modes come with the latest frame
+        frame = self.frame
+        if frame is None:
+            app_cursor, keyboard = False, 0
+        else:
+            app_cursor = frame.cursor['app_cursor']
+            keyboard = frame.cursor['keyboard'] if self.settings['kitty_keyboard'] else 0
+        sequence = KeyEncoder.encode(key, mod, text, app_cursor, keyboard)
+        if sequence:
+            self.write_pty(sequence)
+            event.accept()
+        else:
+            event.ignore()
 
 
-class EnhancedTerminal(QWidget):
-    def __init__(self):
+class HerminalWindow(QWidget):
+    """Top-level window holding sessions in tabs and split panes"""
+    
+    def __init__(self, loop=None, cwd=None, replay=None):
         super().__init__()
         self.setWindowTitle("Herminal")
         self.resize(1000, 700)
         
         # Load settings
         self.settings = self.load_settings()
+        self.loop = loop or PtyLoop()
+        self.cwd = cwd
+        # The (path, speed) of a recording the first tab plays
+        self.replay = replay
+        # Native window whose expose events are watched, see showEvent
+        self.exposure_handle = None
         
         self.setup_ui()
-        self.setup_terminal()
+        self.open_first_tabs()
         self.apply_settings()
-        
-        self.command_history = []
-        self.history_index = -1
-        self.current_line = ""
-        self.command_buffer = ""
-        
-    def load_settings(self):
+    
+    @staticmethod
+    def load_settings():
         """Load settings from file"""
-        settings_file = os.path.expanduser('~/.hudul_terminal_settings.json')
-        if os.path.exists(settings_file):
-            try:
-                with open(settings_file, 'r') as f:
-                    return json.load(f)
-            except:
-                pass
-        
-        return {
+        settings = {
             'bg_color': '#1a0a2e',
             'text_color': '#e0d0ff',
             'selection_color': '#6a4c93',
             'font_family': 'Consolas',
             'font_size': 11,
             'cursor_style': 'Block',
-            'opacity': 100
+            'renderer': 'text',
+            'opacity': 100,
+            'max_fps': 60,
+            'scrollback_lines': 100000,
+            'scrollback_mb': 64,
+            'scrollback_disk': False,
+            'parse_worker': False,
+            'session_host': False,
+            'kitty_keyboard': False,
+            'triggers': []
         }
+        
+        # Saved values win, defaults fill in keys added since they were saved
+        settings_file = os.path.expanduser('~/.hudul_terminal_settings.json')
+        if os.path.exists(settings_file):
+            try:
+                with open(settings_file, 'r') as f:
+                    settings.update(json.load(f))
+            except:
+                pass
+        
+        return settings
     
     def save_settings(self):
         """Save settings to file"""
@@ -568,49 +4743,174 @@ class EnhancedTerminal(QWidget):
             print(f"Error saving settings: {e}")
         
     def setup_ui(self):
-        """Setup the user interface"""
+        """Setup the tabs and the status bar"""
         main_layout = QVBoxLayout()
         main_layout.setContentsMargins(0, 0, 0, 0)
         main_layout.setSpacing(0)
         
-        # Terminal output area
-        self.output = QPlainTextEdit()
-        self.output.setReadOnly(True)
-        
-        main_layout.addWidget(self.output)
+        self.tabs = QTabWidget()
+        self.tabs.setDocumentMode(True)
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.tabCloseRequested.connect(self.close_tab)
+        # The tab bar only shows up once there is a second tab
+        self.tabs.tabBar().setVisible(False)
+        main_layout.addWidget(self.tabs)
         
         # Status bar
         self.status_bar = QLabel("Ready | Type 'hsettings' for settings or 'hinfo' for help")
         main_layout.addWidget(self.status_bar)
-        
         self.setLayout(main_layout)
-        self.output.setFocus()
         
-        # Context menu
-        self.setup_context_menu()
+        for keys, slot in (
+                ("Ctrl+Shift+T", self.new_tab),
+                ("Ctrl+Shift+D", lambda: self.split(self.current_session(), Qt.Orientation.Horizontal)),
+                ("Ctrl+Shift+S", lambda: self.split(self.current_session(), Qt.Orientation.Vertical)),
+                ("Ctrl+Shift+W", lambda: self.close_session(self.current_session())),
+                ("Ctrl+Shift+X", lambda: self.detach_session(self.current_session())),
+                ("Ctrl+Shift+A", self.attach_session),
+                ("Ctrl+Shift+R", lambda: self.record_session(self.current_session())),
+                ("Ctrl+Shift+P", lambda: self.toggle_hud(self.current_session())),
+                ("Ctrl+PgDown", lambda: self.tabs.setCurrentIndex(
+                    (self.tabs.currentIndex() + 1) % self.tabs.count())),
+                ("Ctrl+PgUp", lambda: self.tabs.setCurrentIndex(
+                    (self.tabs.currentIndex() - 1) % self.tabs.count()))):
+            QShortcut(QKeySequence(keys), self).activated.connect(slot)
+    
+    def sessions(self):
+        """Every session in every tab"""
+        return self.tabs.findChildren(EnhancedTerminal)
+    
+    def current_session(self):
+        """The session holding the focus, else the first one of the current tab"""
+        widget = QApplication.focusWidget()
+        while widget is not None and not isinstance(widget, EnhancedTerminal):
+            widget = widget.parentWidget()
+        if widget is not None and widget.window() is self:
+            return widget
+        page = self.tabs.currentWidget()
+        sessions = page.findChildren(EnhancedTerminal) if page else []
+        return sessions[0] if sessions else None
+    
+    def open_first_tabs(self):
+        """Reattach the host's detached shells, or open a new one"""
+        if self.replay is not None:
+            self.new_tab(replay=self.replay)
+            return
+        detached = []
+        if self.settings['session_host']:
+            detached = [(number, name) for number, name, attached
+                        in HostLink.list_sessions() if not attached]
+        for attach in detached:
+            self.new_tab(attach)
+        if not detached:
+            self.new_tab()
+    
+    def new_tab(self, attach=None, replay=None):
+        """Open a session in a new tab, or reattach a host session"""
+        session = EnhancedTerminal(self, attach, replay)
+        splitter = QSplitter(Qt.Orientation.Horizontal)
+        splitter.addWidget(session)
+        index = self.tabs.addTab(splitter, session.shell_name)
+        self.tabs.setCurrentIndex(index)
+        self.tabs.tabBar().setVisible(self.tabs.count() > 1)
+        session.view.setFocus()
+        return session
+    
+    def split(self, session, orientation):
+        """Open a session next to another one"""
+        if session is None:
+            return
+        splitter = session.parentWidget()
+        index = splitter.indexOf(session)
+        new_session = EnhancedTerminal(self)
+        if splitter.orientation() == orientation or splitter.count() == 1:
+            splitter.setOrientation(orientation)
+            splitter.insertWidget(index + 1, new_session)
+        else:
+            # Replace the session by a splitter holding it and the new one
+            sizes = splitter.sizes()
+            inner = QSplitter(orientation)
+            splitter.insertWidget(index, inner)
+            inner.addWidget(session)
+            inner.addWidget(new_session)
+            splitter.setSizes(sizes)
+        # Share the space evenly
+        parent = new_session.parentWidget()
+        parent.setSizes([1] * parent.count())
+        new_session.view.setFocus()
+        return new_session
+    
+    def close_session(self, session, kill=True):
+        """Close a session's pane, its tab once empty, the window once no tabs remain"""
+        if session is None or session.parentWidget() is None:
+            return
+        session.shutdown(kill)
+        splitter = session.parentWidget()
+        session.setParent(None)
+        session.deleteLater()
         
-    def apply_settings(self):
-        """Apply current settings to terminal"""
-        # Set font
-        font = QFont(self.settings['font_family'], self.settings['font_size'])
-        font.setStyleHint(QFont.StyleHint.Monospace)
-        self.output.setFont(font)
+        # Drop splitters the pane leaves empty, up to the tab page
+        while splitter.count() == 0:
+            parent = splitter.parentWidget()
+            if not isinstance(parent, QSplitter):
+                self.tabs.removeTab(self.tabs.indexOf(splitter))
+                splitter.deleteLater()
+                break
+            splitter.setParent(None)
+            splitter.deleteLater()
+            splitter = parent
         
-        # Set colors
+        if self.tabs.count() == 0:
+            self.close()
+            return
+        self.tabs.tabBar().setVisible(self.tabs.count() > 1)
+        current = self.current_session()
+        if current is not None:
+            current.view.setFocus()
+    
+    def detach_session(self, session):
+        """Close a pane but keep its shell running in the session host"""
+        if session is None:
+            return
+        if session.host is None:
+            self.update_status("Only shells in the session host can be detached")
+            return
+        self.close_session(session, kill=False)
+    
+    def attach_session(self):
+        """Pick a detached host session and open it in a new tab"""
+        detached = [(number, name) for number, name, attached
+                    in HostLink.list_sessions() if not attached]
+        if not detached:
+            self.update_status("No detached sessions")
+            return
+        labels = [f"{number}: {name}" for number, name in detached]
+        label, ok = QInputDialog.getItem(self, "Attach Session", "Session:", labels, 0, False)
+        if ok:
+            self.new_tab(detached[labels.index(label)])
+    
+    def toggle_hud(self, session):
+        """Show or hide a session's performance overlay"""
+        if session is not None:
+            session.toggle_hud()
+    
+    def record_session(self, session):
+        """Start or stop recording a session's output"""
+        if session is not None:
+            session.toggle_recording()
+    
+    def close_tab(self, index):
+        """Close every session of a tab"""
+        for session in self.tabs.widget(index).findChildren(EnhancedTerminal):
+            self.close_session(session)
+    
+    def apply_settings(self):
+        """Apply current settings to the window and every session"""
         bg_color = self.settings['bg_color']
         text_color = self.settings['text_color']
         sel_color = self.settings['selection_color']
         
-        self.output.setStyleSheet(f"""
-            QPlainTextEdit {{
-                background-color: {bg_color};
-                color: {text_color};
-                border: none;
-                padding: 10px;
-                selection-background-color: {sel_color};
-            }}
-        """)
-        
         # Calculate contrasting colors for status bar
         # Darken the background color for status bar
         bg_q = QColor(bg_color)
@@ -634,179 +4934,30 @@ class EnhancedTerminal(QWidget):
             }}
         """)
         
-        # Set window opacity
-        self.setWindowOpacity(self.settings['opacity'] / 100.0)
-        
-    def setup_context_menu(self):
-        """Setup right-click context menu"""
-        self.output.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
-        self.output.customContextMenuRequested.connect(self.show_context_menu)
-        
-    def show_context_menu(self, position):
-        """Show context menu"""
-        menu = QMenu(self)
-        
-        # Get current theme colors
-        bg_color = self.settings['bg_color']
-        text_color = self.settings['text_color']
-        sel_color = self.settings['selection_color']
-        
-        # Darken background for menu
-        bg_q = QColor(bg_color)
-        menu_bg = QColor(
-            max(0, bg_q.red() - 20),
-            max(0, bg_q.green() - 20),
-            max(0, bg_q.blue() - 20)
-        ).name()
-        
-        menu.setStyleSheet(f"""
-            QMenu {{
-                background-color: {menu_bg};
-                color: {text_color};
-                border: 1px solid {sel_color};
+        self.tabs.setStyleSheet(f"""
+            QTabWidget::pane {{
+                border: none;
             }}
-            QMenu::item:selected {{
+            QTabBar::tab {{
+                background-color: {status_bg};
+                color: {status_text};
+                padding: 4px 12px;
+                border: none;
+            }}
+            QTabBar::tab:selected {{
+                background-color: {bg_color};
+                border-bottom: 2px solid {sel_color};
+            }}
+            QSplitter::handle {{
                 background-color: {sel_color};
             }}
         """)
         
-        copy_action = QAction("📋 Copy", self)
-        copy_action.triggered.connect(self.copy_selection)
-        menu.addAction(copy_action)
-        
-        paste_action = QAction("📄 Paste", self)
-        paste_action.triggered.connect(self.paste_clipboard)
-        menu.addAction(paste_action)
-        
-        menu.addSeparator()
-        
-        settings_action = QAction("⚙️ Settings", self)
-        settings_action.triggered.connect(self.open_settings)
-        menu.addAction(settings_action)
-        
-        info_action = QAction("ℹ️ Help & Info", self)
-        info_action.triggered.connect(self.show_info)
-        menu.addAction(info_action)
-        
-        clear_action = QAction("🗑 Clear", self)
-        clear_action.triggered.connect(self.clear_terminal)
-        menu.addAction(clear_action)
-        
-        menu.exec(self.output.mapToGlobal(position))
-    
-    def setup_terminal(self):
-        """Setup terminal backend"""
-        self.screen = pyte.Screen(100, 30)
-        self.stream = pyte.Stream(self.screen)
-        
-        shell = os.environ.get("SHELL", "/bin/zsh")
-        try:
-            # Set TERM environment variable for proper terminal emulation
-            env = os.environ.copy()
-            env['TERM'] = 'xterm-256color'
-            self.ptyproc = ptyprocess.PtyProcessUnicode.spawn([shell], env=env)
-            self.update_status(f"Shell: {shell} | 'hsettings' = settings, 'hinfo' = help")
-        except Exception as e:
-            self.update_status(f"Error: {str(e)}")
-            return
-        
-        self.comm = Communicate()
-        self.comm.output_signal.connect(self.update_output)
-        self.comm.status_signal.connect(self.update_status)
-        self.comm.settings_signal.connect(self.open_settings)
-        self.comm.info_signal.connect(self.show_info)
-        
-        self.thread = threading.Thread(target=self.read_pty, daemon=True)
-        self.thread.start()
-        
-    def read_pty(self):
-        """Read from PTY in background thread"""
-        while self.ptyproc.isalive():
-            try:
-                output = self.ptyproc.read(1024)
-                if output:
-                    # Check for hsettings command
-                    if 'hsettings' in output.lower():
-                        self.comm.settings_signal.emit()
-                        # Clear the command from display
-                        self.ptyproc.write('\x15')  # Ctrl+U to clear line
-                        continue
-                    
-                    # Check for hinfo command
-                    if 'hinfo' in output.lower():
-                        self.comm.info_signal.emit()
-                        # Clear the command from display
-                        self.ptyproc.write('\x15')  # Ctrl+U to clear line
-                        continue
-                    
-                    self.stream.feed(output)
-                    display_text = "\n".join(self.screen.display)
-                    
-                    cursor_attr = {
-                        'x': self.screen.cursor.x,
-                        'y': self.screen.cursor.y,
-                        'attrs': {}
-                    }
-                    
-                    self.comm.output_signal.emit(display_text, cursor_attr)
-            except EOFError:
-                self.comm.status_signal.emit("Terminal closed")
-                break
-            except Exception as e:
-                self.comm.status_signal.emit(f"Error: {str(e)}")
-                break
-    
-    def update_output(self, text, cursor_attr):
-        """Update terminal output with ANSI color support"""
-        self.output.clear()
-        
-        text_cursor = self.output.textCursor()
-        text_cursor.movePosition(QTextCursor.MoveOperation.Start)
-        
-        # Default text color from settings
-        default_color = QColor(self.settings['text_color'])
-        
-        # Parse and apply ANSI colors
-        lines = text.split('\n')
-        for i, line in enumerate(lines):
-            if i > 0:
-                text_cursor.insertText('\n')
-            
-            # Check for ANSI escape sequences
-            ansi_pattern = re.compile(r'\x1b\[([0-9;]+)m')
-            last_end = 0
-            current_format = QTextCharFormat()
-            current_format.setForeground(default_color)
-            
-            for match in ansi_pattern.finditer(line):
-                # Insert text before escape sequence
-                if match.start() > last_end:
-                    text_cursor.setCharFormat(current_format)
-                    text_cursor.insertText(line[last_end:match.start()])
-                
-                # Parse color codes
-                codes = match.group(1).split(';')
-                for code in codes:
-                    if code == '0':  # Reset
-                        current_format = QTextCharFormat()
-                        current_format.setForeground(default_color)
-                    elif code == '1':  # Bold
-                        current_format.setFontWeight(QFont.Weight.Bold)
-                    elif code in ['30', '31', '32', '33', '34', '35', '36', '37',
-                                  '90', '91', '92', '93', '94', '95', '96', '97']:
-                        current_format.setForeground(ANSIParser.parse_color(code))
-                
-                last_end = match.end()
-            
-            # Insert remaining text
-            if last_end < len(line):
-                text_cursor.setCharFormat(current_format)
-                text_cursor.insertText(line[last_end:])
+        # Set window opacity
+        self.setWindowOpacity(self.settings['opacity'] / 100.0)
         
-        # Auto-scroll to bottom
-        self.output.verticalScrollBar().setValue(
-            self.output.verticalScrollBar().maximum()
-        )
+        for session in self.sessions():
+            session.apply_settings()
     
     def update_status(self, message):
         """Update status bar"""
@@ -824,6 +4975,7 @@ class EnhancedTerminal(QWidget):
     
     def show_info(self):
         """Show keyboard shortcuts and info"""
+        session = self.current_session()
         info_text = """
 <h2>🚀 Hudul Terminal - Keyboard Shortcuts</h2>
 
@@ -835,11 +4987,12 @@ class EnhancedTerminal(QWidget):
 <li><b>→ (Right Arrow)</b> - Move cursor right</li>
 <li><b>Home</b> - Jump to beginning of line</li>
 <li><b>End</b> - Jump to end of line</li>
+<li><b>F1–F12, Alt+key, Shift/Ctrl+arrows</b> - Sent as xterm sends them</li>
 </ul>
 
 <h3>⌨️ Enhanced Ctrl Key Support:</h3>
 <ul>
-<li><b>Ctrl+C</b> - Interrupt/cancel current command</li>
+<li><b>Ctrl+C</b> - Interrupt/cancel current command, and drop the rest of a paste</li>
 <li><b>Ctrl+D</b> - EOF/logout (exit shell)</li>
 <li><b>Ctrl+Z</b> - Suspend current process</li>
 <li><b>Ctrl+R</b> - Reverse history search</li>
@@ -851,6 +5004,19 @@ class EnhancedTerminal(QWidget):
 <li><b>Ctrl+W</b> - Delete word before cursor</li>
 </ul>
 
+<h3>🗂️ Tabs and Splits:</h3>
+<ul>
+<li><b>Ctrl+Shift+T</b> - New tab</li>
+<li><b>Ctrl+Shift+D</b> - Split side by side</li>
+<li><b>Ctrl+Shift+S</b> - Split top and bottom</li>
+<li><b>Ctrl+Shift+W</b> - Close pane</li>
+<li><b>Ctrl+Shift+X</b> - Detach pane, its shell keeps running in the session host</li>
+<li><b>Ctrl+Shift+A</b> - Attach a detached session</li>
+<li><b>Ctrl+Shift+R</b> - Start / stop recording the pane to an asciicast file</li>
+<li><b>Ctrl+Shift+P</b> - Show / hide the performance HUD</li>
+<li><b>Ctrl+PgUp / Ctrl+PgDn</b> - Previous / next tab</li>
+</ul>
+
 <h3>🛠️ Custom Commands:</h3>
 <ul>
 <li><b>hsettings</b> - Open terminal settings and themes</li>
@@ -885,6 +5051,8 @@ class EnhancedTerminal(QWidget):
         msg.setWindowTitle("ℹ️ Terminal Information")
         msg.setTextFormat(Qt.TextFormat.RichText)
         msg.setText(info_text)
+        msg.addButton(QMessageBox.StandardButton.Ok)
+        hud_button = msg.addButton("📈 Performance HUD", QMessageBox.ButtonRole.ActionRole)
         msg.setStyleSheet(f"""
             QMessageBox {{
                 background-color: {dialog_bg};
@@ -907,177 +5075,135 @@ class EnhancedTerminal(QWidget):
             }}
         """)
         msg.exec()
+        if msg.clickedButton() is hud_button:
+            self.toggle_hud(session)
+            return
         self.update_status("Type 'hsettings' for settings or 'hinfo' for help")
     
-    def clear_terminal(self):
-        """Clear terminal output"""
-        self.ptyproc.write('clear\n')
+    def showEvent(self, event):
+        """Watch the window's exposure once it has a native window"""
+        super().showEvent(event)
+        handle = self.windowHandle()
+        if handle is not None and handle is not self.exposure_handle:
+            # Expose events tell when a covered window is uncovered
+            self.exposure_handle = handle
+            handle.installEventFilter(self)
+        self.catch_up()
     
-    def copy_selection(self):
-        """Copy selected text to clipboard"""
-        cursor = self.output.textCursor()
-        if cursor.hasSelection():
-            QApplication.clipboard().setText(cursor.selectedText())
-            self.update_status("Copied to clipboard")
+    def changeEvent(self, event):
+        """Catch panes up when the window is restored"""
+        super().changeEvent(event)
+        if event.type() == QEvent.Type.WindowStateChange:
+            self.catch_up()
     
-    def paste_clipboard(self):
-        """Paste from clipboard"""
-        text = QApplication.clipboard().text()
-        if text:
-            self.ptyproc.write(text)
+    def eventFilter(self, obj, event):
+        if obj is self.exposure_handle and event.type() == QEvent.Type.Expose:
+            self.catch_up()
+        return super().eventFilter(obj, event)
     
-    def keyPressEvent(self, event):
-        """Handle key press events"""
-        key = event.key()
-        mod = event.modifiers()
-        text = event.text()
-        
-        # Check for hsettings command typing
-        if text and (text.isalnum() or text in ['_', '-']):
-            self.command_buffer += text
-            if 'hsettings' in self.command_buffer:
-                self.open_settings()
-                # Clear the typed command
-                for _ in range(9):  # length of 'hsettings'
-                    self.ptyproc.write('\x7f')
-                self.command_buffer = ""
-                event.accept()
-                return
-            elif 'hinfo' in self.command_buffer:
-                self.show_info()
-                # Clear the typed command
-                for _ in range(5):  # length of 'hinfo'
-                    self.ptyproc.write('\x7f')
-                self.command_buffer = ""
-                event.accept()
-                return
-            # Keep only last 20 chars to avoid memory issues
-            if len(self.command_buffer) > 20:
-                self.command_buffer = self.command_buffer[-20:]
-        
-        # Handle special keys - send proper ANSI escape sequences
-        if key == Qt.Key.Key_Backspace:
-            if self.command_buffer:
-                self.command_buffer = self.command_buffer[:-1]
-            self.ptyproc.write('\x7f')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Return or key == Qt.Key.Key_Enter:
-            self.command_buffer = ""
-            self.ptyproc.write('\r')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Tab:
-            self.ptyproc.write('\t')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Up:
-            # Up arrow - for history
-            self.ptyproc.write('\x1b[A')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Down:
-            # Down arrow - for history
-            self.ptyproc.write('\x1b[B')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Right:
-            # Right arrow - for cursor movement
-            self.ptyproc.write('\x1b[C')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Left:
-            # Left arrow - for cursor movement
-            self.ptyproc.write('\x1b[D')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Home:
-            # Home key - go to beginning of line
-            self.ptyproc.write('\x1b[H')
-            event.accept()
-            
-        elif key == Qt.Key.Key_End:
-            # End key - go to end of line
-            self.ptyproc.write('\x1b[F')
-            event.accept()
-            
-        elif key == Qt.Key.Key_Delete:
-            # Delete key
-            self.ptyproc.write('\x1b[3~')
-            event.accept()
-            
-        elif key == Qt.Key.Key_PageUp:
-            # Page Up
-            self.ptyproc.write('\x1b[5~')
-            event.accept()
-            
-        elif key == Qt.Key.Key_PageDown:
-            # Page Down
-            self.ptyproc.write('\x1b[6~')
-            event.accept()
-            
-        elif mod & Qt.KeyboardModifier.ControlModifier:
-            # Handle Ctrl key combinations
-            if key == Qt.Key.Key_C:
-                # Ctrl+C - interrupt
-                self.ptyproc.write('\x03')
-                event.accept()
-            elif key == Qt.Key.Key_D:
-                # Ctrl+D - EOF
-                self.ptyproc.write('\x04')
-                event.accept()
-            elif key == Qt.Key.Key_Z:
-                # Ctrl+Z - suspend
-                self.ptyproc.write('\x1a')
-                event.accept()
-            elif key == Qt.Key.Key_R:
-                # Ctrl+R - reverse search
-                self.ptyproc.write('\x12')
-                event.accept()
-            elif key == Qt.Key.Key_L:
-                # Ctrl+L - clear screen
-                self.ptyproc.write('\x0c')
-                event.accept()
-            elif key == Qt.Key.Key_A:
-                # Ctrl+A - beginning of line
-                self.ptyproc.write('\x01')
-                event.accept()
-            elif key == Qt.Key.Key_E:
-                # Ctrl+E - end of line
-                self.ptyproc.write('\x05')
-                event.accept()
-            elif key == Qt.Key.Key_K:
-                # Ctrl+K - kill to end of line
-                self.ptyproc.write('\x0b')
-                event.accept()
-            elif key == Qt.Key.Key_U:
-                # Ctrl+U - kill whole line
-                self.ptyproc.write('\x15')
-                event.accept()
-            elif key == Qt.Key.Key_W:
-                # Ctrl+W - kill word
-                self.ptyproc.write('\x17')
-                event.accept()
-            elif Qt.Key.Key_A <= key <= Qt.Key.Key_Z:
-                # Other Ctrl+letter combinations
-                char = chr(key - Qt.Key.Key_A + 1)
-                self.ptyproc.write(char)
-                self.command_buffer = ""
-                event.accept()
-            else:
-                event.ignore()
+    def catch_up(self):
+        """Paint the panes that became visible again"""
+        for session in self.sessions():
+            session.catch_up()
+    
+    def closeEvent(self, event):
+        """Close every session, shells in the session host keep running"""
+        for session in self.sessions():
+            session.shutdown(kill=False)
+        super().closeEvent(event)
+
+
+class HerminalServer(QObject):
+    """Resident process that opens windows for herminal clients"""
+    
+    def __init__(self):
+        super().__init__()
+        self.loop = PtyLoop()
+        self.server = QLocalServer(self)
+        self.server.newConnection.connect(self.accept)
+    
+    def listen(self):
+        """Start listening, False if another server already is"""
+        path = server_path()
+        probe = QLocalSocket()
+        probe.connectToServer(path)
+        if probe.waitForConnected(200):
+            probe.abort()
+            return False
+        # A socket file left behind by a server that died
+        QLocalServer.removeServer(path)
+        self.server.setSocketOptions(QLocalServer.SocketOption.UserAccessOption)
+        return self.server.listen(path)
+    
+    def accept(self):
+        """Read requests from new client connections"""
+        while self.server.hasPendingConnections():
+            connection = self.server.nextPendingConnection()
+            if not same_user(int(connection.socketDescriptor())):
+                connection.abort()
+                connection.deleteLater()
+                continue
+            connection.readyRead.connect(lambda c=connection: self.handle(c))
+            connection.disconnected.connect(connection.deleteLater)
+    
+    def handle(self, connection):
+        """Answer one client request"""
+        if not connection.canReadLine():
+            return
+        command, _, argument = bytes(connection.readLine()).rstrip(b'\n').partition(b' ')
+        if command == b'open':
+            cwd = os.fsdecode(argument)
+            self.open_window(cwd if os.path.isdir(cwd) else None)
+            connection.write(b'ok\n')
         else:
-            # Regular text input
-            if text:
-                self.ptyproc.write(text)
-                event.accept()
-            else:
-                event.ignore()
+            connection.write(b'error unknown command\n')
+        connection.flush()
+        connection.disconnectFromServer()
+    
+    def open_window(self, cwd=None):
+        """Open a window whose first shell starts in cwd"""
+        window = HerminalWindow(self.loop, cwd)
+        window.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
+        window.show()
+        window.raise_()
+        window.activateWindow()
+        return window
+
+
+def option(name, default=None):
+    """The value following a command line option"""
+    if name in sys.argv[:-1]:
+        return sys.argv[sys.argv.index(name) + 1]
+    return default
 
 
 if __name__ == "__main__":
+    if '--play' in sys.argv:
+        # The stand-in shell of a replay pane
+        SessionRecorder.play(option('--play'), float(option('--speed', 1)))
+        sys.exit(0)
+    if '--host' in sys.argv:
+        # Headless, no QApplication
+        host = SessionHost()
+        if not host.listen():
+            print(f"Herminal session host already running on {host_path()}")
+            sys.exit(1)
+        host.run()
+        sys.exit(0)
     app = QApplication(sys.argv)
     app.setStyle('Fusion')
-    window = EnhancedTerminal()
-    window.show()
+    if '--server' in sys.argv:
+        # Stay resident with no windows open
+        app.setQuitOnLastWindowClosed(False)
+        server = HerminalServer()
+        if not server.listen():
+            print(f"Herminal server already running on {server_path()}")
+            sys.exit(1)
+    elif '--replay' in sys.argv:
+        replay = option('--replay')
+        window = HerminalWindow(replay=(os.path.abspath(replay), float(option('--speed', 1))))
+        window.show()
+    else:
+        window = HerminalWindow()
+        window.show()
     sys.exit(app.exec())
\ No newline at end of file
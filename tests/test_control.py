@@ -0,0 +1,33 @@
+"""Regression tests for Herminal's private OSC
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+
+def make_screen():
+    screen = herminal.ScrollbackScreen(herminal.Scrollback(max_lines=100), 40, 5)
+    return screen, herminal.TerminalStream(screen)
+
+
+def test_only_osc_1729_is_a_control():
+    screen, stream = make_screen()
+    stream.feed(b'a\x1b]1729;settings\x07b\x1b]1029;info\x07c\x1b]1;icon\x07')
+    assert screen.controls == ['settings']
+    assert screen.row_text(0).rstrip() == 'abc'
+    assert screen.icon_name == 'icon'
+
+
+def test_control_split_across_reads():
+    data = b'x\x1b]1729;info\x1b\\y'
+    for cut in range(1, len(data)):
+        screen, stream = make_screen()
+        stream.feed(data[:cut])
+        stream.feed(data[cut:])
+        assert screen.controls == ['info']
+        assert screen.row_text(0).rstrip() == 'xy'
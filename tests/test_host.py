@@ -0,0 +1,88 @@
+"""Regression tests for the headless session host
+
+Usage: python -m pytest tests
+"""
+import os
+import select
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+
+def connect(host):
+    ours, theirs = socket.socketpair()
+    theirs.setblocking(False)
+    client = herminal.SessionHost.Client(theirs)
+    host.clients.add(client)
+    host.selector.register(theirs, client.events,
+                           lambda events: host.serve_client(client, events))
+    return ours, client
+
+
+def ready(host, count):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        events = host.selector.select(0.1)
+        if len(events) >= count:
+            return events
+    raise AssertionError("selector never reported both sockets")
+
+
+def test_kill_while_the_pty_is_readable():
+    host = herminal.SessionHost()
+    ours, client = connect(host)
+    try:
+        host.handle(client, ('new', 5, 40, os.getcwd(), '/bin/sh', dict(os.environ)))
+        session = client.session
+        session.ptyproc.write(b'echo hi\n')
+        assert select.select([session.ptyproc.fd], [], [], 5)[0]
+        host.watch(session)
+        ours.sendall(host.pack(('kill',)))
+        # The client's kill runs first, then the stale PTY key
+        events = sorted(ready(host, 2), key=lambda item: item[0].fileobj is not client.sock)
+        for key, mask in events:
+            key.data(mask)
+        assert host.sessions == {}
+        assert client in host.clients
+    finally:
+        ours.close()
+        host.selector.close()
+
+
+def test_bad_message_drops_only_its_client():
+    host = herminal.SessionHost()
+    ours, client = connect(host)
+    other, bystander = connect(host)
+    try:
+        ours.sendall(host.pack(('attach',)))
+        for key, mask in ready(host, 1):
+            key.data(mask)
+        assert host.clients == {bystander}
+    finally:
+        ours.close()
+        other.close()
+        host.selector.close()
+
+
+def test_settings_reach_running_shells(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    host = herminal.SessionHost()
+    ours, client = connect(host)
+    try:
+        host.handle(client, ('new', 5, 40, os.getcwd(), '/bin/sh', dict(os.environ)))
+        session = client.session
+        host.handle(client, ('settings', {'scrollback_lines': 500, 'scrollback_mb': 1,
+                                          'scrollback_disk': True,
+                                          'triggers': [{'pattern': 'ERROR'}]}))
+        assert session.history.max_lines == 500
+        assert session.history.spill is not None
+        assert session.screen.triggers is not None
+        assert host.settings['scrollback_lines'] == 500
+        host.end_session(session)
+    finally:
+        ours.close()
+        host.selector.close()
@@ -0,0 +1,38 @@
+"""Regression tests for the kitty keyboard flag stack
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+
+def make_screen():
+    scrollback = herminal.Scrollback(max_lines=100)
+    screen = herminal.ScrollbackScreen(scrollback, 40, 5)
+    return screen, herminal.TerminalStream(screen)
+
+
+def test_pop_past_the_bottom_empties_the_stack():
+    screen, stream = make_screen()
+    stream.feed(b'\x1b[>1u\x1b[>9u\x1b[<5u')
+    assert (screen.keyboard_flags, screen.keyboard_stack) == (0, [])
+    stream.feed(b'\x1b[>1u\x1b[<u')
+    assert (screen.keyboard_flags, screen.keyboard_stack) == (0, [])
+
+
+def test_pop_restores_the_flags_below():
+    screen, stream = make_screen()
+    stream.feed(b'\x1b[>1u\x1b[>8u\x1b[>9u\x1b[<2u')
+    assert (screen.keyboard_flags, screen.keyboard_stack) == (1, [0])
+
+
+def test_sequence_split_across_reads():
+    screen, stream = make_screen()
+    stream.feed(memoryview(b'ab\x1b[>'))
+    stream.feed(memoryview(b'1u'))
+    assert screen.keyboard_flags == 1
+    assert screen.row_text(0).rstrip() == 'ab'
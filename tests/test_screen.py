@@ -0,0 +1,48 @@
+"""Regression tests for the screen models
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import pyte
+
+import herminal
+
+
+def fill(screen, lines):
+    """Print numbered lines until the cursor sits on the bottom row"""
+    stream = pyte.ByteStream(screen)
+    stream.feed(b''.join(b'%d\r\n' % i for i in range(lines)))
+    stream.feed(b'prompt')
+    return stream
+
+
+def test_compact_shrink_keeps_dirty_rows_on_screen():
+    screen = herminal.CompactScreen(40, 30)
+    fill(screen, 50)
+    screen.dirty.clear()
+    screen.resize(10, 40)
+    assert screen.dirty and max(screen.dirty) < screen.lines
+    assert [screen.line_runs(row) for row in screen.dirty]
+
+
+def test_scrollback_shrink_keeps_dirty_rows_on_screen():
+    scrollback = herminal.Scrollback(max_lines=1000)
+    screen = herminal.ScrollbackScreen(scrollback, 40, 30)
+    stream = fill(screen, 50)
+    screen.dirty.clear()
+    screen.resize(10, 40)
+    assert max(screen.dirty) < screen.lines == len(screen.rows)
+    # The cursor row stays in view with the prompt on it
+    assert screen.row_text(screen.cursor.y).startswith('prompt')
+    stream.feed(b'\r\nmore')
+    assert [screen.line_runs(row) for row in screen.dirty]
+
+
+def test_line_runs_of_row_cut_off_by_resize():
+    screen = herminal.CompactScreen(40, 30)
+    screen.resize(10, 40)
+    assert screen.line_runs(20) == ()
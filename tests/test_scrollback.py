@@ -0,0 +1,66 @@
+"""Regression tests for the scrollback and its search index
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+DEFAULT = herminal.Scrollback.DEFAULT_ATTRS
+
+
+def test_disk_scrollback_spills_index_blocks(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    scrollback = herminal.Scrollback(max_lines=2000)
+    scrollback.set_disk(True)
+    try:
+        for i in range(20000):
+            scrollback.append(((f'line {i}' + (' needle' if i == 123 else ''), DEFAULT),))
+        index = scrollback.index
+        # Only blocks of lines still in memory keep their bloom in RAM
+        assert all(start + index.BLOCK_LINES > scrollback.start for start, _ in index.blocks)
+        ranges = index.candidates(['needle'])
+        assert any(start <= 123 < end for start, end in ranges)
+        assert scrollback.get_text(123).endswith('needle')
+    finally:
+        scrollback.close()
+
+
+def test_toggling_disk_while_appending(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+    scrollback = herminal.Scrollback(max_lines=50)
+    errors = []
+    
+    def append():
+        try:
+            for i in range(200000):
+                scrollback.append(((f'line {i}', DEFAULT),))
+        except Exception as e:
+            errors.append(e)
+    
+    thread = threading.Thread(target=append)
+    thread.start()
+    try:
+        while thread.is_alive():
+            scrollback.set_disk(True)
+            scrollback.get_text(scrollback.first)
+            scrollback.set_disk(False)
+    finally:
+        thread.join()
+        scrollback.close()
+    assert errors == []
+
+
+def test_escaped_bracket_in_a_class_is_no_literal():
+    pattern = r'[a\]bcdef]'
+    scrollback = herminal.Scrollback(max_lines=10000)
+    for i in range(5000):
+        scrollback.append(((f'line {i}' + (' ]' if i == 123 else ''), DEFAULT),))
+    literals = herminal.ScrollbackIndex.literals(pattern, True)
+    ranges = scrollback.index.candidates(literals)
+    assert any(start <= 123 < end for start, end in ranges)
+    assert herminal.ScrollbackIndex.literals(r'wxyz[a\]bcdef]uvwx', True) == ['wxyz', 'uvwx']
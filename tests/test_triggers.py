@@ -0,0 +1,41 @@
+"""Regression tests for output triggers
+
+Usage: python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import herminal
+
+
+def spans(triggers, text):
+    return [(pattern, start, end) for _, pattern, _, start, end in triggers.scan(text)]
+
+
+def test_shared_group_name_falls_back_to_a_regex_each():
+    triggers = herminal.Triggers([{'pattern': '(?P<x>a)b'}, {'pattern': '(?P<x>c)d'}])
+    assert not triggers.skipped
+    assert spans(triggers, 'ab cd') == [('(?P<x>a)b', 0, 2), ('(?P<x>c)d', 3, 5)]
+
+
+def test_numbered_backreference_keeps_its_group():
+    triggers = herminal.Triggers([{'pattern': 'ERR'}, {'pattern': r'(a)\1'}])
+    assert spans(triggers, 'ab aa ERR') == [(r'(a)\1', 3, 5), ('ERR', 6, 9)]
+
+
+def test_leading_flags_apply_to_their_pattern_only():
+    triggers = herminal.Triggers([{'pattern': '(?i)password:'}, {'pattern': 'ERR'}])
+    assert spans(triggers, 'PassWord: err ERR') == [('(?i)password:', 0, 9), ('ERR', 14, 17)]
+
+
+def test_bad_triggers_are_reported():
+    triggers = herminal.Triggers([{'pattern': '[bad'}, {'pattern': 'x', 'action': 'boom'}])
+    assert [pattern for pattern, _ in triggers.skipped] == ['[bad', 'x']
+    assert herminal.Triggers.compile([{'pattern': '[bad'}]) is None
+
+
+def test_escaped_bracket_in_a_class_still_fires():
+    triggers = herminal.Triggers([{'pattern': r'[a\]bcdef]'}, {'pattern': 'ERROR'}])
+    assert spans(triggers, 'x ]') == [(r'[a\]bcdef]', 2, 3)]